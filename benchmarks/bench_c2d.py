@@ -0,0 +1,93 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import json
+import threading
+import time
+
+from avnet.iotconnect.sdk.lite import Callbacks, ClientSettings, C2dCommand, ClientPool
+from avnet.iotconnect.sdk.sdklib.mqtt import decode_c2d_message
+
+from common import BenchmarkEnvironment
+
+
+def _command_payload(i: int) -> bytes:
+    return json.dumps({"v": "2.1", "ct": 0, "cmd": "set-user-led 255 0 %d" % (i % 256), "ack": "ack-%d" % i}).encode()
+
+
+def run(env: BenchmarkEnvironment, quick: bool) -> dict:
+    count = 2000 if quick else 20000
+    payloads = [_command_payload(i) for i in range(count)]
+    results = {}
+
+    start = time.perf_counter()
+    for p in payloads:
+        decode_c2d_message(p)
+    results["decode_msgs_per_sec"] = count / (time.perf_counter() - start)
+
+    for name, settings in (
+            ("network_thread", ClientSettings(verbose=False)),
+            ("dispatcher", ClientSettings(verbose=False, c2d_dispatch_workers=2, c2d_max_queue_depth=count)),
+    ):
+        received = 0
+        done = threading.Event()
+
+        def on_command(msg: C2dCommand):
+            nonlocal received
+            received += 1
+            if received == count:
+                done.set()
+
+        client = env.create_client("bench-c2d-" + name, callbacks=Callbacks(command_cb=on_command), settings=settings)
+        try:
+            # in-process dispatch, without the network
+            start = time.perf_counter()
+            for p in payloads:
+                client._process_c2d_message(client.mqtt_config.topics.c2d, p)
+            done.wait(60)
+            results["dispatch_%s_msgs_per_sec" % name] = count / (time.perf_counter() - start)
+
+            # end to end, through the broker
+            received = 0
+            done.clear()
+            start = time.perf_counter()
+            for p in payloads:
+                env.broker.send(client.mqtt_config.topics.c2d, p)
+            done.wait(60)
+            results["end_to_end_%s_msgs_per_sec" % name] = received / (time.perf_counter() - start)
+        finally:
+            client.disconnect()
+
+    results.update(_run_burst(env, payloads[:50]))
+    return results
+
+
+def _run_burst(env: BenchmarkEnvironment, payloads: list[bytes]) -> dict:
+    """
+    Sends several messages in a single TLS write and reports how many were delivered.
+    All of them must be, without waiting for more data from the broker (a regression check for the pooled clients).
+    """
+    results = {}
+    pool = ClientPool()
+    try:
+        for name, client_pool in (("network_thread", None), ("pool", pool)):
+            received = 0
+            done = threading.Event()
+
+            def on_command(msg: C2dCommand):
+                nonlocal received
+                received += 1
+                if received == len(payloads):
+                    done.set()
+
+            client = env.create_client("bench-c2d-burst-" + name, callbacks=Callbacks(command_cb=on_command), pool=client_pool)
+            try:
+                env.broker.send_burst(client.mqtt_config.topics.c2d, payloads)
+                done.wait(2)  # well below the keepalive interval, whose PINGRESP would otherwise wake up the reader
+                results["burst_%s_delivered_pct" % name] = 100.0 * received / len(payloads)
+            finally:
+                client.disconnect()
+    finally:
+        pool.close()
+    return results
@@ -0,0 +1,59 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import socket
+import time
+
+from avnet.iotconnect.sdk.lite.tls import TlsSessionCache
+
+from common import BenchmarkEnvironment, percentiles
+
+
+def _handshake_times(env: BenchmarkEnvironment, count: int, resume: bool) -> list[float]:
+    paths = (env.device_cert_path, env.device_pkey_path, env.server_cert_path)
+    cache = TlsSessionCache(*paths)
+    times = []
+    for _ in range(count):
+        if not resume:
+            cache = TlsSessionCache(*paths)
+        sock = cache.wrap_socket(socket.create_connection(("127.0.0.1", env.broker.port)), server_hostname="localhost")
+        # the TLS 1.3 session tickets arrive after the handshake, along with the CONNACK in a real connection
+        sock.sendall(b"\xc0\x00")  # PINGREQ
+        sock.recv(2)
+        cache.save_session(sock)
+        times.append(cache.last_handshake_secs)
+        sock.close()
+    return times[1:] if resume else times  # the first one is always a full handshake
+
+
+def run(env: BenchmarkEnvironment, quick: bool) -> dict:
+    count = 10 if quick else 50
+    connect_times = []
+    reconnect_times = []
+    client = env.create_client("bench-connect", connect=False)
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            client.connect()
+            connect_times.append(time.perf_counter() - start)
+            client.disconnect()
+            while client.mqtt.socket() is not None:
+                time.sleep(0.001)
+
+        client.connect()
+        for _ in range(count):
+            env.broker.drop_all()
+            while client.is_connected():
+                time.sleep(0.001)
+            start = time.perf_counter()
+            client.connect()
+            reconnect_times.append(time.perf_counter() - start)
+    finally:
+        client.disconnect()
+    return {
+        "tls_full_handshake_ms": {k: v * 1000 for k, v in percentiles(_handshake_times(env, count, False)).items()},
+        "tls_resumed_handshake_ms": {k: v * 1000 for k, v in percentiles(_handshake_times(env, count, True)).items()},
+        "connect_ms": {k: v * 1000 for k, v in percentiles(connect_times).items()},
+        "reconnect_after_drop_ms": {k: v * 1000 for k, v in percentiles(reconnect_times).items()},
+    }
@@ -0,0 +1,67 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import time
+import timeit
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+
+from avnet.iotconnect.sdk.lite import TelemetrySchema, Client
+from avnet.iotconnect.sdk.lite.columns import encode_telemetry_columns
+from avnet.iotconnect.sdk.sdklib.mqtt import encode_telemetry_records, TelemetryRecord
+
+from common import BenchmarkEnvironment
+
+
+@dataclass
+class AccelerometerData:
+    x: float
+    y: float
+    z: float
+
+
+@dataclass
+class SensorData:
+    """ Same shape as ExampleSensorData in examples/basic-example.py """
+    temperature: float
+    humidity: float
+    accel: AccelerometerData
+
+
+def _microseconds_per_call(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def run(env: BenchmarkEnvironment, quick: bool) -> dict:
+    number = 2000 if quick else 20000
+    data = SensorData(temperature=22.8, humidity=30.43, accel=AccelerometerData(x=0.565, y=0.334, z=0))
+    data_dict = asdict(data)
+    wide = {"attribute_%d" % i: float(i) * 1.5 for i in range(100)}
+    timestamp = Client.timestamp_now()
+    batch = [TelemetryRecord(data_dict, timestamp=timestamp) for _ in range(10)]
+    schema = TelemetrySchema.from_dataclass(SensorData)
+
+    # a block of 1000 timestamped vibration samples, as records and as columns
+    block_size = 1000
+    t0 = time.time_ns()
+    timestamps_ns = [t0 + i * 1000000 for i in range(block_size)]
+    columns = {"x": [i * 0.001 for i in range(block_size)], "y": [i * 0.002 for i in range(block_size)], "z": [i * 0.003 for i in range(block_size)]}
+
+    def encode_block_as_records():
+        return encode_telemetry_records([
+            TelemetryRecord({"x": columns["x"][i], "y": columns["y"][i], "z": columns["z"][i]}, timestamp=datetime.fromtimestamp(timestamps_ns[i] / 1e9, timezone.utc))
+            for i in range(block_size)
+        ])
+
+    return {
+        "generic_small_us": _microseconds_per_call(lambda: encode_telemetry_records([TelemetryRecord({"temperature": 22.8})]), number),
+        "generic_nested_us": _microseconds_per_call(lambda: encode_telemetry_records([TelemetryRecord(asdict(data))]), number),
+        "generic_nested_timestamped_us": _microseconds_per_call(lambda: encode_telemetry_records([TelemetryRecord(asdict(data), timestamp=timestamp)]), number),
+        "generic_100_attributes_us": _microseconds_per_call(lambda: encode_telemetry_records([TelemetryRecord(wide)]), number // 10),
+        "generic_10_record_batch_us": _microseconds_per_call(lambda: encode_telemetry_records(batch), number // 10),
+        "schema_nested_us": _microseconds_per_call(lambda: schema.encode_packet(data), number),
+        "schema_nested_timestamped_us": _microseconds_per_call(lambda: schema.encode_packet(data, timestamp), number),
+        "generic_1000_row_block_us": _microseconds_per_call(encode_block_as_records, max(1, number // 1000)),
+        "columns_1000_row_block_us": _microseconds_per_call(lambda: encode_telemetry_columns(timestamps_ns, columns), max(1, number // 1000)),
+    }
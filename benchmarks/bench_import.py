@@ -0,0 +1,47 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import json
+import statistics
+import subprocess
+import sys
+
+from common import BenchmarkEnvironment
+
+# Each statement is timed in a fresh interpreter, so that nothing is cached in sys.modules.
+# The heavy modules show which dependencies each statement pulls in.
+STATEMENTS = {
+    "package": "import avnet.iotconnect.sdk.lite",
+    "schema": "from avnet.iotconnect.sdk.lite import TelemetrySchema",
+    "client": "from avnet.iotconnect.sdk.lite import Client, ClientSettings, DeviceConfig",
+    "async_client": "from avnet.iotconnect.sdk.lite import AsyncClient",
+}
+
+HEAVY_MODULES = ("paho.mqtt.client", "ssl", "asyncio", "urllib.request", "sqlite3", "numpy")
+
+_SCRIPT = """
+import time
+start = time.perf_counter()
+%s
+elapsed = time.perf_counter() - start
+import json, sys
+print(json.dumps({"secs": elapsed, "modules": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def _measure(statement: str) -> dict:
+    output = subprocess.run((sys.executable, "-c", _SCRIPT % (statement, HEAVY_MODULES)), check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def run(env: BenchmarkEnvironment, quick: bool) -> dict:
+    iterations = 5 if quick else 20
+    results = {}
+    for name, statement in STATEMENTS.items():
+        samples = [_measure(statement) for _ in range(iterations)]
+        results[name] = {
+            "median_ms": statistics.median(s["secs"] for s in samples) * 1000,
+            "heavy_modules": samples[0]["modules"],
+        }
+    return results
@@ -0,0 +1,53 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import gc
+import tracemalloc
+from datetime import datetime, timezone
+
+from avnet.iotconnect.sdk.lite import ClientPool, CompactRecord, timestamp_ms_now
+from avnet.iotconnect.sdk.sdklib.mqtt import TelemetryRecord
+
+from common import BenchmarkEnvironment
+
+
+def _bytes_per_client(env: BenchmarkEnvironment, count: int, prefix: str, pool=None) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    clients = [env.create_client("%s-%d" % (prefix, i), pool=pool) for i in range(count)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    for c in clients:
+        c.disconnect()
+    return (after - before) / count
+
+
+def _bytes_per_record(count: int, factory) -> float:
+    # distinct values, like buffered sensor readings, so that they are not shared between the records
+    values = [float(i) for i in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [factory(values[i]) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return (after - before) / count
+
+
+def run(env: BenchmarkEnvironment, quick: bool) -> dict:
+    count = 10 if quick else 50
+    record_count = 10000 if quick else 100000
+    pool = ClientPool(num_threads=2)
+    try:
+        return {
+            "connected_client_bytes": _bytes_per_client(env, count, "bench-memory"),
+            "connected_pooled_client_bytes": _bytes_per_client(env, count, "bench-memory-pooled", pool),
+            "telemetry_record_bytes": _bytes_per_record(record_count, lambda v: TelemetryRecord({"temperature": v, "humidity": 30.4}, timestamp=datetime.now(timezone.utc))),
+            "compact_record_bytes": _bytes_per_record(record_count, lambda v: CompactRecord({"temperature": v, "humidity": 30.4}, timestamp_ms_now())),
+        }
+    finally:
+        pool.close()
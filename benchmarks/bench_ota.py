@@ -0,0 +1,136 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from avnet.iotconnect.sdk.lite import OtaDownloader, OtaDownloadError
+from avnet.iotconnect.sdk.sdklib.mqtt import C2dOta, decode_c2d_message
+
+from common import BenchmarkEnvironment
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """ Serves LocalFileServer.files with ETag, Range and If-Range support, like a CDN would """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server: LocalFileServer = self.server
+        entry = server.files.get(self.path.lstrip("/"))
+        if entry is None:
+            self.send_error(404)
+            return
+        data, etag = entry
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        start = 0
+        if range_header is not None and (if_range is None or if_range == etag):
+            start = int(range_header.split("=")[1].split("-")[0])
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */%d" % len(data))
+                self.end_headers()
+                server.requests.append((range_header, if_range, 416))
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, len(data) - 1, len(data)))
+            status = 206
+        else:
+            self.send_response(200)
+            status = 200
+        server.requests.append((range_header, if_range, status))
+        self.send_header("Content-Length", str(len(data) - start))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        body = memoryview(data)[start:]
+        if server.drop_after is not None:
+            # simulate a dropped connection: send only part of the announced body
+            body = body[:server.drop_after]
+            server.drop_after = None
+            self.close_connection = True
+        self.wfile.write(body)
+        server.bytes_served += len(body)
+
+
+class LocalFileServer(ThreadingHTTPServer):
+    """ An in-process HTTP server standing in for the OTA file storage """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _FileHandler)
+        self.files: dict[str, tuple[bytes, str]] = {}
+        self.requests: list[tuple] = []  # (Range, If-Range, status) of each request
+        self.drop_after = None  # drop the connection of the next request after this many body bytes
+        self.bytes_served = 0
+        threading.Thread(target=self.serve_forever, name="ota-file-server", daemon=True).start()
+
+    def url(self, file_name: str) -> str:
+        return "http://127.0.0.1:%d/%s" % (self.server_port, file_name)
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def _ota_message(server: LocalFileServer, file_name: str) -> C2dOta:
+    payload = {"v": "2.1", "ct": 1, "cmd": "ota", "ack": "bench-ota", "sw": "1.0", "hw": "1", "urls": [{"url": server.url(file_name), "fileName": file_name}]}
+    return decode_c2d_message(json.dumps(payload)).ota
+
+
+def _interrupted_download(server: LocalFileServer, download_dir: str, msg: C2dOta, drop_after: int) -> None:
+    server.drop_after = drop_after
+    try:
+        OtaDownloader(download_dir=download_dir, max_retries=0).download(msg)
+    except OtaDownloadError:
+        return
+    raise RuntimeError("The download was expected to fail")
+
+
+def run(env: BenchmarkEnvironment, quick: bool) -> dict:
+    size = (8 if quick else 64) * 1024 * 1024
+    data = os.urandom(size)
+    digest = hashlib.sha256(data).hexdigest()
+    results = {}
+    server = LocalFileServer()
+    download_dir = tempfile.mkdtemp(prefix="iotc-bench-ota-")
+    part_path = os.path.join(download_dir, "fw.bin.part")
+    try:
+        server.files["fw.bin"] = (data, '"v1"')
+        msg = _ota_message(server, "fw.bin")
+
+        start = time.perf_counter()
+        f = OtaDownloader(download_dir=download_dir).download(msg, expected_digests={"fw.bin": digest})[0]
+        results["download_mb_per_sec"] = size / (1024 * 1024) / (time.perf_counter() - start)
+        os.remove(f.path)
+
+        # a download dropped partway through is resumed by a new downloader (as after an application restart)
+        drop_after = size * 2 // 5
+        _interrupted_download(server, download_dir, msg, drop_after)
+        reused_part = os.path.getsize(part_path) == drop_after and os.path.exists(part_path + ".validator")
+        server.bytes_served = 0
+        f = OtaDownloader(download_dir=download_dir).download(msg, expected_digests={"fw.bin": digest})[0]
+        results["resume_ok"] = reused_part and server.requests[-1] == ("bytes=%d-" % drop_after, '"v1"', 206) and f.digest == digest
+        results["resume_refetched_bytes"] = server.bytes_served
+        os.remove(f.path)
+
+        # if the file changes on the server in the meantime, the download starts over
+        _interrupted_download(server, download_dir, msg, drop_after)
+        new_data = os.urandom(size // 2)
+        server.files["fw.bin"] = (new_data, '"v2"')
+        server.bytes_served = 0
+        f = OtaDownloader(download_dir=download_dir).download(msg)[0]
+        results["changed_file_restart_ok"] = server.requests[-1] == ("bytes=%d-" % drop_after, '"v1"', 200) and f.digest == hashlib.sha256(new_data).hexdigest()
+        results["changed_file_refetched_bytes"] = server.bytes_served
+        results["leftover_files"] = sorted(n for n in os.listdir(download_dir) if n != "fw.bin")
+    finally:
+        server.close()
+        shutil.rmtree(download_dir, ignore_errors=True)
+    return results
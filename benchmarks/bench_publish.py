@@ -0,0 +1,61 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import time
+
+from avnet.iotconnect.sdk.lite import BackpressurePolicy, ClientSettings
+from avnet.iotconnect.sdk.sdklib.mqtt import encode_telemetry_records, TelemetryRecord
+
+from common import BenchmarkEnvironment, percentiles
+
+VALUES = {"temperature": 22.8, "humidity": 30.43, "status": "ok"}
+
+
+def run(env: BenchmarkEnvironment, quick: bool) -> dict:
+    count = 2000 if quick else 20000
+    latency_count = 200 if quick else 2000
+    # QoS 1 throughput is measured with the sender waiting for the in-flight window, rather than dropping messages
+    client = env.create_client("bench-publish", settings=ClientSettings(verbose=False, backpressure_policy=BackpressurePolicy.BLOCK))
+    try:
+        results = {}
+
+        # QoS 0 is measured on the raw MQTT connection as the transport baseline
+        packet = encode_telemetry_records([TelemetryRecord(VALUES)])
+        start_count = env.broker.published_count
+        start = time.perf_counter()
+        for _ in range(count):
+            client.mqtt.publish(client.mqtt_config.topics.rpt, packet, qos=0)
+        env.broker.wait_for_published(start_count + count)
+        elapsed = time.perf_counter() - start
+        results["qos0_raw_msgs_per_sec"] = count / elapsed
+
+        start_count = env.broker.published_count
+        start = time.perf_counter()
+        for _ in range(count):
+            client.send_telemetry(VALUES, qos=0)
+        env.broker.wait_for_published(start_count + count)
+        elapsed = time.perf_counter() - start
+        results["qos0_msgs_per_sec"] = count / elapsed
+
+        start_count = env.broker.published_count
+        start = time.perf_counter()
+        for _ in range(count):
+            client.send_telemetry(VALUES)
+        env.broker.wait_for_published(start_count + count)
+        while client.publish_tracker.inflight_count() > 0:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        results["qos1_msgs_per_sec"] = count / elapsed
+
+        # Latency is measured with one message in flight at a time
+        latencies = []
+        for _ in range(latency_count):
+            info = client.send_telemetry_records([TelemetryRecord(VALUES)], completion_cb=lambda c: latencies.append(c.latency_secs))
+            info.wait_for_publish(10)
+        while len(latencies) < latency_count:
+            time.sleep(0.001)
+        results["qos1_puback_latency_ms"] = {k: v * 1000 for k, v in percentiles(latencies).items()}
+        return results
+    finally:
+        client.disconnect()
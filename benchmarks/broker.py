@@ -0,0 +1,211 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+# A minimal in-process MQTT 3.1.1 broker over TLS that stands in for AWS IoT Core or Azure IoT Hub.
+# It supports just enough of the protocol for the SDK: CONNECT, PUBLISH (QoS 0 and 1), SUBSCRIBE, PINGREQ and DISCONNECT.
+# It does not route messages between clients. Use send() to deliver C2D messages to subscribed clients.
+
+import socket
+import ssl
+import struct
+import threading
+import time
+
+
+def _encode_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = n % 128
+        n //= 128
+        if n:
+            b |= 0x80
+        out.append(b)
+        if not n:
+            return bytes(out)
+
+
+class LocalBroker:
+    """
+    :param certfile: Server certificate. The clients must trust it (pass it as server_ca_cert_path).
+    :param keyfile: Server private key.
+    :param keep_payloads: Record received messages in the published list. Only counts are kept otherwise.
+    """
+
+    def __init__(self, certfile: str, keyfile: str, keep_payloads: bool = False):
+        self._context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self._context.load_cert_chain(certfile, keyfile)
+        self._socket = socket.socket()
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.listen(1024)
+        self.port = self._socket.getsockname()[1]
+        self.keep_payloads = keep_payloads
+        self.published = []
+        self.published_count = 0
+        self.connect_count = 0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._subscriptions: dict[str, list[ssl.SSLSocket]] = {}
+        self._connections: list[ssl.SSLSocket] = []
+        self._write_locks: dict[ssl.SSLSocket, threading.Lock] = {}  # SSL sockets cannot be written from multiple threads
+        self._closed = False
+        threading.Thread(target=self._accept, name="broker-accept", daemon=True).start()
+
+    def send(self, topic: str, payload: bytes) -> int:
+        """ Sends a QoS 0 message to all subscribers of the topic. Returns the number of subscribers. """
+        t = topic.encode()
+        body = struct.pack("!H", len(t)) + t + payload
+        packet = bytes([0x30]) + _encode_length(len(body)) + body
+        with self._lock:
+            subscribers = list(self._subscriptions.get(topic, []))
+        for s in subscribers:
+            self._write(s, packet)
+        return len(subscribers)
+
+    def send_burst(self, topic: str, payloads: list[bytes]) -> int:
+        """
+        Like send(), but writes all messages with a single write, so that they arrive in the same TLS records.
+        Clients must keep reading the data that the TLS layer has already decrypted to receive all of them.
+        """
+        t = topic.encode()
+        packets = bytearray()
+        for payload in payloads:
+            body = struct.pack("!H", len(t)) + t + payload
+            packets += bytes([0x30]) + _encode_length(len(body)) + body
+        with self._lock:
+            subscribers = list(self._subscriptions.get(topic, []))
+        for s in subscribers:
+            self._write(s, bytes(packets))
+        return len(subscribers)
+
+    def wait_for_published(self, count: int, timeout: float = 30) -> bool:
+        """ Waits until the total number of received messages reaches count """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.published_count < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def wait_for_subscription(self, topic: str, timeout: float = 10) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._subscriptions.get(topic, [])) == 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def drop_all(self) -> None:
+        """ Abruptly closes all client connections, as if the network was lost """
+        with self._lock:
+            connections = list(self._connections)
+        for s in connections:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _write(self, s: ssl.SSLSocket, data: bytes):
+        lock = self._write_locks.get(s)
+        if lock is None:
+            return
+        try:
+            with lock:
+                s.sendall(data)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        self._closed = True
+        self._socket.close()
+        self.drop_all()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                s, _ = self._socket.accept()
+            except OSError:
+                return
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(s,), name="broker-connection", daemon=True).start()
+
+    @classmethod
+    def _recv_exact(cls, s: ssl.SSLSocket, n: int) -> bytes:
+        buf = b""
+        while len(buf) < n:
+            chunk = s.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("Connection closed")
+            buf += chunk
+        return buf
+
+    def _serve(self, raw: socket.socket):
+        try:
+            s = self._context.wrap_socket(raw, server_side=True)
+        except (OSError, ssl.SSLError):
+            return
+        with self._lock:
+            self._connections.append(s)
+            self._write_locks[s] = threading.Lock()
+        try:
+            while True:
+                header = self._recv_exact(s, 1)[0]
+                multiplier, length = 1, 0
+                while True:
+                    b = self._recv_exact(s, 1)[0]
+                    length += (b & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not b & 0x80:
+                        break
+                body = self._recv_exact(s, length) if length else b""
+                packet_type = header >> 4
+                if packet_type == 1:  # CONNECT
+                    with self._lock:
+                        self.connect_count += 1
+                    self._write(s, b"\x20\x02\x00\x00")
+                elif packet_type == 3:  # PUBLISH
+                    qos = (header >> 1) & 3
+                    topic_length = struct.unpack("!H", body[0:2])[0]
+                    idx = 2 + topic_length
+                    mid = None
+                    if qos:
+                        mid = body[idx:idx + 2]
+                        idx += 2
+                    with self._cond:
+                        self.published_count += 1
+                        if self.keep_payloads:
+                            self.published.append((body[2:2 + topic_length].decode(), body[idx:], qos))
+                        self._cond.notify_all()
+                    if qos == 1:
+                        self._write(s, b"\x40\x02" + mid)
+                elif packet_type == 8:  # SUBSCRIBE
+                    mid = body[0:2]
+                    topic_length = struct.unpack("!H", body[2:4])[0]
+                    topic = body[4:4 + topic_length].decode()
+                    with self._cond:
+                        self._subscriptions.setdefault(topic, []).append(s)
+                        self._cond.notify_all()
+                    self._write(s, b"\x90\x03" + mid + b"\x01")
+                elif packet_type == 12:  # PINGREQ
+                    self._write(s, b"\xd0\x00")
+                elif packet_type == 14:  # DISCONNECT
+                    return
+        except (ConnectionError, OSError, ssl.SSLError):
+            return
+        finally:
+            with self._lock:
+                for subscribers in self._subscriptions.values():
+                    if s in subscribers:
+                        subscribers.remove(s)
+                if s in self._connections:
+                    self._connections.remove(s)
+                self._write_locks.pop(s, None)
+            try:
+                s.close()
+            except OSError:
+                pass
@@ -0,0 +1,119 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import os
+import subprocess
+import tempfile
+from typing import Optional
+
+import avnet.iotconnect.sdk.lite.client as client_module
+from avnet.iotconnect.sdk.lite import Client, ClientSettings, DeviceConfig, Callbacks, ClientPool
+from avnet.iotconnect.sdk.sdklib.dra import DeviceIdentityData
+from avnet.iotconnect.sdk.sdklib.protocol.identity import ProtocolIdentityPJson, ProtocolMetaJson, ProtocolTopicsJson
+
+from broker import LocalBroker
+
+
+def percentiles(values: list[float], points=(50, 90, 99)) -> dict[str, float]:
+    """ Nearest-rank percentiles, for example {"p50": ..., "p90": ..., "p99": ...} """
+    if len(values) == 0:
+        return {}
+    ordered = sorted(values)
+    ret = {}
+    for p in points:
+        rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+        ret["p%d" % p] = ordered[rank]
+    return ret
+
+
+class _StubDeviceRestApi:
+    """ Replaces the /IOTCONNECT discovery and identity REST API calls with a local identity pointing to the LocalBroker """
+
+    def __init__(self, properties, verbose: bool = False):
+        self.properties = properties
+
+    def get_identity_data(self) -> DeviceIdentityData:
+        return BenchmarkEnvironment.identity_for(self.properties.duid)
+
+
+class BenchmarkEnvironment:
+    """
+    Sets up a LocalBroker with freshly generated TLS credentials and stubs the REST API calls,
+    so that Clients can be benchmarked without network access or an /IOTCONNECT account.
+    Requires the openssl command line tool.
+    """
+
+    def __init__(self):
+        self._dir = tempfile.TemporaryDirectory(prefix="iotc-bench-")
+        self.server_cert_path = os.path.join(self._dir.name, "server-cert.pem")
+        self.server_pkey_path = os.path.join(self._dir.name, "server-pkey.pem")
+        self.device_cert_path = os.path.join(self._dir.name, "device-cert.pem")
+        self.device_pkey_path = os.path.join(self._dir.name, "device-pkey.pem")
+        self._generate_credentials(self.server_cert_path, self.server_pkey_path, "localhost", with_san=True)
+        self._generate_credentials(self.device_cert_path, self.device_pkey_path, "benchmark-device")
+        self.broker = LocalBroker(self.server_cert_path, self.server_pkey_path)
+        self._original_dra = client_module.DeviceRestApi
+        client_module.DeviceRestApi = _StubDeviceRestApi
+
+    @classmethod
+    def identity_for(cls, duid: str) -> DeviceIdentityData:
+        return DeviceIdentityData(
+            ProtocolIdentityPJson(
+                h="localhost",
+                id="bench-" + duid,
+                un="bench/" + duid,
+                topics=ProtocolTopicsJson(rpt="rpt/" + duid, ack="ack/" + duid, c2d="c2d/" + duid)
+            ),
+            ProtocolMetaJson(pf=1, v=2.1)  # pf=1 is AWS
+        )
+
+    def device_config(self, duid: str) -> DeviceConfig:
+        return DeviceConfig(
+            platform="aws",
+            env="bench",
+            cpid="BENCH",
+            duid=duid,
+            device_cert_path=self.device_cert_path,
+            device_pkey_path=self.device_pkey_path,
+            server_ca_cert_path=self.server_cert_path
+        )
+
+    def create_client(
+            self,
+            duid: str,
+            callbacks: Optional[Callbacks] = None,
+            settings: Optional[ClientSettings] = None,
+            pool: Optional[ClientPool] = None,
+            connect: bool = True
+    ) -> Client:
+        client = Client(
+            config=self.device_config(duid),
+            callbacks=callbacks,
+            settings=settings or ClientSettings(verbose=False, connect_backoff_max_secs=2),
+            pool=pool
+        )
+        client.mqtt_port = self.broker.port
+        if connect:
+            client.connect()
+            if not client.is_connected():
+                raise RuntimeError("Unable to connect to the local broker")
+            self.broker.wait_for_subscription(client.mqtt_config.topics.c2d)
+        return client
+
+    def close(self) -> None:
+        client_module.DeviceRestApi = self._original_dra
+        self.broker.close()
+        self._dir.cleanup()
+
+    @classmethod
+    def _generate_credentials(cls, cert_path: str, pkey_path: str, cn: str, with_san: bool = False):
+        # same key type as scripts/quickstart.sh
+        subprocess.run(
+            ("openssl", "ecparam", "-name", "prime256v1", "-genkey", "-noout", "-out", pkey_path),
+            check=True, capture_output=True
+        )
+        args = ["openssl", "req", "-new", "-days", "1", "-nodes", "-x509", "-subj", "/CN=" + cn, "-key", pkey_path, "-out", cert_path]
+        if with_san:
+            args.extend(("-addext", "subjectAltName=DNS:" + cn))
+        subprocess.run(args, check=True, capture_output=True)
@@ -0,0 +1,73 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+# Runs the benchmarks against a local broker and writes the results as JSON.
+# See README.md in this directory for details.
+
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+from avnet.iotconnect.sdk.lite import __version__ as SDK_VERSION
+from avnet.iotconnect.sdk.sdklib import __version__ as LIB_VERSION
+
+import bench_c2d
+import bench_connect
+import bench_encode
+import bench_import
+import bench_memory
+import bench_ota
+import bench_publish
+from common import BenchmarkEnvironment
+
+BENCHMARKS = {
+    "encode": bench_encode,
+    "publish": bench_publish,
+    "c2d": bench_c2d,
+    "connect": bench_connect,
+    "memory": bench_memory,
+    "ota": bench_ota,
+    "import": bench_import,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the /IOTCONNECT Lite SDK benchmarks against a local broker")
+    parser.add_argument("--output", default="benchmark-results.json", help="Path of the JSON results file")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS.keys()), help="Run only these benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Run fewer iterations, for a quick sanity check")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "sdk_version": SDK_VERSION,
+            "lib_version": LIB_VERSION,
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "quick": args.quick,
+            "time": datetime.now(timezone.utc).isoformat(),
+        },
+        "results": {}
+    }
+    env = BenchmarkEnvironment()
+    try:
+        for name in args.only or BENCHMARKS.keys():
+            print("Running %s..." % name)
+            start = time.perf_counter()
+            results["results"][name] = BENCHMARKS[name].run(env, args.quick)
+            print("%s done in %.1fs: %s" % (name, time.perf_counter() - start, json.dumps(results["results"][name])))
+    finally:
+        env.close()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results written to %s" % args.output)
+
+
+if __name__ == "__main__":
+    main()
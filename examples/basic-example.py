@@ -7,7 +7,7 @@ import sys
 import time
 from dataclasses import dataclass, asdict
 
-from avnet.iotconnect.sdk.lite import Client, DeviceConfig, C2dCommand, TelemetryRecord, Callbacks, DeviceConfigError
+from avnet.iotconnect.sdk.lite import Client, DeviceConfig, C2dCommand, TelemetryRecord, Callbacks, DeviceConfigError, TelemetrySchema
 from avnet.iotconnect.sdk.lite import __version__ as SDK_VERSION
 from avnet.iotconnect.sdk.sdklib.mqtt import C2dOta, C2dAck
 
@@ -36,6 +36,10 @@ class ExampleSensorData:
     accel: ExampleAccelerometerData
 
 
+# If the same structure is sent repeatedly, a schema compiled once can encode it much faster than a dictionary
+sensor_data_schema = TelemetrySchema.from_dataclass(ExampleSensorData)
+
+
 def on_command(msg: C2dCommand):
     print("Received command", msg.command_name, msg.command_args, msg.ack_id)
     if msg.command_name == "set-user-led":
@@ -89,11 +93,12 @@ def send_telemetry():
     )
     c.send_telemetry(asdict(data))
 
-    # We can update the data by assigning new values to the object before sending it again
+    # We can update the data by assigning new values to the object before sending it again.
+    # This time we send it with the compiled schema, which skips the conversion to a dictionary.
     data.temperature = 23.1
     data.accel.x = 0.573
     data.accel.z = 0.002
-    c.send_telemetry(asdict(data))
+    c.send_telemetry_schema(sensor_data_schema, data)
 
     # Example of sending multiple telemetry records by accumulating data.
     # A use case could be one where we save device power by staying disconnected but periodically waking up to record data,
@@ -6,12 +6,9 @@ import os
 import random
 import subprocess
 import sys
-import threading
 import time
-import urllib.request
-from typing import Optional
-
-from avnet.iotconnect.sdk.lite import Client, DeviceConfig, Callbacks, DeviceConfigError
+from avnet.iotconnect.sdk.lite import Client, DeviceConfig, Callbacks, ClientSettings, DeviceConfigError
+from avnet.iotconnect.sdk.lite import OtaDownloader, OtaDownloadError, C2dDeduplicator
 from avnet.iotconnect.sdk.lite import __version__ as SDK_VERSION
 from avnet.iotconnect.sdk.sdklib.mqtt import C2dOta, C2dAck
 
@@ -27,8 +24,6 @@ that
  
 """
 
-dl_thread: Optional[threading.Thread] = None
-
 # can only exit from main thread, so use this flag or synchronize threads
 need_restart = False
 
@@ -49,32 +44,30 @@ def subprocess_run_with_print(args):
 
 
 def download(msg: C2dOta):
-    global dl_thread
     error_msg = None
-    c.send_ota_ack(msg, C2dAck.OTA_DOWNLOADING)
-    for url in msg.urls:
-        print("Downloading OTA file %s from %s" % (url.file_name, url.url))
-        try:
-            urllib.request.urlretrieve(url.url, url.file_name)
-        except Exception as e:
-            print("Encountered download error", e)
-            error_msg = "Download error for %s" % url.file_name
-            break
+    # The downloader reports the progress with OTA_DOWNLOADING ACKs and any download failure with OTA_DOWNLOAD_FAILED.
+    # Interrupted downloads are resumed, also across application restarts.
+    try:
+        files = OtaDownloader(c).download(msg)
+    except OtaDownloadError as e:
+        print("Encountered download error", e)
+        return
+    for f in files:
         try:
-            if url.file_name.endswith(".whl"):
+            if f.file_name.endswith(".whl"):
                 # Force install could help with testing and allowing package downgrades
-                subprocess_run_with_print(("python3", "-m", "pip", "install", "--force-reinstall", url.file_name))
-            elif url.file_name.endswith(".zip"):
-                subprocess_run_with_print(("unzip", "-oqq", url.file_name))
-            elif url.file_name.endswith(".tgz") or url.file_name.endswith(".tar.gz"):
-                subprocess_run_with_print(("tar", "-zxf", url.file_name))
+                subprocess_run_with_print(("python3", "-m", "pip", "install", "--force-reinstall", f.path))
+            elif f.file_name.endswith(".zip"):
+                subprocess_run_with_print(("unzip", "-oqq", f.path))
+            elif f.file_name.endswith(".tgz") or f.file_name.endswith(".tar.gz"):
+                subprocess_run_with_print(("tar", "-zxf", f.path))
             else:
-                print("ERROR: Unhandled file format for file %s" % url.file_name)
-                error_msg = "Processing error for %s" % url.file_name
+                print("ERROR: Unhandled file format for file %s" % f.file_name)
+                error_msg = "Processing error for %s" % f.file_name
                 break
         except subprocess.CalledProcessError:
-            print("ERROR: Failed to install %s" % url.file_name)
-            error_msg = "Install error for %s" % url.file_name
+            print("ERROR: Failed to install %s" % f.file_name)
+            error_msg = "Install error for %s" % f.file_name
             break
     if error_msg is not None:
         c.send_ota_ack(msg, C2dAck.OTA_FAILED, error_msg)
@@ -84,19 +77,18 @@ def download(msg: C2dOta):
         print("OTA successful. Will restart the application at next main loop iteration...")
         c.send_ota_ack(msg, C2dAck.OTA_DOWNLOAD_DONE)
         need_restart = True
-    dl_thread = None
 
 
 def on_ota(msg: C2dOta):
-    global dl_thread
-    if dl_thread is not None:
-        print("Received OTA while download is still in progress")
+    if need_restart:
+        print("Received OTA while the previous update is pending a restart")
         return
 
-    # We just print the URL. The actual handling of the OTA request would be project specific.
+    # This callback runs on a C2D dispatcher worker thread (see ClientSettings below),
+    # so we can download right here without blocking the MQTT connection.
+    # Any OTA received while this one is still downloading will be processed once this callback returns.
     print("Starting OTA downloads for version %s" % msg.version)
-    dl_thread = threading.Thread(target=download, args=[msg])
-    dl_thread.start()
+    download(msg)
 
 
 try:
@@ -110,6 +102,13 @@ try:
         config=device_config,
         callbacks=Callbacks(
             ota_cb=on_ota,
+        ),
+        settings=ClientSettings(
+            c2d_dispatch_workers=1,
+            # The OTA_DOWNLOAD_DONE ACK is sent right before restarting, so store it until it is delivered
+            ack_outbox_path="iotc-acks.db",
+            # Do not run the same OTA twice if the broker redelivers it, also after the restart
+            c2d_deduplicator=C2dDeduplicator(path="iotc-c2d-seen.json")
         )
     )
     while True:
@@ -0,0 +1,78 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import random
+import sys
+import time
+
+from avnet.iotconnect.sdk.lite import Client, DeviceConfig, ClientSettings, DeviceConfigError
+from avnet.iotconnect.sdk.lite import TelemetryGateway, TelemetryProducer
+
+"""
+In this demo, multiple processes send telemetry for the same device over a single MQTT connection.
+
+Run the gateway, which owns the Client:
+    python3 telemetry-gateway.py gateway
+Then run any number of producers, for example sensor daemons, in other terminals:
+    python3 telemetry-gateway.py producer temperature
+    python3 telemetry-gateway.py producer humidity
+
+The producers send their records to the gateway over a Unix domain socket,
+and the gateway merges the records of all producers into batched telemetry packets.
+"""
+
+SOCKET_PATH = "/tmp/iotc-telemetry.sock"
+
+
+def run_gateway():
+    try:
+        device_config = DeviceConfig.from_iotc_device_config_json_file(
+            device_config_json_path="iotcDeviceConfig.json",
+            device_cert_path="device-cert.pem",
+            device_pkey_path="device-pkey.pem"
+        )
+        c = Client(
+            config=device_config,
+            settings=ClientSettings(
+                telemetry_batching=True,
+                batch_max_latency_secs=5
+            )
+        )
+    except DeviceConfigError as dce:
+        print(dce)
+        sys.exit(1)
+
+    gateway = TelemetryGateway(c, SOCKET_PATH)
+    gateway.start()
+    try:
+        while True:
+            if not c.is_connected():
+                print('(re)connecting...')
+                c.connect()
+            time.sleep(10)
+    finally:
+        gateway.close()
+        c.disconnect()
+
+
+def run_producer(attribute: str):
+    producer = TelemetryProducer(SOCKET_PATH)
+    while True:
+        if not producer.send_telemetry({attribute: random.randint(0, 100)}):
+            print("The gateway is not running. Retrying later...")
+        time.sleep(1)
+
+
+try:
+    if len(sys.argv) == 2 and sys.argv[1] == "gateway":
+        run_gateway()
+    elif len(sys.argv) == 3 and sys.argv[1] == "producer":
+        run_producer(sys.argv[2])
+    else:
+        print("Usage: %s gateway | producer <attribute name>" % sys.argv[0])
+        sys.exit(2)
+
+except KeyboardInterrupt:
+    print("Exiting.")
+    sys.exit(0)
@@ -1,10 +1,82 @@
 __version__ = '1.1.0'
 
-# redirect these imports so that the user code is not affected by any changes in file organization
-from .client import Client, ClientSettings, Callbacks
-from .config import DeviceConfig
-from .client import Client, ClientSettings, Callbacks
-
-# redirect these imports so that the user code is not affected by any changes in file organization
-from avnet.iotconnect.sdk.sdklib.mqtt import C2dCommand, C2dOta, C2dAck, C2dMessage, TelemetryRecord
-from avnet.iotconnect.sdk.sdklib.error import DeviceConfigError
+from typing import TYPE_CHECKING
+
+# redirect these imports so that the user code is not affected by any changes in file organization.
+# The modules are imported when the names are first accessed (PEP 562), so that importing the package is cheap
+# and, for example, the paho MQTT client is not imported by applications that use only TelemetrySchema,
+# and asyncio is not imported by applications that use only the Client.
+_LAZY_IMPORTS = {
+    "Client": ".client",
+    "ClientSettings": ".client",
+    "Callbacks": ".client",
+    "DeviceConfig": ".config",
+    "AsyncClient": ".async_client",
+    "ClientPool": ".pool",
+    "BackpressurePolicy": ".flow",
+    "PublishCompletion": ".flow",
+    "TelemetrySchema": ".schema",
+    "Deadband": ".deadband",
+    "DeadbandFilter": ".deadband",
+    "Reduction": ".aggregation",
+    "TelemetryAggregator": ".aggregation",
+    "OverflowPolicy": ".dispatch",
+    "C2dDeduplicator": ".dedup",
+    "ConnectFailure": ".reconnect",
+    "ReconnectPolicy": ".reconnect",
+    "TelemetryGateway": ".gateway",
+    "TelemetryProducer": ".gateway",
+    "MetricsRegistry": ".metrics",
+    "StatsdExporter": ".metrics",
+    "JsonFormatter": ".log",
+    "configure_logging": ".log",
+    "OtaDownloader": ".ota",
+    "OtaDownloadError": ".ota",
+    "OtaFile": ".ota",
+    "CompactRecord": ".record",
+    "timestamp_ms_now": ".record",
+    "C2dCommand": "avnet.iotconnect.sdk.sdklib.mqtt",
+    "C2dOta": "avnet.iotconnect.sdk.sdklib.mqtt",
+    "C2dAck": "avnet.iotconnect.sdk.sdklib.mqtt",
+    "C2dMessage": "avnet.iotconnect.sdk.sdklib.mqtt",
+    "TelemetryRecord": "avnet.iotconnect.sdk.sdklib.mqtt",
+    "DeviceConfigError": "avnet.iotconnect.sdk.sdklib.error",
+}
+
+__all__ = ["__version__"] + list(_LAZY_IMPORTS.keys())
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    import importlib
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value  # subsequent lookups do not go through __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(_LAZY_IMPORTS.keys()))
+
+
+if TYPE_CHECKING:
+    # for IDEs and type checkers
+    from .client import Client, ClientSettings, Callbacks
+    from .config import DeviceConfig
+    from .async_client import AsyncClient
+    from .pool import ClientPool
+    from .flow import BackpressurePolicy, PublishCompletion
+    from .schema import TelemetrySchema
+    from .deadband import Deadband, DeadbandFilter
+    from .aggregation import Reduction, TelemetryAggregator
+    from .dispatch import OverflowPolicy
+    from .dedup import C2dDeduplicator
+    from .reconnect import ConnectFailure, ReconnectPolicy
+    from .gateway import TelemetryGateway, TelemetryProducer
+    from .metrics import MetricsRegistry, StatsdExporter
+    from .log import JsonFormatter, configure_logging
+    from .ota import OtaDownloader, OtaDownloadError, OtaFile
+    from .record import CompactRecord, timestamp_ms_now
+    from avnet.iotconnect.sdk.sdklib.mqtt import C2dCommand, C2dOta, C2dAck, C2dMessage, TelemetryRecord
+    from avnet.iotconnect.sdk.sdklib.error import DeviceConfigError
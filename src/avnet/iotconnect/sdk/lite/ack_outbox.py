@@ -0,0 +1,78 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+
+class AckOutboxEntry:
+    def __init__(self, row_id: int, ack_id: str, message_type: int, status: int, message_str: Optional[str]):
+        self.row_id = row_id
+        self.ack_id = ack_id
+        self.message_type = message_type
+        self.status = status
+        self.message_str = message_str
+
+
+class AckOutbox:
+    """
+    A durable store for command and OTA acknowledgements that have not yet been acknowledged by the back end.
+
+    Acks are stored in an SQLite database before they are published and removed once the back end
+    acknowledges them (PUBACK), so that an ack sent right before the application restarts, crashes or loses
+    the connection is sent once the client connects again.
+    Only the latest status is kept for each ack ID. For example, a pending OTA_DOWNLOADING ack is replaced
+    by OTA_DOWNLOAD_DONE, so that the back end does not receive a stale status after the final one.
+
+    :param path: Path to the SQLite database file. The directory will be created if needed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # acks are few and are often sent right before a restart or a reboot, so sync each one to the disk
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS acks ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "ack_id TEXT NOT NULL UNIQUE, "
+            "type INTEGER NOT NULL, "
+            "status INTEGER NOT NULL, "
+            "message TEXT)"
+        )
+
+    def put(self, ack_id: str, message_type: int, status: int, message_str: Optional[str] = None) -> AckOutboxEntry:
+        """ Stores the ack, replacing any pending ack with the same ack ID """
+        with self._lock:
+            # REPLACE deletes the superseded row, so the new one gets a new id and is ordered as the most recent ack
+            cursor = self._db.execute(
+                "INSERT OR REPLACE INTO acks (ack_id, type, status, message) VALUES (?, ?, ?, ?)",
+                (ack_id, message_type, status, message_str)
+            )
+            return AckOutboxEntry(cursor.lastrowid, ack_id, message_type, status, message_str)
+
+    def peek(self) -> list[AckOutboxEntry]:
+        """ Returns all pending acks in the order in which they were stored, without removing them """
+        with self._lock:
+            rows = self._db.execute("SELECT id, ack_id, type, status, message FROM acks ORDER BY id").fetchall()
+        return [AckOutboxEntry(*row) for row in rows]
+
+    def remove(self, entry: AckOutboxEntry) -> None:
+        """ Removes an ack once the back end acknowledged it. Does nothing if it was replaced by a newer status. """
+        with self._lock:
+            self._db.execute("DELETE FROM acks WHERE id = ?", (entry.row_id,))
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM acks").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,218 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import logging
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from avnet.iotconnect.sdk.sdklib.mqtt import TelemetryRecord, TelemetryValueType
+
+logger = logging.getLogger(__name__)
+
+_numpy = False  # not imported yet. NumPy is optional and slow to import, so it is imported when the first buffer is folded
+
+
+def _get_numpy():
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = None
+    return _numpy
+
+
+class Reduction:
+    """ Reductions that can be applied to the samples of a window """
+
+    MIN = "min"
+    MAX = "max"
+    MEAN = "mean"
+    SUM = "sum"
+    COUNT = "count"
+    LAST = "last"
+
+    ALL = (MIN, MAX, MEAN, SUM, COUNT, LAST)
+
+
+class _SampleBuffer:
+    """
+    Fixed-size buffer of float samples for one attribute.
+    When the buffer fills up, the samples are folded into running partial results,
+    so a window can hold any number of samples without growing the buffer.
+    """
+
+    def __init__(self, size: int):
+        self.samples = array('d', bytes(8 * size))
+        self.length = 0
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.sum = 0.0
+        self.last = 0.0
+
+    def add(self, value: float):
+        self.samples[self.length] = value
+        self.length += 1
+        if self.length == len(self.samples):
+            self.fold()
+
+    def fold(self):
+        n = self.length
+        if n == 0:
+            return
+        numpy = _get_numpy()
+        if numpy is not None:
+            view = numpy.frombuffer(self.samples, dtype=numpy.float64, count=n)
+            s_min, s_max, s_sum = float(view.min()), float(view.max()), float(view.sum())
+        else:
+            view = self.samples if n == len(self.samples) else self.samples[:n]
+            s_min, s_max, s_sum = min(view), max(view), sum(view)
+        self.min = min(self.min, s_min)
+        self.max = max(self.max, s_max)
+        self.sum += s_sum
+        self.count += n
+        self.last = self.samples[n - 1]
+        self.length = 0
+
+    def reduce(self, reduction: str) -> TelemetryValueType:
+        if reduction == Reduction.MIN:
+            return self.min
+        if reduction == Reduction.MAX:
+            return self.max
+        if reduction == Reduction.MEAN:
+            return self.sum / self.count
+        if reduction == Reduction.SUM:
+            return self.sum
+        if reduction == Reduction.COUNT:
+            return self.count
+        return self.last
+
+
+class TelemetryAggregator:
+    """
+    Accumulates high-rate samples and sends one telemetry record per time window
+    with the configured reductions (min, max, mean etc.) of each attribute.
+
+    Numeric samples are stored in compact fixed-size float buffers and reduced in bulk
+    (with NumPy, if it is installed), so adding a sample is cheap even at kHz rates.
+    Non-numeric values (strings, booleans, objects) are sent as the last value received in the window.
+
+    For example, to send the mean, min and max temperature every minute:
+
+        aggregator = TelemetryAggregator(
+            send_cb=client.send_telemetry_records,
+            window_secs=60,
+            reductions={'temperature': [Reduction.MEAN, Reduction.MIN, Reduction.MAX]}
+        )
+        while True:
+            aggregator.add_sample('temperature', read_temperature())
+
+    Which would send records like {"temperature_mean": 22.4, "temperature_min": 22.1, "temperature_max": 22.9}.
+
+    :param send_cb: Called with a list containing the window's record. It is called from the aggregator's
+        background thread or the thread calling flush(). Typically, this is Client.send_telemetry_records.
+    :param window_secs: Length of the aggregation window.
+    :param reductions: (Optional) Reductions for each attribute by name.
+    :param default_reductions: Reductions for numeric attributes that are not listed in reductions.
+    :param name_format: Format of the sent attribute names with the {name} and {reduction} fields.
+        Use "{name}" if each attribute has a single reduction and the original attribute names should be kept.
+    :param buffer_size: Number of samples that are buffered per attribute before they are folded into the results.
+    :param timestamp_records: Timestamp the records with the time at the end of the window.
+    """
+
+    def __init__(
+            self,
+            send_cb: Callable[[list[TelemetryRecord]], Any],
+            window_secs: float,
+            reductions: Optional[dict[str, list[str]]] = None,
+            default_reductions: tuple = (Reduction.MEAN,),
+            name_format: str = "{name}_{reduction}",
+            buffer_size: int = 1024,
+            timestamp_records: bool = True
+    ):
+        if window_secs <= 0:
+            raise ValueError("window_secs must be greater than 0")
+        if buffer_size < 1:
+            raise ValueError("buffer_size must be greater than 0")
+        self.reductions = reductions or {}
+        for reduction in [r for rs in self.reductions.values() for r in rs] + list(default_reductions):
+            if reduction not in Reduction.ALL:
+                raise ValueError("Unknown reduction \"%s\"" % reduction)
+        self.send_cb = send_cb
+        self.window_secs = window_secs
+        self.default_reductions = default_reductions
+        self.name_format = name_format
+        self.buffer_size = buffer_size
+        self.timestamp_records = timestamp_records
+        self._lock = threading.Lock()
+        self._buffers: dict[str, _SampleBuffer] = {}
+        self._last_values: dict[str, TelemetryValueType] = {}
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="iotc-telemetry-aggregator", daemon=True)
+        self._thread.start()
+
+    def add_sample(self, name: str, value: float) -> None:
+        """ Adds a single numeric sample. This is the fastest way to add samples. """
+        with self._lock:
+            buffer = self._buffers.get(name)
+            if buffer is None:
+                buffer = self._buffers[name] = _SampleBuffer(self.buffer_size)
+            buffer.add(value)
+
+    def add(self, values: dict[str, TelemetryValueType]) -> None:
+        """ Adds a set of samples, like the one that would be passed to Client.send_telemetry() """
+        with self._lock:
+            for name, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    buffer = self._buffers.get(name)
+                    if buffer is None:
+                        buffer = self._buffers[name] = _SampleBuffer(self.buffer_size)
+                    buffer.add(value)
+                else:
+                    self._last_values[name] = value
+
+    def flush(self) -> None:
+        """ Ends the current window early and sends its record """
+        record = self._take_record()
+        if record is not None:
+            self.send_cb([record])
+
+    def close(self) -> None:
+        """ Stops the background thread and sends the record of the current window """
+        self._stop_event.set()
+        self._thread.join()
+        self.flush()
+
+    def _take_record(self) -> Optional[TelemetryRecord]:
+        with self._lock:
+            buffers = self._buffers
+            last_values = self._last_values
+            self._buffers = {}
+            self._last_values = {}
+        # reduce outside of the lock, so that adding samples is not blocked
+        values = dict(last_values)
+        for name, buffer in buffers.items():
+            buffer.fold()
+            if buffer.count == 0:
+                continue
+            for reduction in self.reductions.get(name, self.default_reductions):
+                values[self.name_format.format(name=name, reduction=reduction)] = buffer.reduce(reduction)
+        if len(values) == 0:
+            return None
+        return TelemetryRecord(values=values, timestamp=datetime.now(timezone.utc) if self.timestamp_records else None)
+
+    def _run(self):
+        next_window_end = time.monotonic() + self.window_secs
+        while not self._stop_event.wait(max(0.0, next_window_end - time.monotonic())):
+            next_window_end += self.window_secs
+            try:
+                self.flush()
+            except Exception as ex:
+                # keep the aggregator alive regardless of what happened
+                logger.exception("Failed to send an aggregated telemetry record: %s", str(ex))
@@ -0,0 +1,292 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import asyncio
+import functools
+import logging
+import threading
+from datetime import datetime
+from ssl import SSLError
+from typing import AsyncIterator, Optional, Union
+
+from avnet.iotconnect.sdk.sdklib.mqtt import C2dOta, C2dCommand, C2DDecodeResult, TelemetryRecord, TelemetryValueType
+from paho.mqtt.client import MQTTErrorCode, MQTTMessageInfo
+from paho.mqtt.client import Client as PahoClient
+
+from .client import Client, ClientSettings, Callbacks
+from .config import DeviceConfig
+from .reconnect import ConnectFailure
+from .record import CompactRecord
+
+logger = logging.getLogger(__name__)
+
+
+class _EventLoopClient(Client):
+    """ A Client whose MQTT network I/O and events are driven by the AsyncClient on an asyncio event loop """
+
+    def __init__(self, owner: 'AsyncClient', config: DeviceConfig, settings: ClientSettings):
+        self._owner = owner
+        super().__init__(config=config, callbacks=Callbacks(), settings=settings)
+        # messages are handed over to the event loop, so there are no callbacks to offload
+        self._c2d_dispatcher = None
+
+    def _dispatch_c2d_message(self, decoding_result: C2DDecodeResult, payload: str):
+        self._owner._on_c2d_message(decoding_result)
+
+    def _on_mqtt_connect(self, mqttc: PahoClient, obj, flags, reason_code, properties):
+        super()._on_mqtt_connect(mqttc, obj, flags, reason_code, properties)
+        self._owner._on_connack()
+
+    def _on_mqtt_publish(self, mqttc: PahoClient, obj, mid, reason_code, properties):
+        super()._on_mqtt_publish(mqttc, obj, mid, reason_code, properties)
+        self._owner._on_publish_complete(mid)
+
+    def _is_network_thread(self) -> bool:
+        return threading.get_ident() == self._owner._loop_thread_id
+
+    def _start_reconnect(self):
+        pass  # the application reconnects by calling AsyncClient.connect()
+
+
+class AsyncClient:
+    """
+    An asyncio variant of the Client.
+
+    Instead of running a dedicated MQTT network thread, the MQTT socket is serviced by the running event loop,
+    sending data returns once the back end has acknowledged it,
+    and the received C2D messages are consumed with an async iterator. For example:
+
+        client = AsyncClient(config=device_config)
+        if await client.connect():
+            await client.send_telemetry({'temperature': get_sensor_temperature()})
+            async for msg in client.messages():
+                if msg.command is not None:
+                    await client.send_command_ack(msg.command, C2dAck.CMD_SUCCESS_WITH_ACK)
+
+    All methods must be called from the same event loop.
+    Features enabled with ClientSettings (outbox, batching etc.) behave the same as they do with the Client.
+
+    :param config: Required device configuration. See the DeviceConfig class description for more details.
+    :param settings: Tune the client behavior by providing your preferences regarding connection timeouts and logging.
+    """
+
+    MISC_LOOP_INTERVAL_SECS = 1.0
+    """ How often to perform periodic MQTT keepalive (ping) handling """
+
+    def __init__(self, config: DeviceConfig, settings: ClientSettings = None):
+        self.config = config
+        self.settings = settings or ClientSettings()
+        self._client: Optional[_EventLoopClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._sock_fd: Optional[int] = None
+        self._connack: Optional[asyncio.Future] = None
+        self._closed: Optional[asyncio.Future] = None
+        self._misc_task: Optional[asyncio.Task] = None
+        self._pending_publishes: dict[int, asyncio.Future] = {}
+        self._messages: Optional[asyncio.Queue] = None
+
+    @property
+    def client(self) -> Optional[Client]:
+        """ The underlying Client. Available once connect() was called. """
+        return self._client
+
+    def is_connected(self) -> bool:
+        return self._client is not None and self._client.is_connected()
+
+    async def connect(self) -> bool:
+        """
+        Connects to the MQTT broker, retrying according to the ClientSettings.
+        On the first call, the device identity data will be obtained from the REST API (or identity cache).
+
+        :return: True if connected successfully.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not None and self._loop is not loop:
+            raise RuntimeError("AsyncClient must be used from a single event loop")
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        if self._messages is None:
+            self._messages = asyncio.Queue()  # create it here, so that it binds to the running loop on Python 3.9
+        if self._client is None:
+            # The identity REST API calls are blocking, so run them outside the event loop
+            self._client = await loop.run_in_executor(None, _EventLoopClient, self, self.config, self.settings)
+            mqtt = self._client.mqtt
+            mqtt.on_socket_open = self._on_socket_open
+            mqtt.on_socket_close = self._on_socket_close
+            mqtt.on_socket_register_write = self._on_socket_register_write
+            mqtt.on_socket_unregister_write = self._on_socket_unregister_write
+
+        if self.is_connected():
+            return True
+
+        c = self._client
+        c._identity_refreshed = False
+        delay_secs = 0.0
+        for i in range(self.settings.connect_tries):
+            if c._pending_identity is not None:
+                c._apply_identity(c._pending_identity)
+            self._connack = loop.create_future()
+            try:
+                # TCP connection and TLS handshake are blocking in paho. The CONNACK will be processed by this loop.
+                mqtt_error = await loop.run_in_executor(None, functools.partial(c.mqtt.connect, host=c.mqtt_config.host, port=c.mqtt_port))
+                if mqtt_error != MQTTErrorCode.MQTT_ERR_SUCCESS:
+                    logger.warning("TLS connection to the endpoint failed")
+                    failure = ConnectFailure.REFUSED
+                else:
+                    failure = None
+                    try:
+                        await asyncio.wait_for(asyncio.shield(self._connack), self.settings.connect_timeout_secs)
+                    except asyncio.TimeoutError:
+                        logger.warning("Timed out.")
+                        failure = ConnectFailure.TIMEOUT
+                    if self.is_connected():
+                        c._consecutive_rejections = 0
+                        if self._misc_task is None or self._misc_task.done():
+                            self._misc_task = loop.create_task(self._misc_loop())
+                        c._subscribe()
+                        return True
+                    logger.warning("Connection failed. Reason: %s", c._connack_reason_code)
+                    if failure is None:
+                        failure = ConnectFailure.from_reason_code(c._connack_reason_code)
+                    await self.disconnect()
+
+            except (SSLError, TimeoutError, OSError) as ex:
+                # OSError includes socket.gaierror when host could not be resolved
+                logger.warning("Failed to connect to host %s. Exception: %s", c.mqtt_config.host, str(ex))
+                failure = ConnectFailure.from_exception(ex)
+
+            c._count_connect_failure(failure)
+            # this may need to call the identity REST API
+            await loop.run_in_executor(None, c._on_connect_attempt_failed, failure)
+            if i == self.settings.connect_tries - 1:
+                break
+            delay_secs = c._next_connect_delay(failure, delay_secs)
+            await asyncio.sleep(delay_secs)
+        return False
+
+    async def disconnect(self) -> None:
+        if self._client is None:
+            return
+        self._closed = self._loop.create_future()
+        self._client.disconnect()
+        if self._sock_fd is not None:
+            # wait for paho to write the DISCONNECT packet and close the socket
+            try:
+                await asyncio.wait_for(asyncio.shield(self._closed), self.settings.connect_timeout_secs)
+            except asyncio.TimeoutError:
+                pass
+
+    async def send_telemetry(self, values: dict[str, TelemetryValueType], timestamp: datetime = None, qos: Optional[int] = None) -> None:
+        """ Same as Client.send_telemetry(), but waits for the back end to acknowledge the message """
+        await self.send_telemetry_records([TelemetryRecord(values=values, timestamp=timestamp)], qos=qos)
+
+    async def send_telemetry_records(self, records: list[Union[TelemetryRecord, CompactRecord]], qos: Optional[int] = None) -> None:
+        """
+        Same as Client.send_telemetry_records(), but waits for the back end to acknowledge the message.
+        Returns immediately if the records were stored into the outbox or buffered for batching.
+        With QoS 0, it returns once the message has been written to the socket.
+        Raises ConnectionError if the connection is closed before the back end acknowledges the message.
+        The message may still be delivered after connect() is called again.
+        """
+        await self._wait_for_publish(self._require_client().send_telemetry_records(records, qos=qos))
+
+    async def send_command_ack(self, original_message: C2dCommand, status: int, message_str: str = None) -> None:
+        await self._wait_for_publish(self._require_client().send_command_ack(original_message, status, message_str))
+
+    async def send_ota_ack(self, original_message: C2dOta, status: int, message_str: str = None) -> None:
+        await self._wait_for_publish(self._require_client().send_ota_ack(original_message, status, message_str))
+
+    async def send_ack(self, ack_id: str, message_type: int, status: int, message_str: str = None) -> None:
+        await self._wait_for_publish(self._require_client().send_ack(ack_id, message_type, status, message_str))
+
+    async def messages(self) -> AsyncIterator[C2DDecodeResult]:
+        """
+        Yields the received and successfully decoded C2D messages.
+        Check the command or ota field of the yielded object to determine the message type.
+        """
+        if self._messages is None:
+            raise RuntimeError("AsyncClient.connect() must be called first")
+        while True:
+            yield await self._messages.get()
+
+    def _require_client(self) -> Client:
+        if self._client is None:
+            raise RuntimeError("AsyncClient.connect() must be called first")
+        return self._client
+
+    async def _wait_for_publish(self, info: Optional[MQTTMessageInfo]):
+        if info is None or info.rc != MQTTErrorCode.MQTT_ERR_SUCCESS or info.is_published():
+            return
+        if self._sock_fd is None:
+            raise ConnectionError("The connection was closed before the message was acknowledged")
+        future = self._loop.create_future()
+        self._pending_publishes[info.mid] = future
+        try:
+            await future
+        finally:
+            self._pending_publishes.pop(info.mid, None)
+
+    async def _misc_loop(self):
+        while self._client.mqtt.loop_misc() == MQTTErrorCode.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(AsyncClient.MISC_LOOP_INTERVAL_SECS)
+
+    def _call_in_loop(self, func, *args):
+        """ paho may call the socket callbacks from an executor thread (during connect) or another thread """
+        if threading.get_ident() == self._loop_thread_id:
+            func(*args)
+        else:
+            self._loop.call_soon_threadsafe(func, *args)
+
+    def _on_socket_open(self, client: PahoClient, userdata, sock):
+        self._sock_fd = sock.fileno()
+        self._call_in_loop(self._loop.add_reader, self._sock_fd, self._on_readable)
+
+    def _on_socket_close(self, client: PahoClient, userdata, sock):
+        # the socket will be closed by the time a deferred call runs, so use the saved file descriptor
+        fd = self._sock_fd
+        self._sock_fd = None
+        self._call_in_loop(self._socket_closed, fd)
+
+    def _on_socket_register_write(self, client: PahoClient, userdata, sock):
+        self._call_in_loop(self._loop.add_writer, sock.fileno(), self._on_writable)
+
+    def _on_socket_unregister_write(self, client: PahoClient, userdata, sock):
+        self._call_in_loop(self._loop.remove_writer, sock.fileno())
+
+    def _socket_closed(self, fd: int):
+        self._loop.remove_reader(fd)
+        self._loop.remove_writer(fd)
+        if self._connack is not None and not self._connack.done():
+            self._connack.set_result(False)
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(True)
+        # PUBACKs for these will never arrive on this connection, so do not leave the senders waiting forever
+        for future in self._pending_publishes.values():
+            if not future.done():
+                future.set_exception(ConnectionError("The connection was closed before the message was acknowledged"))
+
+    def _on_readable(self):
+        mqtt = self._client.mqtt
+        rc = mqtt.loop_read()
+        # paho reads one packet at a time, and the event loop does not see the data already decrypted by TLS
+        sock = mqtt.socket()
+        while rc == MQTTErrorCode.MQTT_ERR_SUCCESS and hasattr(sock, 'pending') and sock.pending() > 0:
+            rc = mqtt.loop_read()
+            sock = mqtt.socket()
+
+    def _on_writable(self):
+        self._client.mqtt.loop_write()
+
+    def _on_connack(self):
+        if self._connack is not None and not self._connack.done():
+            self._connack.set_result(True)
+
+    def _on_publish_complete(self, mid: int):
+        future = self._pending_publishes.get(mid)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def _on_c2d_message(self, decoding_result: C2DDecodeResult):
+        self._messages.put_nowait(decoding_result)
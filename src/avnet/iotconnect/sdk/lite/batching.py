@@ -0,0 +1,126 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from avnet.iotconnect.sdk.sdklib.mqtt import TelemetryRecord
+
+from .telemetry import stamp_and_encode_entries
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryBatcher:
+    """
+    Buffers telemetry records and hands them over in batches to the send callback,
+    so that multiple records can be sent in a single telemetry packet.
+
+    Records are encoded and stamped with the current time (if they have no timestamp) when they are added.
+    A batch is sent when max_records or max_bytes is reached, or by the background flusher thread
+    once the oldest buffered record is max_latency_secs old.
+
+    :param send_cb: Called with a list of (epoch milliseconds timestamp, encoded entry) pairs.
+        It can be called from the thread adding the records, the flusher thread or the thread calling flush().
+    :param max_records: Maximum number of records in a batch.
+    :param max_bytes: Send the batch once the encoded entries reach this size.
+    :param max_latency_secs: Maximum time that a record can spend in the buffer.
+    """
+
+    def __init__(
+            self,
+            send_cb: Callable[[list[tuple[int, str]]], None],
+            max_records: int = 100,
+            max_bytes: int = 64 * 1024,
+            max_latency_secs: float = 1.0
+    ):
+        if max_records < 1:
+            raise ValueError("max_records must be greater than 0")
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be greater than 0")
+        if max_latency_secs <= 0:
+            raise ValueError("max_latency_secs must be greater than 0")
+        self.send_cb = send_cb
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_latency_secs = max_latency_secs
+        self._cond = threading.Condition()
+        self._entries: list[tuple[int, str]] = []
+        self._entries_bytes = 0
+        self._first_added_time = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._flusher, name="iotc-telemetry-batcher", daemon=True)
+        self._thread.start()
+
+    def add(self, records: list[TelemetryRecord]) -> None:
+        self.add_entries(stamp_and_encode_entries(records, datetime.now(timezone.utc)))
+
+    def add_entries(self, entries: list[tuple[int, str]]) -> None:
+        """ Adds records that are already stamped and encoded with stamp_and_encode_entries() """
+        with self._cond:
+            if len(self._entries) == 0:
+                self._first_added_time = time.monotonic()
+                self._cond.notify()
+            self._entries.extend(entries)
+            self._entries_bytes += sum(len(e[1]) + 1 for e in entries)
+            batch = None
+            if len(self._entries) >= self.max_records or self._entries_bytes >= self.max_bytes:
+                batch = self._take()
+        if batch is not None:
+            self._send(batch)
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._entries)
+
+    def flush(self) -> None:
+        """ Sends all buffered records immediately """
+        with self._cond:
+            batch = self._take()
+        if batch is not None:
+            self._send(batch)
+
+    def close(self) -> None:
+        """ Stops the flusher thread and sends any buffered records """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+    def _take(self) -> Optional[list[tuple[int, str]]]:
+        """ Must be called with the lock held """
+        if len(self._entries) == 0:
+            return None
+        batch = self._entries
+        self._entries = []
+        self._entries_bytes = 0
+        return batch
+
+    def _send(self, batch: list[tuple[int, str]]):
+        for i in range(0, len(batch), self.max_records):
+            self.send_cb(batch[i:i + self.max_records])
+
+    def _flusher(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._entries) == 0:
+                        self._cond.wait()
+                        continue
+                    remaining_secs = self._first_added_time + self.max_latency_secs - time.monotonic()
+                    if remaining_secs <= 0:
+                        break
+                    self._cond.wait(remaining_secs)
+                if self._closed:
+                    return
+                batch = self._take()
+            try:
+                self._send(batch)
+            except Exception as ex:
+                # keep the flusher alive regardless of what happened
+                logger.exception("Failed to send a telemetry batch: %s", str(ex))
@@ -2,21 +2,45 @@
 # Copyright (C) 2024 Avnet
 # Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
 
-import random
+import functools
+import logging
+import threading
 import time
+from concurrent.futures import Future
 from datetime import datetime, timezone
 from ssl import SSLError
-from typing import Callable, Optional
+from typing import TYPE_CHECKING, Any, Callable, Optional, Sequence, Union
 
-from avnet.iotconnect.sdk.sdklib.dra import DeviceRestApi
-from avnet.iotconnect.sdk.sdklib.error import C2DDecodeError
-from avnet.iotconnect.sdk.sdklib.mqtt import C2dOta, C2dMessage, C2dCommand, C2dAck, TelemetryRecord, TelemetryValueType, encode_telemetry_records, encode_c2d_ack, decode_c2d_message
+from avnet.iotconnect.sdk.sdklib.dra import DeviceRestApi, DeviceIdentityData
+from avnet.iotconnect.sdk.sdklib.error import C2DDecodeError, DeviceConfigError
+from avnet.iotconnect.sdk.sdklib.mqtt import C2dOta, C2dMessage, C2dCommand, C2dAck, C2DDecodeResult, TelemetryRecord, TelemetryValueType, encode_telemetry_records, encode_c2d_ack, decode_c2d_message
 from avnet.iotconnect.sdk.sdklib.util import Timing
 from paho.mqtt.client import CallbackAPIVersion, MQTTErrorCode, DisconnectFlags, MQTTMessageInfo
 from paho.mqtt.client import Client as PahoClient
 from paho.mqtt.reasoncodes import ReasonCode
 
+from .batching import TelemetryBatcher
+from .columns import encode_telemetry_columns
 from .config import DeviceConfig
+from .deadband import DeadbandFilter
+from .dedup import C2dDeduplicator
+from .dispatch import C2dDispatcher, OverflowPolicy
+from .flow import BackpressurePolicy, PublishCompletion, PublishTracker
+from .identity_cache import IdentityCache
+from .log import enable_verbose_output, log_rate_limited
+from .metrics import ClientMetrics
+from .pool import ClientPool
+from .reconnect import ConnectFailure, ReconnectPolicy
+from .record import CompactRecord, timestamp_ms_now
+from .schema import TelemetrySchema
+from .telemetry import encode_telemetry_entry, encode_telemetry_packet, split_telemetry_entries, MAX_PACKET_SIZE
+from .tls import TlsSessionCache
+
+if TYPE_CHECKING:
+    from .ack_outbox import AckOutbox, AckOutboxEntry
+    from .outbox import TelemetryOutbox
+
+logger = logging.getLogger(__name__)
 
 
 class Callbacks:
@@ -57,20 +81,168 @@ class ClientSettings:
             verbose: bool = True,
             connect_timeout_secs: int = 30,
             connect_tries: int = 100,
-            connect_backoff_max_secs: int = 15
+            connect_backoff_max_secs: int = 15,
+            identity_cache_path: Optional[str] = None,
+            identity_cache_ttl_secs: int = 7 * 24 * 3600,
+            outbox_path: Optional[str] = None,
+            outbox_max_bytes: int = 10 * 1024 * 1024,
+            outbox_drain_records_per_sec: int = 50,
+            telemetry_batching: bool = False,
+            batch_max_records: int = 100,
+            batch_max_bytes: int = 64 * 1024,
+            batch_max_latency_secs: float = 1.0,
+            max_inflight_messages: int = 20,
+            max_queued_bytes: int = 0,
+            backpressure_policy: str = BackpressurePolicy.DROP,
+            backpressure_timeout_secs: float = 10,
+            telemetry_filter: Optional[DeadbandFilter] = None,
+            c2d_dispatch_workers: int = 0,
+            c2d_max_queue_depth: int = 100,
+            c2d_overflow_policy: str = OverflowPolicy.DROP_NEWEST,
+            telemetry_qos: int = 1,
+            ack_outbox_path: Optional[str] = None,
+            c2d_deduplicator: Optional[C2dDeduplicator] = None,
+            reconnect_policy: Optional[ReconnectPolicy] = None,
+            auto_reconnect: bool = True,
+            persistent_session: bool = False
     ):
+        """
+        :param verbose: Print connection information. The client logs with the standard logging module,
+            and this option outputs the INFO level messages to the console, unless the application has configured logging.
+            Set the "avnet.iotconnect.sdk.lite" logger level to DEBUG to see the content of the sent and received messages.
+        :param connect_timeout_secs: How long to wait for the MQTT connection to be established in a single connect attempt.
+        :param connect_tries: How many times to attempt to connect before giving up.
+        :param connect_backoff_max_secs: Maximum random back off between connection attempts,
+            when using the default reconnect_policy.
+        :param identity_cache_path: (Optional) Path to a JSON file where the device identity data
+            obtained from the /IOTCONNECT REST API will be cached. If the cache has a valid entry for this device,
+            the client will skip the REST API calls on startup and refresh the data in the background.
+            The cached entry is invalidated if connecting with the cached data fails.
+            If the REST API is unavailable, an expired cache entry will be used as a fallback.
+        :param identity_cache_ttl_secs: Age after which the cached identity data is considered expired.
+        :param outbox_path: (Optional) Path to an SQLite database file where telemetry records will be stored
+            while the client is disconnected, instead of being dropped. Stored records survive application restarts
+            and are sent in timestamp order once the client connects. Records without a timestamp
+            will be stamped with the time when they were stored.
+        :param outbox_max_bytes: Approximate maximum size of the stored records. The oldest records are evicted first.
+        :param outbox_drain_records_per_sec: Maximum rate at which the stored records are sent after connecting.
+        :param telemetry_batching: If enabled, records passed to send_telemetry() and send_telemetry_records()
+            will be buffered, stamped with the current time (if they have no timestamp), and sent in multi-record packets.
+            A batch is sent when any of the batch_max_* limits below is reached.
+        :param batch_max_records: Maximum number of records in a single batch.
+        :param batch_max_bytes: Approximate maximum size of a batch packet.
+            Batches are always split to fit into the platform maximum packet size.
+        :param batch_max_latency_secs: Maximum time that a record can be held in the buffer before it is sent.
+        :param max_inflight_messages: Maximum number of telemetry messages that can be awaiting
+            an acknowledgement (PUBACK) from the back end. Limits the memory used by paho's message queue
+            when the application produces data faster than it can be sent.
+        :param max_queued_bytes: Maximum total size of telemetry messages awaiting an acknowledgement. Zero means unlimited.
+        :param backpressure_policy: What to do when sending telemetry while either of the above limits is reached.
+            See BackpressurePolicy: "drop" (the default) drops the message, "raise" raises ClientError
+            and "block" waits up to backpressure_timeout_secs for earlier messages to be acknowledged.
+            Dropped messages are not sent and None is returned.
+        :param backpressure_timeout_secs: Maximum time to wait with the "block" policy before dropping the message.
+        :param telemetry_filter: (Optional) A DeadbandFilter that strips attributes that have not changed
+            since they were last sent from the records passed to send_telemetry() and send_telemetry_records().
+            Records with no attributes left are not sent at all.
+        :param c2d_dispatch_workers: If greater than zero, the C2D message callbacks (command, OTA and generic)
+            will be invoked on up to this many worker threads instead of the MQTT network thread,
+            so that slow callbacks do not block keepalives and sending of data.
+            Messages of the same type are processed one at a time, in the order in which they were received.
+        :param c2d_max_queue_depth: Maximum number of received C2D messages waiting for a worker thread.
+        :param c2d_overflow_policy: What to do when a message is received while the queue is full.
+            See OverflowPolicy: "drop_newest" drops the received message and "drop_oldest" drops the oldest waiting message.
+        :param telemetry_qos: The MQTT QoS used for telemetry when it is not specified in the send call.
+            With QoS 1 (the default), each message is acknowledged by the back end and resent if the connection is lost.
+            QoS 0 messages are sent at most once, without waiting for an acknowledgement, which suits high-rate,
+            loss-tolerant data. ACKs for commands and OTA are always sent with QoS 1. See send_telemetry_records().
+        :param ack_outbox_path: (Optional) Path to an SQLite database file where command and OTA ACKs will be stored
+            until the back end acknowledges them. Stored ACKs survive application restarts and are sent first
+            once the client connects, before any stored telemetry. Only the latest status is kept for each ACK ID,
+            so an OTA_DOWNLOADING ACK that could not be sent is replaced by the subsequent OTA_DOWNLOAD_DONE, for example.
+        :param c2d_deduplicator: (Optional) A C2dDeduplicator that suppresses commands and OTA requests
+            that are redelivered by the broker after they were already processed, so that the command and OTA callbacks
+            are not invoked again for the same message. Commands are identified by their ACK ID,
+            so enable "Acknowledgement Required" for the commands in the device template.
+            Identical commands without an ACK ID received within the deduplicator's TTL are also suppressed.
+        :param reconnect_policy: (Optional) A ReconnectPolicy that decides the delays between connection attempts.
+            The default policy uses exponential back off with decorrelated jitter up to connect_backoff_max_secs,
+            and waits 5 minutes after 5 consecutive TLS or authentication failures.
+        :param auto_reconnect: If enabled, the client reconnects in the background when an established connection
+            is lost, after a short random delay (see ReconnectPolicy), with up to connect_tries attempts.
+            The identity data and the TLS session of the lost connection are reused, and the identity data
+            is fetched from the REST API again only if the failures indicate that it may have changed.
+        :param persistent_session: If enabled, the client connects with a persistent MQTT session (clean session off),
+            so that the broker keeps the C2D subscription and queues the C2D messages sent while the device is offline,
+            and delivers them once the device connects again. The subscription is not repeated when the session is resumed.
+            The broker decides how long an idle session is kept (one hour by default with AWS IoT Core).
+            Messages that were not acknowledged before the connection was lost may be delivered again,
+            so consider a c2d_deduplicator along with this option.
+        """
         if verbose:
             from . import __version__ as SDK_VERSION
             from avnet.iotconnect.sdk.sdklib import __version__ as LIB_VERSION
-            print(f"/IOTCONNENCT Lite Client started with version {SDK_VERSION} and Lib version {LIB_VERSION}")
+            enable_verbose_output()
+            logger.info("/IOTCONNENCT Lite Client started with version %s and Lib version %s", SDK_VERSION, LIB_VERSION)
         self.verbose = verbose
         self.connect_timeout_secs = connect_timeout_secs
         self.connect_tries = connect_tries
         self.connect_backoff_max_secs = connect_backoff_max_secs
+        self.identity_cache_path = identity_cache_path
+        self.identity_cache_ttl_secs = identity_cache_ttl_secs
+        self.outbox_path = outbox_path
+        self.outbox_max_bytes = outbox_max_bytes
+        self.outbox_drain_records_per_sec = outbox_drain_records_per_sec
+        self.telemetry_batching = telemetry_batching
+        self.batch_max_records = batch_max_records
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_max_latency_secs = batch_max_latency_secs
+        self.max_inflight_messages = max_inflight_messages
+        self.max_queued_bytes = max_queued_bytes
+        self.backpressure_policy = backpressure_policy
+        self.backpressure_timeout_secs = backpressure_timeout_secs
+        self.telemetry_filter = telemetry_filter
+        self.c2d_dispatch_workers = c2d_dispatch_workers
+        self.c2d_max_queue_depth = c2d_max_queue_depth
+        self.c2d_overflow_policy = c2d_overflow_policy
+        self.telemetry_qos = telemetry_qos
+        self.ack_outbox_path = ack_outbox_path
+        self.c2d_deduplicator = c2d_deduplicator
+        self.reconnect_policy = reconnect_policy or ReconnectPolicy(max_delay_secs=max(1, connect_backoff_max_secs))
+        self.auto_reconnect = auto_reconnect
+        self.persistent_session = persistent_session
         if connect_timeout_secs < 1:
             raise ValueError("connect_timeout_secs must be greater than 1")
         if connect_tries < 1:
             raise ValueError("connect_tries must be greater than 1")
+        if identity_cache_ttl_secs < 0:
+            raise ValueError("identity_cache_ttl_secs must not be negative")
+        if outbox_max_bytes < 1:
+            raise ValueError("outbox_max_bytes must be greater than 0")
+        if outbox_drain_records_per_sec < 1:
+            raise ValueError("outbox_drain_records_per_sec must be greater than 0")
+        if batch_max_records < 1:
+            raise ValueError("batch_max_records must be greater than 0")
+        if batch_max_bytes < 1:
+            raise ValueError("batch_max_bytes must be greater than 0")
+        if batch_max_latency_secs <= 0:
+            raise ValueError("batch_max_latency_secs must be greater than 0")
+        if max_inflight_messages < 1:
+            raise ValueError("max_inflight_messages must be greater than 0")
+        if max_queued_bytes < 0:
+            raise ValueError("max_queued_bytes must not be negative")
+        if not BackpressurePolicy.is_valid(backpressure_policy):
+            raise ValueError("backpressure_policy must be one of \"block\", \"raise\" or \"drop\"")
+        if backpressure_timeout_secs < 0:
+            raise ValueError("backpressure_timeout_secs must not be negative")
+        if c2d_dispatch_workers < 0:
+            raise ValueError("c2d_dispatch_workers must not be negative")
+        if c2d_max_queue_depth < 1:
+            raise ValueError("c2d_max_queue_depth must be greater than 0")
+        if not OverflowPolicy.is_valid(c2d_overflow_policy):
+            raise ValueError("c2d_overflow_policy must be \"drop_newest\" or \"drop_oldest\"")
+        if telemetry_qos not in (0, 1):
+            raise ValueError("telemetry_qos must be 0 or 1")
 
 
 class Client:
@@ -84,6 +256,8 @@ class Client:
         - /IOTCONNECT OTA update events.
         - Device MQTT disconnection.
     :param settings: Tune the client behavior by providing your preferences regarding connection timeouts and logging.
+    :param pool: (Optional) A ClientPool that will run the MQTT network I/O for this client
+        along with other clients in the pool, instead of a dedicated network thread.
 
     Usage (see basic-example.py or minimal.py examples at https://github.com/avnet-iotconnect/iotc-python-lite-sdk for more details):
 
@@ -132,26 +306,87 @@ class Client:
                 'temperature': get_sensor_temperature()
             })
 
+    - (Optional) Observe the client behavior with Client.metrics. Use Client.metrics.snapshot() to read the values,
+        Client.metrics.to_prometheus_text() to serve them to Prometheus, or a StatsdExporter to push them to StatsD.
+
     """
 
+    OUTBOX_DRAIN_BATCH_SIZE = 50
+    """ Maximum number of records that will be sent from the outbox in a single packet """
+
     def __init__(
             self,
             config: DeviceConfig,
             callbacks: Callbacks = None,
-            settings: ClientSettings = None
+            settings: ClientSettings = None,
+            pool: Optional[ClientPool] = None
     ):
         self.user_callbacks = callbacks or Callbacks()
         self.settings = settings or ClientSettings()
 
-        self.mqtt_config = DeviceRestApi(config.to_properties(), verbose=self.settings.verbose).get_identity_data()  # can raise DeviceConfigError
+        self.device_properties = config.to_properties()
+        self.metrics = ClientMetrics(
+            inflight_func=lambda: self.publish_tracker.inflight_count(),
+            const_labels={"device": self.device_properties.duid}
+        )
+        self._has_connected = False
+        self._identity_cache: Optional[IdentityCache] = None
+        if self.settings.identity_cache_path is not None:
+            self._identity_cache = IdentityCache(self.settings.identity_cache_path, self.settings.identity_cache_ttl_secs)
+        self._identity_from_cache = False
+        self._pending_identity: Optional[DeviceIdentityData] = None
+        self.mqtt_config = self._load_identity()  # can raise DeviceConfigError
+
+        self.outbox: Optional["TelemetryOutbox"] = None
+        if self.settings.outbox_path is not None:
+            from .outbox import TelemetryOutbox  # sqlite3 is imported only when the outbox is used
+            self.outbox = TelemetryOutbox(self.settings.outbox_path, self.settings.outbox_max_bytes)
+        self._outbox_drain_thread: Optional[threading.Thread] = None
+        self.ack_outbox: Optional["AckOutbox"] = None
+        if self.settings.ack_outbox_path is not None:
+            from .ack_outbox import AckOutbox
+            self.ack_outbox = AckOutbox(self.settings.ack_outbox_path)
+        self._pending_acks: dict[int, "AckOutboxEntry"] = {}
+        """ Stored ACKs that were published and are awaiting a PUBACK, by MQTT message ID. Guarded by _publish_lock. """
+        self._publish_lock = threading.Lock()
+        """ Guards the registration of published messages. Never held while calling paho or user callbacks. """
+        self._publishes_in_progress = 0
+        self._early_pubacks: dict[int, tuple[float, ReasonCode]] = {}
+        """ PUBACKs received before their message was registered: (monotonic time, reason code) by MQTT message ID """
+
+        self.max_packet_size = MAX_PACKET_SIZE.get(self.device_properties.platform, min(MAX_PACKET_SIZE.values()))
+        self._batcher: Optional[TelemetryBatcher] = None
+        if self.settings.telemetry_batching:
+            self._batcher = TelemetryBatcher(
+                send_cb=self._send_telemetry_entries,
+                max_records=self.settings.batch_max_records,
+                max_bytes=min(self.settings.batch_max_bytes, self.max_packet_size),
+                max_latency_secs=self.settings.batch_max_latency_secs
+            )
 
+        self.mqtt_port = 8883
+        """ MQTT over TLS port. Can be changed before connecting, for example to test with a local broker """
         self.mqtt = PahoClient(
             callback_api_version=CallbackAPIVersion.VERSION2,
-            client_id=self.mqtt_config.client_id
+            client_id=self.mqtt_config.client_id,
+            # paho's network thread would reconnect with the same delays on all devices. We reconnect with our own policy.
+            reconnect_on_failure=False,
+            clean_session=not self.settings.persistent_session
         )
-        # TODO: User configurable with defaults
-        self.mqtt.reconnect_delay_set(min_delay=1, max_delay=int(self.settings.connect_timeout_secs / 2 + 1))
-        self.mqtt.tls_set(certfile=config.device_cert_path, keyfile=config.device_pkey_path, ca_certs=config.server_ca_cert_path)
+        # acks are not subject to our flow control, so leave some room in paho's window for them
+        self.mqtt.max_inflight_messages_set(self.settings.max_inflight_messages + 10)
+        self.publish_tracker = PublishTracker(
+            max_inflight=self.settings.max_inflight_messages,
+            max_queued_bytes=self.settings.max_queued_bytes,
+            policy=self.settings.backpressure_policy,
+            block_timeout_secs=self.settings.backpressure_timeout_secs
+        )
+        # The SSLContext is shared by all clients using the same credentials, and the TLS session is resumed on reconnect
+        self._tls_session_cache = TlsSessionCache(config.device_cert_path, config.device_pkey_path, config.server_ca_cert_path)
+        self.mqtt.tls_set_context(self._tls_session_cache)
+        self._pool = pool
+        if pool is not None:
+            pool._attach(self, config)  # sets up the pool's I/O loop callbacks
         self.mqtt.username = self.mqtt_config.username
 
         self.mqtt.on_message = self._on_mqtt_message
@@ -161,71 +396,199 @@ class Client:
 
         self.user_callbacks = callbacks or Callbacks()
 
+        self._c2d_dispatcher: Optional[C2dDispatcher] = None
+        if self.settings.c2d_dispatch_workers > 0:
+            self._c2d_dispatcher = C2dDispatcher(
+                max_workers=self.settings.c2d_dispatch_workers,
+                max_queue_depth=self.settings.c2d_max_queue_depth,
+                overflow_policy=self.settings.c2d_overflow_policy
+            )
+
+        self._connect_lock = threading.Lock()
+        self._connack_event = threading.Event()
+        self._connack_reason_code: Optional[ReasonCode] = None
+        self._session_present = False
+        self._consecutive_rejections = 0
+        self._identity_refreshed = False
+        self._disconnect_event = threading.Event()
+        """ Set by disconnect() to stop any connection attempts in progress """
+        self._reconnect_thread: Optional[threading.Thread] = None
+        self._network_thread: Optional[threading.Thread] = None
+        """ The thread that processes the MQTT network events of the current connection, unless a ClientPool is used """
+
     @classmethod
     def timestamp_now(cls) -> datetime:
         """ Returns the UTC timestamp that can be used to stamp telemetry records """
         return datetime.now(timezone.utc)
 
+    @classmethod
+    def timestamp_ms_now(cls) -> int:
+        """ Returns the epoch milliseconds timestamp that can be used to stamp a CompactRecord. See timestamp_ms_now(). """
+        return timestamp_ms_now()
+
     def is_connected(self):
         return self.mqtt.is_connected()
 
     def connect(self):
-        def wait_for_connection() -> bool:
-            connect_timer = Timing()
-            if self.settings.verbose:
-                print("waiting to connect...")
-            while True:
-                if self.is_connected():
-                    if self.settings.verbose:
-                        print("MQTT connected")
-                    return True
-                time.sleep(0.5)
-                if connect_timer.diff_now().seconds > self.settings.connect_timeout_secs:
-                    print("Timed out.")
-                    self.disconnect()
-                    return False
+        """
+        Connects to the MQTT broker. The call will block until the connection is established
+        or until all connection attempts configured in ClientSettings have failed.
+        Check Client.is_connected() after the call to determine whether the client has connected successfully.
+        """
+        self._disconnect_event.clear()
+        with self._connect_lock:
+            self._connect()
 
-        if self.is_connected():
-            return
+    def connect_async(self) -> Future:
+        """
+        Same as connect(), but it does not block. The connection attempts are made in a background thread.
+
+        :return: A Future that resolves to a boolean indicating whether the client connected successfully.
+        """
+        future = Future()
 
-        for i in range(1, self.settings.connect_tries):
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
             try:
-                t = Timing()
-                mqtt_error = self.mqtt.connect(
-                    host=self.mqtt_config.host,
-                    port=8883
-                )
-                if mqtt_error != MQTTErrorCode.MQTT_ERR_SUCCESS:
-                    print("TLS connection to the endpoint failed")
-                else:
-                    print("Awaiting MQTT connection establishment...")
-                    self.mqtt.loop_start()
-                    if wait_for_connection():
-                        if self.settings.verbose:
-                            print("Connected in %dms" % (t.diff_now().microseconds / 1000))
-                        break
-                    else:
-                        continue
+                self.connect()
+                future.set_result(self.is_connected())
+            except Exception as ex:
+                future.set_exception(ex)
 
-            except (SSLError, TimeoutError, OSError) as ex:
-                # OSError includes socket.gaierror when host could not be resolved
-                # This could also be temporary, so keep trying
-                print("Failed to connect to host %s. Exception: %s" % (self.mqtt_config.host, str(ex)))
+        threading.Thread(target=run, name="iotc-connect", daemon=True).start()
+        return future
 
-            backoff_ms = random.randrange(1000, self.settings.connect_backoff_max_secs * 1000)
-            print("Retrying connection... Backing off for %d ms." % backoff_ms)
-            # Jitter back off a random number of milliseconds between 1 and 10 seconds.
-            time.sleep(backoff_ms / 1000)
+    def _connect(self):
+        if self.is_connected():
+            return
 
+        self._identity_refreshed = False
+        delay_secs = 0.0
+        for i in range(self.settings.connect_tries):
+            if self._disconnect_event.is_set():
+                logger.info("Disconnect requested. Not connecting.")
+                return
+            failure = self._connect_attempt()
+            if failure is None:
+                self._consecutive_rejections = 0
+                self._subscribe()
+                return
+            self._count_connect_failure(failure)
+            self._on_connect_attempt_failed(failure)
+            if i == self.settings.connect_tries - 1:
+                break
+            delay_secs = self._next_connect_delay(failure, delay_secs)
+            self._disconnect_event.wait(delay_secs)
+
+    def _subscribe(self):
+        if self._session_present:
+            # the broker kept our subscription, and is now delivering the messages queued while we were offline
+            logger.info("Resumed the persistent MQTT session.")
+            return
         self.mqtt.subscribe(self.mqtt_config.topics.c2d, qos=1)
 
+    def _count_connect_failure(self, failure: str):
+        self.metrics.connect_failures.inc(label=failure)
+        if failure in ConnectFailure.REJECTIONS:
+            self._consecutive_rejections += 1
+        else:
+            self._consecutive_rejections = 0
+
+    def _next_connect_delay(self, failure: str, previous_delay_secs: float) -> float:
+        policy = self.settings.reconnect_policy
+        delay_secs = policy.next_delay(failure, previous_delay_secs, self._consecutive_rejections)
+        if failure in ConnectFailure.REJECTIONS and policy.is_circuit_open(self._consecutive_rejections):
+            logger.warning("%d consecutive TLS or authentication failures. Waiting %.1f s before the next attempt.", self._consecutive_rejections, delay_secs)
+        else:
+            logger.info("Retrying connection... Backing off for %d ms.", delay_secs * 1000)
+        return delay_secs
+
+    def _connect_attempt(self) -> Optional[str]:
+        """ Makes a single connection attempt. Returns None on success, or the ConnectFailure classification. """
+        def abort_connection():
+            self.mqtt.disconnect()
+            if self._pool is None:
+                # Wait for the network thread to exit so that its late callbacks cannot affect the next attempt
+                self.mqtt.loop_stop()
+
+        def wait_for_connection() -> Optional[str]:
+            logger.debug("waiting to connect...")
+            deadline = time.monotonic() + self.settings.connect_timeout_secs
+            while True:
+                # The event will be set by the network thread on CONNACK or disconnect
+                if not self._connack_event.wait(max(0.0, deadline - time.monotonic())):
+                    logger.warning("Timed out.")
+                    abort_connection()
+                    return ConnectFailure.TIMEOUT
+                if self.is_connected() or self._connack_reason_code is not None or self.mqtt.socket() is None:
+                    break
+                # A late disconnect event from a previous connection. Keep waiting for this one.
+                self._connack_event.clear()
+            if not self.is_connected():
+                reason_code = self._connack_reason_code
+                logger.warning("Connection failed. Reason: %s", str(reason_code) if reason_code is not None else "Connection lost")
+                abort_connection()
+                return ConnectFailure.from_reason_code(reason_code)
+            logger.debug("MQTT connected")
+            return None
+
+        if self._pool is None:
+            # the network thread of the previous connection exits once the connection is lost. Does nothing if there is none.
+            self.mqtt.loop_stop()
+        if self._pending_identity is not None:
+            self._apply_identity(self._pending_identity)
+        try:
+            t = Timing()
+            self.metrics.connect_attempts.inc()
+            self._connack_event.clear()
+            self._connack_reason_code = None
+            mqtt_error = self.mqtt.connect(
+                host=self.mqtt_config.host,
+                port=self.mqtt_port
+            )
+            if mqtt_error != MQTTErrorCode.MQTT_ERR_SUCCESS:
+                logger.warning("TLS connection to the endpoint failed")
+                return ConnectFailure.REFUSED
+            logger.info("Awaiting MQTT connection establishment...")
+            if self._pool is None:
+                self.mqtt.loop_start()
+            failure = wait_for_connection()
+            if failure is None:
+                self.metrics.connect_time.observe(t.diff_now().total_seconds())
+                logger.info("Connected in %dms", t.diff_now().total_seconds() * 1000)
+            return failure
+
+        except (SSLError, TimeoutError, OSError) as ex:
+            # OSError includes socket.gaierror when host could not be resolved
+            # This could also be temporary, so keep trying
+            logger.warning("Failed to connect to host %s. Exception: %s", self.mqtt_config.host, str(ex))
+            return ConnectFailure.from_exception(ex)
+
+    def _start_reconnect(self):
+        if self._reconnect_thread is not None and self._reconnect_thread.is_alive():
+            return
+        self._reconnect_thread = threading.Thread(target=self._reconnect, name="iotc-reconnect", daemon=True)
+        self._reconnect_thread.start()
+
+    def _reconnect(self):
+        """ Runs in the background after an established connection was lost """
+        delay_secs = self.settings.reconnect_policy.first_delay()
+        logger.info("Reconnecting in %d ms...", delay_secs * 1000)
+        if self._disconnect_event.wait(delay_secs):
+            return
+        with self._connect_lock:
+            if not self._disconnect_event.is_set():
+                self._connect()
+
     def disconnect(self) -> MQTTErrorCode:
+        self._disconnect_event.set()
+        self.flush_telemetry()
         ret = self.mqtt.disconnect()
-        if self.settings.verbose:
-            print("Disconnected.")
+        logger.info("Disconnected.")
         return ret
 
-    def send_telemetry(self, values: dict[str, TelemetryValueType], timestamp: datetime = None):
+    def send_telemetry(self, values: dict[str, TelemetryValueType], timestamp: datetime = None, qos: Optional[int] = None):
         """ Sends a single telemetry dataset. 
         If you need gateway/child functionality or need to send multiple value sets in one packet, 
         use the send_telemetry_records() method.
@@ -246,13 +609,19 @@ class Client:
             If not provided, this will save bandwidth, as no timestamp will not be sent over MQTT.
              The server receipt timestamp will be applied to the telemetry values in this telemetry record.
              Supply this value (using Client.timestamp()) if you need more control over timestamps.
+        :param qos: (Optional) 0 or 1. Defaults to the telemetry_qos ClientSettings. See send_telemetry_records().
         """
         self.send_telemetry_records([TelemetryRecord(
             values=values,
             timestamp=timestamp
-        )])
+        )], qos=qos)
 
-    def send_telemetry_records(self, records: list[TelemetryRecord]) -> Optional[MQTTMessageInfo]:
+    def send_telemetry_records(
+            self,
+            records: list[Union[TelemetryRecord, CompactRecord]],
+            completion_cb: Optional[Callable[[PublishCompletion], None]] = None,
+            qos: Optional[int] = None
+    ) -> Optional[MQTTMessageInfo]:
         """
         A complex, but more powerful way to send telemetry.
         It allows the user to send multiple sets of telemetry values
@@ -261,23 +630,266 @@ class Client:
         the user to set the parent/child unique_id ("id" in JSON)
         and tag of respective parent./child ("tg" in JSON)
 
+        If the client is not connected and the outbox is enabled in ClientSettings,
+        the records will be stored and sent once the client connects.
+
+        If telemetry batching is enabled in ClientSettings, the records will be buffered and sent later
+        along with other records and this method will return None.
+
+        If a telemetry filter is set in ClientSettings, the unchanged values will be stripped from the records
+        and None will be returned if there is nothing left to send.
+
+        The number of messages awaiting an acknowledgement from the back end is limited
+        according to the max_inflight_messages, max_queued_bytes and backpressure_policy ClientSettings.
+        None is returned if the message was dropped because of that.
+
+        Messages sent with QoS 0 take a fast lane: they are published immediately and are not acknowledged
+        by the back end, so they are not subject to batching, the outbox or the in-flight message limits.
+        They are dropped if the client is not connected or if the connection is lost while sending.
+        Use QoS 0 for high-rate data where an occasional lost sample does not matter, and QoS 1 for critical records.
+        To send a whole stream with QoS 0, for example from a TelemetryAggregator,
+        pass functools.partial(client.send_telemetry_records, qos=0) as its callback.
+
+        :param records: The telemetry records to send. CompactRecord objects can be used in place of TelemetryRecord.
+        :param completion_cb: (Optional) Called with a PublishCompletion once the back end acknowledges the message.
+            The callback is usually invoked on the MQTT network thread (or on the sending thread if the PUBACK
+            arrives before the send returns), so it should return quickly.
+            It is not invoked if the records were stored into the outbox, buffered for batching or dropped,
+            or if they were sent with QoS 0.
+        :param qos: (Optional) 0 or 1. Defaults to the telemetry_qos ClientSettings.
+
         See https://docs.iotconnect.io/iotconnect/sdk/message-protocol/device-message-2-1/d2c-messages/#Device for more information.
         """
 
-        if not self.is_connected():
-            print('Message NOT sent. Not connected!')
+        telemetry_filter = self.settings.telemetry_filter
+        if telemetry_filter is not None:
+            # the values are recorded as sent only once they are published, buffered or stored,
+            # so that a dropped value is not suppressed by the deadband next time
+            records = telemetry_filter.filter_records(records, commit=False)
+            if len(records) == 0:
+                logger.debug("No telemetry values have changed. Nothing to send.")
+                return None
+
+        ret = None
+        if self._resolve_qos(qos) == 0:
+            if not self.is_connected():
+                log_rate_limited(logger, logging.WARNING, 'Message NOT sent. Not connected!')
+                return None
+            start = time.perf_counter()
+            packet = self._encode_telemetry_records(records)
+            self.metrics.encode_time.observe(time.perf_counter() - start)
+            ret = self._publish_telemetry_packet(packet, qos=0)
+            if ret.rc != MQTTErrorCode.MQTT_ERR_SUCCESS:
+                return ret
+        elif self._batcher is not None:
+            self._batcher.add(records)
+        elif not self.is_connected():
+            if self.outbox is None:
+                log_rate_limited(logger, logging.WARNING, 'Message NOT sent. Not connected!')
+                return None
+            self.outbox.put(records)
+            logger.debug("Not connected. Stored %d record(s) in the outbox.", len(records))
+        else:
+            start = time.perf_counter()
+            packet = self._encode_telemetry_records(records)
+            self.metrics.encode_time.observe(time.perf_counter() - start)
+            ret = self._publish_telemetry_packet(packet, completion_cb)
+            if ret is None or ret.rc not in (MQTTErrorCode.MQTT_ERR_SUCCESS, MQTTErrorCode.MQTT_ERR_NO_CONN):
+                return ret
+
+        if telemetry_filter is not None:
+            telemetry_filter.commit_records(records)
+        return ret
+
+    @classmethod
+    def _encode_telemetry_records(cls, records: list[Union[TelemetryRecord, CompactRecord]]) -> str:
+        if any(type(r) is CompactRecord for r in records):
+            return encode_telemetry_packet([encode_telemetry_entry(r) for r in records])
+        return encode_telemetry_records(records)
+
+    def send_telemetry_schema(
+            self,
+            schema: TelemetrySchema,
+            values: Union[dict, Any],
+            timestamp: datetime = None,
+            completion_cb: Optional[Callable[[PublishCompletion], None]] = None,
+            qos: Optional[int] = None
+    ) -> Optional[MQTTMessageInfo]:
+        """
+        Sends a single telemetry dataset encoded with a compiled TelemetrySchema.
+        This is faster than send_telemetry() when the same shape of data is sent repeatedly.
+        Behaves the same as send_telemetry_records() with respect to the outbox, batching, flow control and QoS,
+        but the telemetry filter is not applied, because the schema always sends all of its attributes.
+
+        :param schema: The schema created with TelemetrySchema.from_dataclass() or TelemetrySchema.from_device_template().
+        :param values: An instance of the schema dataclass or a dictionary of values.
+        :param timestamp: (Optional) The timestamp corresponding to this dataset.
+        :param completion_cb: (Optional) See send_telemetry_records().
+        :param qos: (Optional) See send_telemetry_records().
+        """
+        qos = self._resolve_qos(qos)
+        if qos == 0 and not self.is_connected():
+            log_rate_limited(logger, logging.WARNING, 'Message NOT sent. Not connected!')
             return None
+        if qos == 0 or (self._batcher is None and self.is_connected()):
+            start = time.perf_counter()
+            packet = schema.encode_packet(values, timestamp)
+            self.metrics.encode_time.observe(time.perf_counter() - start)
+            return self._publish_telemetry_packet(packet, completion_cb, qos)
+
+        # buffered or stored records need to retain the time when they were recorded
+        if timestamp is None:
+            timestamp = datetime.now(timezone.utc)
+        entries = [(int(timestamp.timestamp() * 1000), schema.encode_entry(values, timestamp))]
+        if self._batcher is not None:
+            self._batcher.add_entries(entries)
         else:
-            packet = encode_telemetry_records(records)
+            self._send_telemetry_entries(entries)
+        return None
+
+    def send_telemetry_columns(
+            self,
+            timestamps_ns: Sequence[int],
+            columns: dict[str, Sequence],
+            unique_id: Optional[str] = None,
+            tag: Optional[str] = None,
+            qos: Optional[int] = None
+    ) -> list[MQTTMessageInfo]:
+        """
+        Sends a block of samples stored as columns: one sequence of timestamps and one sequence of values per attribute.
+        Each row becomes a timestamped telemetry record, but the rows are encoded straight into packets
+        without creating a record, dictionary or datetime for each of them, which makes this the fastest way
+        to send buffered high-rate data. For example:
+
+            client.send_telemetry_columns(
+                timestamps_ns=[t0, t0 + 1_000_000, t0 + 2_000_000],
+                columns={'vibration': [0.12, 0.15, 0.11], 'rpm': [1480, 1482, 1481]}
+            )
+
+        The columns can be lists, tuples, array.array or NumPy arrays. A None or NaN value means
+        that the attribute has no value in that row, and rows without any values are skipped.
+        The rows are split into as many packets as needed to stay within the platform maximum packet size.
+        Behaves the same as send_telemetry_records() with respect to the outbox, batching, flow control and QoS,
+        but the telemetry filter is not applied.
+
+        :param timestamps_ns: Time of each row as nanoseconds since the epoch, for example from time.time_ns().
+            The timestamps are sent with millisecond precision.
+        :param columns: Sequences of values by attribute name. Each must have the same length as timestamps_ns.
+        :param unique_id: (Optional) Unique ID of the child device, for gateway devices.
+        :param tag: (Optional) Tag of the child device, for gateway devices.
+        :param qos: (Optional) See send_telemetry_records().
+        :return: The published messages. The list is empty if the rows were stored into the outbox, buffered or dropped.
+        """
+        qos = self._resolve_qos(qos)
+        start = time.perf_counter()
+        entries = encode_telemetry_columns(timestamps_ns, columns, unique_id, tag)
+        self.metrics.encode_time.observe(time.perf_counter() - start)
+        if len(entries) == 0:
+            return []
+        if qos == 1 and self._batcher is not None:
+            self._batcher.add_entries(entries)
+            return []
+        return self._send_telemetry_entries(entries, qos)
+
+    def flush_telemetry(self):
+        """ Sends any records buffered by telemetry batching immediately """
+        if self._batcher is not None:
+            self._batcher.flush()
+
+    def _resolve_qos(self, qos: Optional[int]) -> int:
+        if qos is None:
+            return self.settings.telemetry_qos
+        if qos not in (0, 1):
+            raise ValueError("qos must be 0 or 1")
+        return qos
+
+    def _publish_telemetry_packet(
+            self,
+            packet: Union[str, bytes],
+            completion_cb: Optional[Callable[[PublishCompletion], None]] = None,
+            qos: int = 1
+    ) -> Optional[MQTTMessageInfo]:
+        if qos == 0:
+            # nothing to wait for, so no flow control or tracking
             ret = self.mqtt.publish(
                 topic=self.mqtt_config.topics.rpt,
-                qos=1,
+                qos=0,
                 payload=packet
             )
-            if self.settings.verbose:
-                print(">", packet)
-            return ret
+        else:
+            # Blocking on the network thread would prevent the PUBACKs that we are waiting for from being processed
+            if not self.publish_tracker.acquire(len(packet), can_block=not self._is_network_thread()):
+                log_rate_limited(logger, logging.WARNING, "Message NOT sent. Too many messages are awaiting acknowledgement.")
+                self.metrics.publish_dropped.inc()
+                return None
+            start_time = time.monotonic()
+            tracked = False
+
+            def track(info: MQTTMessageInfo) -> None:
+                nonlocal tracked
+                self.publish_tracker.track(info.mid, len(packet), start_time, completion_cb)
+                tracked = True
+
+            try:
+                ret = self._publish_registered(self.mqtt_config.topics.rpt, packet, track)
+            finally:
+                if not tracked:
+                    self.publish_tracker.release(len(packet))
+        self.metrics.publish_count.inc(label="telemetry")
+        self.metrics.publish_bytes.inc(len(packet), label="telemetry")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("> %s", packet if isinstance(packet, str) else packet.decode(), extra={"topic": self.mqtt_config.topics.rpt, "size": len(packet)})
+        return ret
 
+    def _publish_registered(self, topic: str, payload: Union[str, bytes], register: Callable[[MQTTMessageInfo], None]) -> MQTTMessageInfo:
+        """
+        Publishes a QoS 1 message and calls register with its MQTTMessageInfo, so that its PUBACK can be matched.
+        The PUBACK may be processed on the network thread before publish() returns. paho calls on_publish
+        while holding its own lock, which it also takes in publish(), so on_publish cannot wait for the registration.
+        Such a PUBACK is recorded in _early_pubacks instead, and handled here once the message is registered.
+        """
+        with self._publish_lock:
+            self._publishes_in_progress += 1
+        start_time = time.monotonic()
+        ret = None
+        early = None
+        try:
+            ret = self.mqtt.publish(topic=topic, qos=1, payload=payload)
+        finally:
+            with self._publish_lock:
+                self._publishes_in_progress -= 1
+                if ret is not None:
+                    early = self._early_pubacks.pop(ret.mid, None)
+                    # paho keeps QoS 1 messages published while disconnected and sends them once reconnected
+                    if ret.rc in (MQTTErrorCode.MQTT_ERR_SUCCESS, MQTTErrorCode.MQTT_ERR_NO_CONN):
+                        register(ret)
+                if self._publishes_in_progress == 0:
+                    self._early_pubacks.clear()  # PUBACKs of messages that are not registered, like QoS 0 messages
+        # the message ID may have been used by an earlier message, whose PUBACK arrived before this one was published
+        if early is not None and early[0] >= start_time:
+            self._handle_puback(ret.mid, early[1])
+        return ret
+
+    def _is_network_thread(self) -> bool:
+        if self._pool is not None:
+            return self._pool._is_io_thread()
+        return threading.current_thread() is self._network_thread
+
+    def _send_telemetry_entries(self, entries: list[tuple[int, str]], qos: int = 1) -> list[MQTTMessageInfo]:
+        """ Sends records encoded with stamp_and_encode_entries(), splitting them into packets if needed """
+        if not self.is_connected():
+            if self.outbox is not None and qos == 1:
+                self.outbox.put_entries(entries)
+                logger.debug("Not connected. Stored %d record(s) in the outbox.", len(entries))
+            else:
+                log_rate_limited(logger, logging.WARNING, '%d record(s) NOT sent. Not connected!', len(entries))
+            return []
+        ret = []
+        for group in split_telemetry_entries([e[1] for e in entries], self.max_packet_size):
+            info = self._publish_telemetry_packet(encode_telemetry_packet(group), qos=qos)
+            if info is not None:
+                ret.append(info)
+        return ret
 
     def send_command_ack(self, original_message: C2dCommand, status: int, message_str = None):
         """
@@ -289,7 +901,7 @@ class Client:
         """
 
         if original_message.type != C2dMessage.COMMAND:
-            print('Error: Called send_command_ack(), but message is not a command!')
+            logger.error('Called send_command_ack(), but message is not a command!')
             return
         self.send_ack(
             ack_id=original_message.ack_id,
@@ -310,7 +922,7 @@ class Client:
         :param message_str: (Optional) For example: "Failed to unzip the OTA package".
         """
         if original_message.type != C2dMessage.OTA:
-            print('Error: Called send_ota_ack(), but message is not an OTA request!')
+            logger.error('Called send_ota_ack(), but message is not an OTA request!')
             return
         self.send_ack(
             ack_id=original_message.ack_id,
@@ -332,32 +944,168 @@ class Client:
 
         While the client should generally use send_ota_ack or send_command_ack, this method can be used in cases
         where the context of the original received message is not available (after OTA restart for example)
+
+        If the ACK outbox is enabled in ClientSettings, the ACK is stored until the back end acknowledges it,
+        and if the client is not connected, it is sent once the client connects and None is returned.
         """
-        if not self.is_connected():
-            print('Message NOT sent. Not connected!')
-        elif ack_id is None or len(ack_id) == 0:
+        if ack_id is None or len(ack_id) == 0:
             if original_command is not None:
-                print('Error: Message ACK ID missing. Ensure to set "Acknowledgement Required" in the template for command %s!' % original_command)
+                logger.error('Message ACK ID missing. Ensure to set "Acknowledgement Required" in the template for command %s!', original_command)
             else:
-                print('Error: Message ACK ID missing. Ensure to set "Acknowledgement Required" in the template the command!' % original_command)
+                logger.error('Message ACK ID missing. Ensure to set "Acknowledgement Required" in the template the command!')
             return
         elif message_type not in (C2dMessage.COMMAND, C2dMessage.OTA):
-            print('Warning: Message type %d does not appear to be a valid message type!' % message_type)  # let it pass, just in case we can still somehow send different kind of ack
+            logger.warning('Message type %d does not appear to be a valid message type!', message_type)  # let it pass, just in case we can still somehow send different kind of ack
         elif message_type == C2dMessage.COMMAND and not C2dAck.is_valid_cmd_status(status):
-            print('Warning: Status %d does not appear to be a valid command ACK status!' % status) # let it pass, just in case there is a new status
+            logger.warning('Status %d does not appear to be a valid command ACK status!', status) # let it pass, just in case there is a new status
         elif message_type == C2dMessage.OTA and not C2dAck.is_valid_ota_status(status):
-            print('Warning: Status %d does not appear to be a valid OTA ACK status!' % status) # let it pass, just in case there is a new status
+            logger.warning('Status %d does not appear to be a valid OTA ACK status!', status) # let it pass, just in case there is a new status
 
+        if self.ack_outbox is not None:
+            # stored before publishing, so that it is sent after a restart even if the application exits right after this call
+            entry = self.ack_outbox.put(ack_id, message_type, status, message_str)
+            if not self.is_connected():
+                logger.debug("Not connected. Stored the ACK for %s in the ACK outbox.", ack_id)
+                return None
+            return self._publish_ack(ack_id, message_type, status, message_str, entry)
+
+        if not self.is_connected():
+            log_rate_limited(logger, logging.WARNING, 'Message NOT sent. Not connected!')
+        return self._publish_ack(ack_id, message_type, status, message_str)
+
+    def _publish_ack(self, ack_id: str, message_type: int, status: int, message_str: Optional[str], entry: Optional["AckOutboxEntry"] = None) -> MQTTMessageInfo:
+        """ Publishes the ACK. If it was stored in the ACK outbox, pass the entry to have it removed once acknowledged. """
         packet = encode_c2d_ack(ack_id, message_type, status, message_str)
-        ret = self.mqtt.publish(
-            topic=self.mqtt_config.topics.ack,
-            qos=1,
-            payload=packet
-        )
-        if self.settings.verbose:
-            print(">", packet)
+        if entry is None:
+            ret = self.mqtt.publish(
+                topic=self.mqtt_config.topics.ack,
+                qos=1,
+                payload=packet
+            )
+        else:
+            ret = self._publish_registered(self.mqtt_config.topics.ack, packet, lambda info: self._pending_acks.update({info.mid: entry}))
+        self.metrics.publish_count.inc(label="ack")
+        self.metrics.publish_bytes.inc(len(packet), label="ack")
+        logger.debug("> %s", packet, extra={"topic": self.mqtt_config.topics.ack, "size": len(packet)})
         return ret
 
+    def _flush_ack_outbox(self):
+        with self._publish_lock:
+            # paho resends the ACKs that were published before the connection was lost by itself
+            pending_row_ids = set(e.row_id for e in self._pending_acks.values())
+        entries = [e for e in self.ack_outbox.peek() if e.row_id not in pending_row_ids]
+        for entry in entries:
+            self._publish_ack(entry.ack_id, entry.message_type, entry.status, entry.message_str, entry)
+        if len(entries) > 0:
+            logger.info("Sent %d ACK(s) from the ACK outbox", len(entries))
+
+    def _load_identity(self) -> DeviceIdentityData:
+        cached = None
+        if self._identity_cache is not None:
+            cached = self._identity_cache.get(self.device_properties)
+            if cached is not None and not cached.is_expired:
+                logger.info("Using cached identity data for host %s", cached.identity.host)
+                self._identity_from_cache = True
+                threading.Thread(target=self._refresh_identity, name="iotc-identity-refresh", daemon=True).start()
+                return cached.identity
+        try:
+            return self._fetch_identity()
+        except DeviceConfigError as ex:
+            if cached is None:
+                raise
+            # The REST API could be temporarily unavailable, so try with the (expired) data that we have
+            logger.warning("Identity REST API request failed (%s). Using expired cached identity data.", str(ex))
+            self._identity_from_cache = True
+            return cached.identity
+
+    def _fetch_identity(self) -> DeviceIdentityData:
+        identity = DeviceRestApi(self.device_properties, verbose=self.settings.verbose).get_identity_data()  # can raise DeviceConfigError
+        if self._identity_cache is not None:
+            try:
+                self._identity_cache.put(self.device_properties, identity)
+            except OSError as ex:
+                logger.warning("Failed to store the identity data to %s: %s", self._identity_cache.path, str(ex))
+        return identity
+
+    def _refresh_identity(self):
+        """ Runs in the background after starting with cached identity data """
+        try:
+            identity = self._fetch_identity()
+        except DeviceConfigError as ex:
+            logger.warning("Background identity data refresh failed: %s", str(ex))
+            return
+        self._identity_from_cache = False
+        if not IdentityCache.is_same_identity(identity, self.mqtt_config):
+            logger.info("Device identity data has changed. It will be applied on the next connect.")
+            self._pending_identity = identity
+
+    def _apply_identity(self, identity: DeviceIdentityData):
+        self._pending_identity = None
+        self.mqtt_config = identity
+        # paho refuses to update the username unless the connection is fully closed (after a failed attempt for example)
+        self.mqtt.disconnect()
+        self.mqtt.username = identity.username
+        # paho does not provide a client ID setter. reinitialise() would discard our TLS and callback setup
+        # (and passes its arguments to the 2.x constructor in the wrong order), and a new paho client would lose
+        # the QoS 1 messages that are waiting to be resent. The paho-mqtt version is capped in pyproject.toml for this.
+        self.mqtt._client_id = identity.client_id.encode("utf-8")
+
+    def _on_connect_attempt_failed(self, failure: str):
+        # Timeouts and refused connections are usually transient, so we keep using the same identity data.
+        # Other failures can mean that the host or the client ID have changed, so get fresh data, once per connect() call.
+        if failure not in ConnectFailure.IDENTITY_RELATED or self._identity_refreshed:
+            return
+        self._identity_refreshed = True
+        if self._identity_from_cache:
+            # the cached data may be stale (different host, credentials...) so discard it
+            logger.warning("Connection failed while using cached identity data. Refreshing the identity data...")
+            try:
+                self._identity_cache.invalidate(self.device_properties)
+            except OSError as ex:
+                # the fresh data will replace it if it can be stored
+                logger.warning("Failed to invalidate the identity data in %s: %s", self._identity_cache.path, str(ex))
+            self._identity_from_cache = False
+        else:
+            logger.info("Refreshing the identity data...")
+        try:
+            identity = self._fetch_identity()
+        except DeviceConfigError as ex:
+            logger.error("Identity data refresh failed: %s", str(ex))
+            return
+        if not IdentityCache.is_same_identity(identity, self.mqtt_config):
+            self._pending_identity = identity
+            # the rejections were caused by the old identity, so they should not open the circuit breaker
+            self._consecutive_rejections = 0
+
+    def _start_outbox_drain(self):
+        if self._outbox_drain_thread is not None and self._outbox_drain_thread.is_alive():
+            return
+        # Cannot drain on paho's network thread, as we need to wait for the PUBACKs
+        self._outbox_drain_thread = threading.Thread(target=self._drain_outbox, name="iotc-outbox-drain", daemon=True)
+        self._outbox_drain_thread.start()
+
+    def _drain_outbox(self):
+        batch_size = min(self.settings.outbox_drain_records_per_sec, Client.OUTBOX_DRAIN_BATCH_SIZE)
+        batch_interval_secs = batch_size / self.settings.outbox_drain_records_per_sec
+        while self.is_connected():
+            entries = self.outbox.peek(batch_size)
+            if len(entries) == 0:
+                return
+            batch_start = time.monotonic()
+            info = self._publish_telemetry_packet(encode_telemetry_packet([e.entry for e in entries]))
+            if info is None:
+                return  # dropped by flow control. We will try again after the next connect.
+            try:
+                info.wait_for_publish(timeout=self.settings.connect_timeout_secs)
+            except (RuntimeError, ValueError):
+                pass  # not connected or the queue is full. We will try again after the next connect.
+            if not info.is_published():
+                return
+            # records are removed only once the back end acknowledged them
+            self.outbox.remove(entries)
+            logger.info("Sent %d record(s) from the outbox", len(entries))
+            time.sleep(max(0.0, batch_interval_secs - (time.monotonic() - batch_start)))
+
     def _process_c2d_message(self, topic: str, payload: str) -> bool:
         # topic is ignored for now as we only subscribe to one
         # we ought to change this once we start supporting Properties (Twin/Shadow)
@@ -366,74 +1114,162 @@ class Client:
             # convert message to appropriate json later
 
             decoding_result = decode_c2d_message(payload)
-            generic_message = decoding_result.generic_message
-            # if the user wants to handle this message type, stop processing further
-            generic_cb = self.user_callbacks.generic_message_callbacks.get(generic_message.type)
-            if generic_cb is not None:
-                generic_cb(generic_message, decoding_result.raw_message)
+        except C2DDecodeError:
+            logger.error('C2D Parsing Error: "%s"', payload)
+            self.metrics.c2d_decode_failures.inc()
+            return False
+
+        self.metrics.c2d_messages.inc(label=str(decoding_result.generic_message.type))
+        dedup_key = None
+        if self.settings.c2d_deduplicator is not None:
+            dedup_key = self._c2d_dedup_key(decoding_result, payload)
+            if dedup_key is not None and self._is_duplicate_c2d_message(decoding_result, dedup_key):
                 return True
+        if self._c2d_dispatcher is not None:
+            # with the "drop_oldest" policy, the dropped message is an earlier one, so each message reports its own drop
+            self._c2d_dispatcher.submit(
+                decoding_result.generic_message.type, self._timed_dispatch_c2d_message, decoding_result, payload,
+                dropped_cb=functools.partial(self._c2d_message_dropped, decoding_result, dedup_key)
+            )
+        else:
+            self._timed_dispatch_c2d_message(decoding_result, payload)
+        return True
+
+    def _c2d_message_dropped(self, decoding_result: C2DDecodeResult, dedup_key: Optional[str]) -> None:
+        log_rate_limited(logger, logging.WARNING, "C2D message queue is full. A message of type %d was dropped.", decoding_result.generic_message.type)
+        if dedup_key is not None:
+            # forget the dropped message, so that it is processed if the broker delivers it again
+            self.settings.c2d_deduplicator.discard(dedup_key)
+
+    @classmethod
+    def _c2d_dedup_key(cls, decoding_result: C2DDecodeResult, payload) -> Optional[str]:
+        # only commands and OTA requests trigger actions on the device. Other messages are cheap to process again.
+        message = decoding_result.command or decoding_result.ota
+        if message is None:
+            return None
+        return C2dDeduplicator.key_for(message.ack_id, payload)
+
+    def _is_duplicate_c2d_message(self, decoding_result: C2DDecodeResult, key: str) -> bool:
+        if not self.settings.c2d_deduplicator.check_and_add(key):
+            return False
+        logger.info("Ignoring a redelivered %s message (%s)", decoding_result.generic_message.type_description, key)
+        self.metrics.c2d_duplicates.inc(label=str(decoding_result.generic_message.type))
+        return True
 
-            if decoding_result.command is not None:
+    def _timed_dispatch_c2d_message(self, decoding_result: C2DDecodeResult, payload: str):
+        start = time.perf_counter()
+        try:
+            self._dispatch_c2d_message(decoding_result, payload)
+        finally:
+            self.metrics.c2d_callback_time.observe(time.perf_counter() - start)
+
+    def _dispatch_c2d_message(self, decoding_result: C2DDecodeResult, payload: str):
+        """ Invokes the user callbacks for a successfully decoded C2D message """
+        generic_message = decoding_result.generic_message
+        # if the user wants to handle this message type, stop processing further
+        generic_cb = self.user_callbacks.generic_message_callbacks.get(generic_message.type)
+        if generic_cb is not None:
+            generic_cb(generic_message, decoding_result.raw_message)
+            return
+
+        if decoding_result.command is not None:
 #               TODO: Deal with runtime qualification
 #               if msg.command_name == 'aws-qualification-start':
 #                    self._aws_qualification_start(msg.command_args)
 #                elif self.user_callbacks.command_cb is not None:
-                if self.user_callbacks.command_cb is not None:
-                    self.user_callbacks.command_cb(decoding_result.command)
-                else:
-                    if self.settings.verbose:
-                        print("WARN: Unhandled command %s received!" % decoding_result.command.command_name)
-            elif decoding_result.ota is not None:
-                if self.user_callbacks.ota_cb is not None:
-                    self.user_callbacks.ota_cb(decoding_result.ota)
-                else:
-                    if self.settings.verbose:
-                        print("WARN: Unhandled OTA request received!")
-            elif generic_message.is_fatal:
-                print("Received C2D message %s from backend. Device should stop operation." % generic_message.type_description)
-            elif generic_message.needs_refresh:
-                print("Received C2D message %s from backend. Device should re-initialize the application." % generic_message.type_description)
-            elif generic_message.heartbeat_operation is not None:
-                operation_str = "start" if generic_message.heartbeat_operation == True else "stop"
-                print("Received C2D message %s from backend. Device should %s heartbeat messages." % (generic_message.type_description, operation_str))
+            if self.user_callbacks.command_cb is not None:
+                self.user_callbacks.command_cb(decoding_result.command)
             else:
-                print("C2D Message parsing for message type %d is not supported by this client. Message was: %s" % (generic_message.ct, payload))
-            return True
-
-        except C2DDecodeError:
-            print('C2D Parsing Error: "%s"' % payload)
-            return False
+                logger.warning("Unhandled command %s received!", decoding_result.command.command_name)
+        elif decoding_result.ota is not None:
+            if self.user_callbacks.ota_cb is not None:
+                self.user_callbacks.ota_cb(decoding_result.ota)
+            else:
+                logger.warning("Unhandled OTA request received!")
+        elif generic_message.is_fatal:
+            logger.warning("Received C2D message %s from backend. Device should stop operation.", generic_message.type_description)
+        elif generic_message.needs_refresh:
+            logger.warning("Received C2D message %s from backend. Device should re-initialize the application.", generic_message.type_description)
+        elif generic_message.heartbeat_operation is not None:
+            operation_str = "start" if generic_message.heartbeat_operation == True else "stop"
+            logger.info("Received C2D message %s from backend. Device should %s heartbeat messages.", generic_message.type_description, operation_str)
+        else:
+            logger.warning("C2D Message parsing for message type %d is not supported by this client. Message was: %s", generic_message.ct, payload)
 
     def _on_mqtt_connect(self, mqttc: PahoClient, obj, flags, reason_code, properties):
-        if self.settings.verbose:
-            print("Connected. Reason Code: " + str(reason_code))
+        # the network thread is started for each connection, and CONNACK is its first callback
+        self._network_thread = threading.current_thread()
+        logger.info("Connected. Reason Code: %s", reason_code)
+        tls = self._tls_session_cache
+        if tls.last_handshake_secs is not None:
+            self.metrics.tls_handshake_time.observe(tls.last_handshake_secs)
+            if tls.last_session_reused:
+                self.metrics.tls_session_resumptions.inc()
+            logger.debug("TLS handshake took %dms%s", tls.last_handshake_secs * 1000, " (session resumed)" if tls.last_session_reused else "")
+            tls.last_handshake_secs = None
+        if not reason_code.is_failure:
+            # the session tickets have arrived by the time CONNACK is received
+            tls.save_session(mqttc.socket())
+        self._connack_reason_code = reason_code
+        self._session_present = not reason_code.is_failure and flags.session_present
+        self._connack_event.set()
+        if not reason_code.is_failure:
+            if self._has_connected:
+                self.metrics.reconnects.inc()
+            self._has_connected = True
+        if not reason_code.is_failure and self.ack_outbox is not None:
+            self._flush_ack_outbox()  # before any stored telemetry
+        if not reason_code.is_failure and self.outbox is not None:
+            self._start_outbox_drain()
 
     def _on_mqtt_disconnect(self, mqttc: PahoClient, obj, flags: DisconnectFlags, reason_code: ReasonCode, properties):
+        self._connack_event.set()  # wake up connect() if the connection was lost before CONNACK
+        # connect() is holding the lock while it handles its own failed attempts
+        if self.settings.auto_reconnect and not self._disconnect_event.is_set() and not self._connect_lock.locked():
+            self._start_reconnect()
+        self.metrics.disconnects.inc(label=str(reason_code))
         if self.user_callbacks.disconnected_cb is not None:
             # cannot send raw reason code from paho. We could technically change the backend.
             self.user_callbacks.disconnected_cb(str(reason_code), flags.is_disconnect_packet_from_server)
         else:
-            print("Disconnected. Reason: %s. Flags: %s" % (str(reason_code), str(flags)))
+            logger.log(logging.WARNING if reason_code.is_failure else logging.INFO, "Disconnected. Reason: %s. Flags: %s", reason_code, flags)
 
     def _on_mqtt_message(self, mqttc: PahoClient, obj, msg):
-        if self.settings.verbose:
-            print(msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("< %s %d %s", msg.topic, msg.qos, msg.payload, extra={"topic": msg.topic, "size": len(msg.payload)})
         self._process_c2d_message(msg.topic, msg.payload)
 
     def _on_mqtt_publish(self, mqttc: PahoClient, obj, mid, reason_code, properties):
-        # print("mid: " + str(mid))
-        pass
+        with self._publish_lock:
+            if self._publishes_in_progress > 0 and mid not in self._pending_acks and not self.publish_tracker.is_tracked(mid):
+                # the message may not be registered yet. See _publish_registered().
+                self._early_pubacks[mid] = (time.monotonic(), reason_code)
+                return
+        self._handle_puback(mid, reason_code)
+
+    def _handle_puback(self, mid: int, reason_code: ReasonCode):
+        completion = self.publish_tracker.complete(mid, not reason_code.is_failure, str(reason_code))
+        if completion is not None:
+            self.metrics.puback_latency.observe(completion.latency_secs)
+            return
+        with self._publish_lock:
+            ack = self._pending_acks.pop(mid, None)
+        if ack is not None:
+            if reason_code.is_failure:
+                # resending would be rejected again
+                logger.warning("ACK for %s was rejected by the broker: %s", ack.ack_id, reason_code)
+            self.ack_outbox.remove(ack)
 
     def _aws_qualification_start(self, command_args: list[str]):
         t = Timing()
 
         def log_callback(client, userdata, level, buf):
-            print("%d [%s]: %s" % (t.diff_now().microseconds / 1000, str(level), buf))
+            logger.debug("%d [%s]: %s", t.diff_now().microseconds / 1000, level, buf)
             t.reset(False)
 
         if len(command_args) >= 1:
             host = command_args[0]
-            print("Starting AWS Device Qualification for", host)
+            logger.info("Starting AWS Device Qualification for %s", host)
             self.mqtt_config.topics.rpt = 'qualification'
             self.mqtt_config.topics.c2d = 'qualification'
             self.mqtt_config.topics.ack = 'qualification'
@@ -443,12 +1279,12 @@ class Client:
             while True:
                 connected_time = Timing()
                 if not self.is_connected():
-                    print('(re)connecting to', self.mqtt_config.host)
+                    logger.info('(re)connecting to %s', self.mqtt_config.host)
                     self.connect()
                     connected_time.reset(False)  # reset the timer
                 else:
                     if connected_time.diff_now().seconds > 60:
-                        print("Stayed connected for too long. resetting the connection")
+                        logger.info("Stayed connected for too long. resetting the connection")
                         self.disconnect()
                         continue
                     self.send_telemetry({
@@ -457,4 +1293,4 @@ class Client:
                 time.sleep(5)
 
         else:
-            print("Malformed AWS qualification command. Missing command argument!")
+            logger.error("Malformed AWS qualification command. Missing command argument!")
@@ -0,0 +1,83 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+# Encodes blocks of samples stored as columns (one sequence of timestamps and one sequence of values per attribute)
+# directly into telemetry packet entries, without creating a TelemetryRecord, dictionary or datetime for each row.
+# The output is identical to encode_telemetry_records() from the sdklib for the same data.
+
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable, Optional, Sequence
+
+from .schema import _encode_any, _encode_bool, _encode_number, _encode_string
+from .telemetry import to_iotconnect_time_str_ms
+
+
+def _to_list(column) -> list:
+    # NumPy arrays and array.array convert all of their elements to Python objects in one call
+    tolist = getattr(column, "tolist", None)
+    return tolist() if tolist is not None else list(column)
+
+
+def _encoder_for_column(values: list) -> Callable[[Any], str]:
+    for v in values:
+        if v is None:
+            continue
+        t = type(v)
+        if t is bool:
+            return _encode_bool
+        if t is int or t is float:
+            return _encode_number
+        if t is str:
+            return _encode_string
+        return _encode_any
+    return _encode_any
+
+
+def _encode_column(name: str, values: list) -> list[Optional[str]]:
+    """ Returns the '"name":value' fragment of each row, or None where the value is missing (None or NaN) """
+    fragment = encode_basestring_ascii(name) + ':'
+    encoder = _encoder_for_column(values)
+    # v != v is True only for NaN
+    return [None if v is None or v != v else fragment + encoder(v) for v in values]
+
+
+def _encode_timestamps(timestamps_ns: list) -> tuple[list[int], list[str]]:
+    """ Returns the epoch milliseconds and the encoded "dt" values """
+    millis = [int(ns) // 1000000 for ns in timestamps_ns]
+    return millis, ['"' + to_iotconnect_time_str_ms(ms) + '"' for ms in millis]
+
+
+def encode_telemetry_columns(
+        timestamps_ns: Sequence[int],
+        columns: dict[str, Sequence],
+        unique_id: Optional[str] = None,
+        tag: Optional[str] = None
+) -> list[tuple[int, str]]:
+    """
+    Encodes rows of columnar data into (epoch milliseconds timestamp, entry) pairs,
+    like stamp_and_encode_entries() does for records. See Client.send_telemetry_columns().
+    """
+    timestamps = _to_list(timestamps_ns)
+    encoded_columns = []
+    for name, column in columns.items():
+        values = _to_list(column)
+        if len(values) != len(timestamps):
+            raise ValueError("Column \"%s\" has %d values, but there are %d timestamps" % (name, len(values), len(timestamps)))
+        encoded_columns.append(_encode_column(name, values))
+    millis, encoded_timestamps = _encode_timestamps(timestamps)
+
+    suffix = ''
+    if unique_id is not None:
+        suffix += ',"id":' + encode_basestring_ascii(unique_id)
+    if tag is not None:
+        suffix += ',"tg":' + encode_basestring_ascii(tag)
+    suffix += '}'
+
+    entries = []
+    for ms, dt, row in zip(millis, encoded_timestamps, zip(*encoded_columns)):
+        parts = [p for p in row if p is not None]
+        if len(parts) == 0:
+            continue  # every value of this row is missing
+        entries.append((ms, '{"d":{' + ','.join(parts) + '},"dt":' + dt + suffix))
+    return entries
@@ -0,0 +1,145 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import copy
+import threading
+import time
+from typing import Optional
+
+from avnet.iotconnect.sdk.sdklib.mqtt import TelemetryRecord, TelemetryValueType
+
+from .record import CompactRecord
+
+
+class Deadband:
+    """
+    Change thresholds for a numeric telemetry attribute.
+    A value is sent when its difference from the last sent value exceeds either of the configured thresholds.
+    If no threshold is configured, the value is sent whenever it changes.
+
+    :param absolute: Absolute change threshold, in the attribute's units.
+    :param percent: Change threshold as a percentage of the last sent value.
+    """
+
+    def __init__(self, absolute: Optional[float] = None, percent: Optional[float] = None):
+        if absolute is not None and absolute < 0:
+            raise ValueError("absolute must not be negative")
+        if percent is not None and percent < 0:
+            raise ValueError("percent must not be negative")
+        self.absolute = absolute
+        self.percent = percent
+
+    def is_exceeded(self, last: float, value: float) -> bool:
+        delta = abs(value - last)
+        if delta != delta:
+            # NaN on either side. Send a change to or from NaN, but not NaN repeatedly.
+            return not (last != last and value != value)
+        if self.absolute is None and self.percent is None:
+            return delta != 0
+        if self.absolute is not None and delta > self.absolute:
+            return True
+        return self.percent is not None and delta > abs(last) * self.percent / 100
+
+
+class DeadbandFilter:
+    """
+    Report-by-exception filter that strips telemetry attributes whose values have not changed
+    (or have changed less than their Deadband) since they were last sent.
+    Pass it as the telemetry_filter ClientSettings to apply it to send_telemetry() and send_telemetry_records().
+
+    Numeric values are compared using their Deadband (or the default one), and all other values
+    (strings, booleans, objects, coordinates) are sent whenever they are not equal to the last sent value.
+    Records of different gateway child devices (unique_id) are tracked separately.
+
+    :param deadbands: (Optional) Deadband for each numeric attribute by name.
+    :param default: (Optional) Deadband for numeric attributes that are not listed in deadbands.
+        By default, numeric values are sent whenever they change.
+    :param max_silence_secs: (Optional) Send an attribute's value anyway if it has not been sent for this long,
+        so that the back end can tell a steady value from a device that has stopped reporting. Zero disables this.
+    """
+
+    def __init__(self, deadbands: Optional[dict[str, Deadband]] = None, default: Optional[Deadband] = None, max_silence_secs: float = 0):
+        if max_silence_secs < 0:
+            raise ValueError("max_silence_secs must not be negative")
+        self.deadbands = deadbands or {}
+        self.default = default or Deadband()
+        self.max_silence_secs = max_silence_secs
+        self._lock = threading.Lock()
+        # last sent value and its monotonic time, by (unique_id, attribute name)
+        self._last_sent: dict[tuple[Optional[str], str], tuple[TelemetryValueType, float]] = {}
+
+    def filter_values(
+            self,
+            values: dict[str, TelemetryValueType],
+            unique_id: Optional[str] = None,
+            commit: bool = True
+    ) -> dict[str, TelemetryValueType]:
+        """
+        Returns the values that should be sent, and records them as sent.
+        With commit=False, the values are not recorded. Call commit_values() once they have actually been sent,
+        so that a value that failed to send is not suppressed next time.
+        """
+        now = time.monotonic()
+        ret = {}
+        with self._lock:
+            for name, value in values.items():
+                last = self._last_sent.get((unique_id, name))
+                if last is None or self._is_changed(name, last[0], value) or (0 < self.max_silence_secs <= now - last[1]):
+                    ret[name] = value
+            if commit:
+                self._commit(ret, unique_id, now)
+        return ret
+
+    def commit_values(self, values: dict[str, TelemetryValueType], unique_id: Optional[str] = None) -> None:
+        """ Records the values returned by filter_values(commit=False) as sent """
+        with self._lock:
+            self._commit(values, unique_id, time.monotonic())
+
+    def filter_records(self, records: list[TelemetryRecord], commit: bool = True) -> list[TelemetryRecord]:
+        """
+        Strips unchanged attributes from the records and omits records that have no attributes left.
+        See filter_values() for the commit parameter. Pass the returned records to commit_records() in that case.
+        """
+        ret = []
+        for r in records:
+            record_values = r.values
+            values = self.filter_values(record_values, r.unique_id, commit)
+            if len(values) == 0:
+                continue
+            if len(values) == len(record_values):
+                ret.append(r)
+            elif type(r) is CompactRecord:
+                ret.append(CompactRecord(values, r.timestamp_ms, r.unique_id, r.tag))
+            else:
+                ret.append(TelemetryRecord(values=values, timestamp=r.timestamp, unique_id=r.unique_id, tag=r.tag))
+        return ret
+
+    def commit_records(self, records: list[TelemetryRecord]) -> None:
+        """ Records the values of the records returned by filter_records(commit=False) as sent """
+        now = time.monotonic()
+        with self._lock:
+            for r in records:
+                self._commit(r.values, r.unique_id, now)
+
+    def reset(self) -> None:
+        """ Forgets the last sent values, so that all attributes will be sent next time """
+        with self._lock:
+            self._last_sent.clear()
+
+    def _commit(self, values: dict[str, TelemetryValueType], unique_id: Optional[str], now: float) -> None:
+        """ Must be called with the lock held """
+        for name, value in values.items():
+            if isinstance(value, (dict, list)):
+                value = copy.deepcopy(value)  # the caller may modify the same object and send it again
+            self._last_sent[(unique_id, name)] = (value, now)
+
+    def _is_changed(self, name: str, last: TelemetryValueType, value: TelemetryValueType) -> bool:
+        if self._is_number(last) and self._is_number(value):
+            return self.deadbands.get(name, self.default).is_exceeded(last, value)
+        return type(last) is not type(value) or last != value
+
+    @classmethod
+    def _is_number(cls, value) -> bool:
+        # bool is a subclass of int, but it should be compared for equality
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
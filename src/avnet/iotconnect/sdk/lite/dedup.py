@@ -0,0 +1,118 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+class C2dDeduplicator:
+    """
+    Remembers recently processed C2D messages, so that a message redelivered by the broker
+    (QoS 1 messages can be delivered more than once, for example after a reconnect) is not processed again.
+
+    Messages are identified by their ACK ID, or by a hash of the payload if they have no ACK ID.
+    An entry is forgotten once it is older than ttl_secs, or when max_entries is reached,
+    in which case the least recently seen entry is evicted first.
+
+    :param max_entries: Maximum number of remembered messages.
+    :param ttl_secs: How long a message is remembered.
+    :param path: (Optional) Path to a JSON file where the remembered messages are stored,
+        so that messages redelivered after an application restart are recognized as well.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_secs: float = 3600, path: Optional[str] = None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be greater than 0")
+        if ttl_secs <= 0:
+            raise ValueError("ttl_secs must be greater than 0")
+        self.max_entries = max_entries
+        self.ttl_secs = ttl_secs
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, float] = OrderedDict()  # key -> expiry (epoch seconds), least recently seen first
+        if path is not None:
+            self._load()
+
+    @classmethod
+    def key_for(cls, ack_id: Optional[str], payload: Union[str, bytes]) -> str:
+        if ack_id is not None and len(ack_id) > 0:
+            return "ack:" + ack_id
+        if isinstance(payload, str):
+            payload = payload.encode()
+        return "sha256:" + hashlib.sha256(payload).hexdigest()
+
+    def check_and_add(self, key: str) -> bool:
+        """ Returns True if the message was seen before. Otherwise, remembers it and returns False. """
+        now = time.time()
+        with self._lock:
+            expiry = self._entries.get(key)
+            if expiry is not None and expiry > now:
+                self._entries.move_to_end(key)
+                return True
+            self._entries[key] = now + self.ttl_secs
+            self._entries.move_to_end(key)
+            self._evict(now)
+            if self.path is not None:
+                self._save()
+            return False
+
+    def discard(self, key: str) -> None:
+        """ Forgets a message, for example one that was added but then dropped before it was processed """
+        with self._lock:
+            if self._entries.pop(key, None) is not None and self.path is not None:
+                self._save()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self.path is not None:
+                self._save()
+
+    def _evict(self, now: float) -> None:
+        """ Must be called with the lock held """
+        expired = [k for k, expiry in self._entries.items() if expiry <= now]
+        for k in expired:
+            del self._entries[k]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+            # stored as a list of [key, expiry] pairs to preserve the order
+            self._entries = OrderedDict((str(k), float(expiry)) for k, expiry in entries)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, TypeError) as ex:
+            logger.warning("Unable to load the C2D message deduplication file %s: %s", self.path, str(ex))
+            self._entries = OrderedDict()
+        self._evict(time.time())
+
+    def _save(self) -> None:
+        """ Must be called with the lock held """
+        # Write to a temporary file and rename it so that a crash cannot leave a truncated file behind
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+            with open(tmp_path, "w") as f:
+                json.dump(list(self._entries.items()), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as ex:
+            logger.warning("Unable to save the C2D message deduplication file %s: %s", self.path, str(ex))
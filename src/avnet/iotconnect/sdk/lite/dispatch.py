@@ -0,0 +1,167 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import logging
+import threading
+from collections import deque
+from typing import Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class OverflowPolicy:
+    """ What to do with a received message when the dispatcher queue is full """
+
+    DROP_NEWEST = "drop_newest"
+    """ Drop the message that was just received """
+
+    DROP_OLDEST = "drop_oldest"
+    """ Drop the oldest message of the same type that is waiting in the queue (or the oldest message overall) """
+
+    @classmethod
+    def is_valid(cls, policy: str) -> bool:
+        return policy in (cls.DROP_NEWEST, cls.DROP_OLDEST)
+
+
+class C2dDispatcher:
+    """
+    Runs the C2D message callbacks on a bounded pool of worker threads,
+    so that slow callbacks do not block the MQTT network loop (keepalives, PUBACKs and outbound telemetry).
+
+    Tasks submitted with the same key (the message type) run one at a time, in the order in which they were received,
+    while tasks with different keys can run in parallel.
+
+    :param max_workers: Maximum number of worker threads. Threads are started as needed.
+    :param max_queue_depth: Maximum number of tasks waiting to be run.
+    :param overflow_policy: One of the OverflowPolicy values.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue_depth: int = 100, overflow_policy: str = OverflowPolicy.DROP_NEWEST):
+        if max_workers < 1:
+            raise ValueError("max_workers must be greater than 0")
+        if max_queue_depth < 1:
+            raise ValueError("max_queue_depth must be greater than 0")
+        if not OverflowPolicy.is_valid(overflow_policy):
+            raise ValueError("overflow_policy must be \"drop_newest\" or \"drop_oldest\"")
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.overflow_policy = overflow_policy
+        self._cond = threading.Condition()
+        self._tasks: dict[Hashable, deque] = {}  # waiting (sequence, func, args, dropped_cb) by key
+        self._ready: deque[Hashable] = deque()  # keys that have waiting tasks and no running task
+        self._running: set[Hashable] = set()
+        self._queued = 0
+        self._sequence = 0
+        self._threads: list[threading.Thread] = []
+        self._idle_threads = 0
+        self._closed = False
+        self.dropped_count = 0
+
+    def submit(self, key: Optional[Hashable], func: Callable, *args, dropped_cb: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Queues the function call. Tasks with a None key are not serialized with any other task.
+        Returns False if the task (or, with the DROP_OLDEST policy, an older task) was dropped.
+
+        :param dropped_cb: (Optional) Called if this task is dropped without being run.
+        """
+        accepted = True
+        dropped_task = None
+        with self._cond:
+            if self._closed:
+                accepted = False
+            elif self._queued >= self.max_queue_depth:
+                self.dropped_count += 1
+                if self.overflow_policy == OverflowPolicy.DROP_OLDEST:
+                    dropped_task = self._drop_oldest(key)
+                accepted = dropped_task is not None
+            if accepted:
+                self._queue(key, func, args, dropped_cb)
+        # called without holding the lock, as the callbacks may do anything
+        if not accepted:
+            return self._dropped(dropped_cb)
+        if dropped_task is not None:
+            return self._dropped(dropped_task[3])
+        return True
+
+    def _queue(self, key: Optional[Hashable], func: Callable, args: tuple, dropped_cb: Optional[Callable[[], None]]) -> None:
+        """ Must be called with the lock held """
+        if key is None:
+            key = object()  # a unique key
+        self._sequence += 1
+        tasks = self._tasks.get(key)
+        if tasks is None:
+            tasks = self._tasks[key] = deque()
+        tasks.append((self._sequence, func, args, dropped_cb))
+        self._queued += 1
+        if len(tasks) == 1 and key not in self._running:
+            self._ready.append(key)
+            if len(self._ready) > self._idle_threads and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._worker, name="iotc-c2d-dispatcher-%d" % len(self._threads), daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+
+    def queue_depth(self) -> int:
+        return self._queued
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """ Stops accepting new tasks and waits for the queued tasks to complete """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    @classmethod
+    def _dropped(cls, dropped_cb: Optional[Callable[[], None]]) -> bool:
+        if dropped_cb is not None:
+            try:
+                dropped_cb()
+            except Exception as ex:
+                logger.exception("Exception in a dropped C2D message callback: %s", str(ex))
+        return False
+
+    def _drop_oldest(self, key: Hashable) -> Optional[tuple]:
+        """ Must be called with the lock held. Returns the dropped task, if any. """
+        tasks = self._tasks.get(key)
+        if tasks is None or len(tasks) == 0:
+            candidates = [k for k, t in self._tasks.items() if len(t) > 0]
+            if len(candidates) == 0:
+                return None  # everything is running
+            key = min(candidates, key=lambda k: self._tasks[k][0][0])
+            tasks = self._tasks[key]
+        task = tasks.popleft()
+        self._queued -= 1
+        if len(tasks) == 0:
+            del self._tasks[key]
+            if key in self._ready:
+                self._ready.remove(key)
+        return task
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while len(self._ready) == 0:
+                    if self._closed:
+                        return
+                    self._idle_threads += 1
+                    self._cond.wait()
+                    self._idle_threads -= 1
+                key = self._ready.popleft()
+                tasks = self._tasks[key]
+                _, func, args, _ = tasks.popleft()
+                if len(tasks) == 0:
+                    del self._tasks[key]
+                self._queued -= 1
+                self._running.add(key)
+            try:
+                func(*args)
+            except Exception as ex:
+                # keep the worker alive regardless of what the callback did
+                logger.exception("Exception in a C2D message callback: %s", str(ex))
+            with self._cond:
+                self._running.discard(key)
+                if key in self._tasks:
+                    self._ready.append(key)
+                    self._cond.notify()
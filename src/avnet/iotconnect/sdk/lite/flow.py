@@ -0,0 +1,149 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from avnet.iotconnect.sdk.sdklib.error import ClientError
+
+logger = logging.getLogger(__name__)
+
+
+class BackpressurePolicy:
+    """ What to do when sending a message while the in-flight window or the queued bytes limit is full """
+
+    BLOCK = "block"
+    """ Wait for the PUBACKs of earlier messages (up to a timeout) and drop the message if the window is still full """
+
+    RAISE = "raise"
+    """ Raise ClientError """
+
+    DROP = "drop"
+    """ Drop the message and return None """
+
+    @classmethod
+    def is_valid(cls, policy: str) -> bool:
+        return policy in (cls.BLOCK, cls.RAISE, cls.DROP)
+
+
+class PublishCompletion:
+    """ Passed to the completion callback once the back end has acknowledged a message """
+
+    def __init__(self, mid: int, size_bytes: int, latency_secs: float, success: bool, reason: str):
+        self.mid = mid
+        self.size_bytes = size_bytes
+        self.latency_secs = latency_secs
+        """ Time between the publish call and the PUBACK """
+        self.success = success
+        self.reason = reason
+
+
+class _InFlightMessage:
+    def __init__(self, size_bytes: int, start_time: float, completion_cb: Optional[Callable[[PublishCompletion], None]]):
+        self.size_bytes = size_bytes
+        self.start_time = start_time
+        self.completion_cb = completion_cb
+
+
+class PublishTracker:
+    """
+    Tracks QoS 1 messages between the publish call and the PUBACK in order to
+    bound the number of in-flight messages and the number of queued bytes, and to report message completion.
+
+    A successful acquire() reserves a slot in the window, so that concurrent senders cannot overfill it.
+    The reservation must then be either turned into a tracked message with track(),
+    or given back with release() if the message was not published.
+
+    The PUBACK of a message can be received before the publish call returns and the message is tracked,
+    so the Client holds back such PUBACKs until the message is tracked. See Client._publish_registered().
+
+    :param max_inflight: Maximum number of messages awaiting a PUBACK.
+    :param max_queued_bytes: Maximum total size of messages awaiting a PUBACK. Zero means unlimited.
+    :param policy: One of the BackpressurePolicy values.
+    :param block_timeout_secs: How long to wait for the window with the BLOCK policy.
+    """
+
+    def __init__(self, max_inflight: int, max_queued_bytes: int = 0, policy: str = BackpressurePolicy.DROP, block_timeout_secs: float = 10):
+        self.max_inflight = max_inflight
+        self.max_queued_bytes = max_queued_bytes
+        self.policy = policy
+        self.block_timeout_secs = block_timeout_secs
+        self._cond = threading.Condition()
+        self._messages: dict[int, _InFlightMessage] = {}
+        self._queued_bytes = 0
+        self._reserved_count = 0
+        self._reserved_bytes = 0
+
+    def inflight_count(self) -> int:
+        return len(self._messages)
+
+    def queued_bytes(self) -> int:
+        return self._queued_bytes
+
+    def acquire(self, size_bytes: int, can_block: bool = True) -> bool:
+        """
+        Waits for space in the window according to the policy and reserves it for the message.
+        Returns False if the message should be dropped, or raises ClientError with the RAISE policy.
+        If the caller cannot block (on the network thread that processes the PUBACKs), the window is exceeded instead.
+        """
+        with self._cond:
+            if self._is_full(size_bytes):
+                if self.policy == BackpressurePolicy.RAISE:
+                    raise ClientError("Unable to send the message. %d messages (%d bytes) are in flight." % (len(self._messages), self._queued_bytes))
+                if self.policy == BackpressurePolicy.DROP:
+                    return False
+                if can_block:
+                    deadline = time.monotonic() + self.block_timeout_secs
+                    while self._is_full(size_bytes):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        self._cond.wait(remaining)
+            self._reserved_count += 1
+            self._reserved_bytes += size_bytes
+            return True
+
+    def release(self, size_bytes: int) -> None:
+        """ Gives back the slot reserved by acquire() for a message that was not published """
+        with self._cond:
+            self._reserved_count -= 1
+            self._reserved_bytes -= size_bytes
+            self._cond.notify_all()
+
+    def is_tracked(self, mid: int) -> bool:
+        with self._cond:
+            return mid in self._messages
+
+    def track(self, mid: int, size_bytes: int, start_time: float, completion_cb: Optional[Callable[[PublishCompletion], None]] = None) -> None:
+        """ Tracks a published message in the slot reserved by acquire() """
+        with self._cond:
+            self._reserved_count -= 1
+            self._reserved_bytes -= size_bytes
+            self._messages[mid] = _InFlightMessage(size_bytes, start_time, completion_cb)
+            self._queued_bytes += size_bytes
+
+    def complete(self, mid: int, success: bool = True, reason: str = "Success") -> Optional[PublishCompletion]:
+        """ Call when a PUBACK is received. Returns None if the message was not tracked. """
+        with self._cond:
+            msg = self._messages.pop(mid, None)
+            if msg is None:
+                return None
+            self._queued_bytes -= msg.size_bytes
+            self._cond.notify_all()
+        completion = PublishCompletion(mid, msg.size_bytes, time.monotonic() - msg.start_time, success, reason)
+        if msg.completion_cb is not None:
+            try:
+                msg.completion_cb(completion)
+            except Exception as ex:
+                logger.exception("Exception in the message completion callback: %s", str(ex))
+        return completion
+
+    def _is_full(self, size_bytes: int) -> bool:
+        count = len(self._messages) + self._reserved_count
+        if count >= self.max_inflight:
+            return True
+        # always let at least one message through, regardless of its size
+        return self.max_queued_bytes > 0 and count > 0 and self._queued_bytes + self._reserved_bytes + size_bytes > self.max_queued_bytes
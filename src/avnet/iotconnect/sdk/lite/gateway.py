@@ -0,0 +1,290 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+# Lets multiple local processes send telemetry through a single Client (a single MQTT connection)
+# over a Unix domain socket. See TelemetryGateway and TelemetryProducer.
+#
+# Each record is sent as a frame:
+#   4 bytes: length of the rest of the frame (big endian)
+#   1 byte: frame type (FRAME_RECORD)
+#   8 bytes: epoch milliseconds timestamp of the record (big endian)
+#   the record, encoded with encode_telemetry_entry() as UTF-8 JSON
+# Records are stamped and encoded by the producer, so the gateway only needs to concatenate them into packets.
+
+import json
+import logging
+import os
+import selectors
+import socket
+import struct
+import threading
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional, Union
+
+from avnet.iotconnect.sdk.sdklib.mqtt import TelemetryRecord, TelemetryValues
+
+from .log import log_rate_limited
+from .record import CompactRecord
+from .telemetry import stamp_and_encode_entries
+
+if TYPE_CHECKING:
+    from .client import Client
+
+logger = logging.getLogger(__name__)
+
+FRAME_RECORD = 1
+
+_FRAME_HEADER = struct.Struct("!IB")
+_RECORD_HEADER = struct.Struct("!IBQ")
+_MAX_FRAME_SIZE = 1024 * 1024
+
+
+def _encode_record_frame(timestamp_ms: int, entry: str) -> bytes:
+    data = entry.encode("utf-8")
+    return _RECORD_HEADER.pack(len(data) + 9, FRAME_RECORD, timestamp_ms) + data
+
+
+class _ProducerConnection:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.buffer = bytearray()
+
+    def parse_frames(self, entries: list[tuple[int, str]]) -> bool:
+        """ Appends the records of the complete frames in the buffer to entries. Returns False on a protocol error. """
+        buffer = self.buffer
+        offset = 0
+        while len(buffer) - offset >= _FRAME_HEADER.size:
+            length, frame_type = _FRAME_HEADER.unpack_from(buffer, offset)
+            if length < 1 or length > _MAX_FRAME_SIZE:
+                logger.warning("Invalid telemetry gateway frame length %d. Closing the producer connection.", length)
+                return False
+            if len(buffer) - offset < 4 + length:
+                break  # incomplete
+            if frame_type != FRAME_RECORD or length < 9:
+                logger.warning("Unsupported telemetry gateway frame type %d. Closing the producer connection.", frame_type)
+                return False
+            timestamp_ms = struct.unpack_from("!Q", buffer, offset + 5)[0]
+            try:
+                entry = bytes(buffer[offset + 13:offset + 4 + length]).decode("utf-8")
+                # a malformed entry would make the whole packet invalid for the records of all producers
+                if not isinstance(json.loads(entry).get("d"), dict):
+                    raise ValueError("no telemetry values")
+            except (ValueError, AttributeError) as ex:
+                log_rate_limited(logger, logging.WARNING, "Dropped an invalid record from a telemetry producer: %s", str(ex))
+            else:
+                entries.append((timestamp_ms, entry))
+            offset += 4 + length
+        del buffer[:offset]
+        return True
+
+
+class TelemetryGateway:
+    """
+    Accepts telemetry records from other local processes over a Unix domain socket and sends them with the client,
+    so that multiple independent processes, like sensor daemons, can report telemetry for the same device
+    over its single MQTT connection. The processes send the records with a TelemetryProducer.
+
+    Records received from all producers are merged and sent in multi-record packets,
+    with the telemetry_qos of the client's ClientSettings. As with Client.send_telemetry_records(),
+    QoS 0 records are sent immediately, without batching, the outbox or flow control.
+    If telemetry batching is enabled in the client's ClientSettings, the records are added to the batches,
+    and the outbox and flow control settings apply as well. With the "block" backpressure policy,
+    the gateway stops reading from the socket while the client waits, and the producers block once the socket buffers are full.
+
+    Usage:
+        gateway = TelemetryGateway(client, "/run/iotc/telemetry.sock")
+        gateway.start()
+        ...
+        gateway.close()
+
+    Available on platforms with Unix domain sockets only.
+
+    :param client: The client that sends the records.
+    :param socket_path: Path of the Unix domain socket. A stale socket file left by a previous run is replaced.
+    :param socket_mode: File permissions of the socket. Only processes with write access can send records.
+    """
+
+    SELECT_TIMEOUT_SECS = 0.5
+
+    def __init__(self, client: "Client", socket_path: str, socket_mode: int = 0o660):
+        self.client = client
+        self.socket_path = socket_path
+        self.socket_mode = socket_mode
+        self.records_received = 0
+        self._server: Optional[socket.socket] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def start(self) -> None:
+        """ Creates the socket and starts accepting records on a background thread """
+        if self._thread is not None:
+            raise RuntimeError("TelemetryGateway is already started")
+        self._remove_stale_socket()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(self.socket_path)
+            os.chmod(self.socket_path, self.socket_mode)
+            server.listen(64)
+            server.setblocking(False)
+        except OSError:
+            server.close()
+            raise
+        self._server = server
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(server, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._run, name="iotc-telemetry-gateway", daemon=True)
+        self._thread.start()
+        logger.info("Telemetry gateway listening on %s", self.socket_path)
+
+    def close(self) -> None:
+        """ Stops accepting records, closes the producer connections and removes the socket file """
+        self._closed = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._server is not None:
+            for key in list(self._selector.get_map().values()):
+                key.fileobj.close()
+            self._selector.close()
+            self._server = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)  # nobody is listening
+            return
+        finally:
+            probe.close()
+        raise OSError("Another telemetry gateway is listening on %s" % self.socket_path)
+
+    def _run(self):
+        while not self._closed:
+            entries: list[tuple[int, str]] = []
+            for key, _ in self._selector.select(TelemetryGateway.SELECT_TIMEOUT_SECS):
+                if key.fileobj is self._server:
+                    self._accept()
+                else:
+                    self._read(key.data, entries)
+            if len(entries) == 0:
+                continue
+            self.records_received += len(entries)
+            try:
+                self._send(entries)
+            except Exception as ex:
+                # keep the gateway alive regardless of what happened
+                logger.exception("Failed to send the records from the telemetry producers: %s", str(ex))
+
+    def _accept(self):
+        try:
+            sock, _ = self._server.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        self._selector.register(sock, selectors.EVENT_READ, _ProducerConnection(sock))
+        logger.debug("Telemetry producer connected")
+
+    def _read(self, connection: _ProducerConnection, entries: list[tuple[int, str]]):
+        try:
+            data = connection.sock.recv(256 * 1024)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if len(data) > 0:
+            connection.buffer += data
+            if connection.parse_frames(entries):
+                return
+        elif len(connection.buffer) > 0:
+            logger.warning("Telemetry producer disconnected in the middle of a record")
+        self._selector.unregister(connection.sock)
+        connection.sock.close()
+        logger.debug("Telemetry producer disconnected")
+
+    def _send(self, entries: list[tuple[int, str]]):
+        qos = self.client.settings.telemetry_qos
+        if qos == 1 and self.client._batcher is not None:
+            self.client._batcher.add_entries(entries)
+        else:
+            self.client._send_telemetry_entries(entries, qos)
+
+
+class TelemetryProducer:
+    """
+    Sends telemetry records to a TelemetryGateway running in another process.
+    It depends only on the standard library and on the encoding modules of this package,
+    so it is cheap to use in any process. For example:
+
+        producer = TelemetryProducer("/run/iotc/telemetry.sock")
+        producer.send_telemetry({'temperature': 22.8})
+
+    Records are stamped with the current time when they are sent, if they have no timestamp,
+    so they retain the time when they were recorded if the gateway buffers them.
+    If the gateway is not running, the records are dropped and False is returned.
+    The producer reconnects on the next send, so the gateway can be restarted independently.
+    A producer must not be used from multiple threads at the same time.
+
+    :param socket_path: Path of the gateway's Unix domain socket.
+    :param timeout_secs: Maximum time to wait when the gateway is not reading the records fast enough.
+    """
+
+    def __init__(self, socket_path: str, timeout_secs: float = 10):
+        self.socket_path = socket_path
+        self.timeout_secs = timeout_secs
+        self._sock: Optional[socket.socket] = None
+
+    def send_telemetry(self, values: TelemetryValues, timestamp: datetime = None) -> bool:
+        """ Sends a single set of telemetry values. See Client.send_telemetry(). """
+        return self.send_telemetry_records([TelemetryRecord(values=values, timestamp=timestamp)])
+
+    def send_telemetry_records(self, records: list[Union[TelemetryRecord, CompactRecord]]) -> bool:
+        """ Sends the records. See Client.send_telemetry_records(). Returns True if the gateway has received them. """
+        entries = stamp_and_encode_entries(records, datetime.now(timezone.utc))
+        data = b"".join(_encode_record_frame(ts, entry) for ts, entry in entries)
+        try:
+            # the gateway may have been restarted since the last send, so reconnect before sending anything
+            if self._sock is not None and self._is_closed_by_gateway():
+                self.close()
+            if self._sock is None:
+                self._connect()
+            self._sock.sendall(data)
+            return True
+        except OSError as ex:
+            # Part of the data may have been received, so it is not sent again, which could duplicate records.
+            # Closing the connection makes the gateway discard an incomplete frame.
+            self.close()
+            log_rate_limited(logger, logging.WARNING, "Unable to send telemetry to the gateway at %s: %s", self.socket_path, str(ex))
+            return False
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _is_closed_by_gateway(self) -> bool:
+        # the gateway never sends anything, so the socket is readable only once the gateway has closed the connection
+        try:
+            return self._sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+        except (BlockingIOError, InterruptedError):
+            return False
+        except OSError:
+            return True
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout_secs)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
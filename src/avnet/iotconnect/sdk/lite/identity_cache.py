@@ -0,0 +1,132 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import json
+import os
+import threading
+import time
+from dataclasses import asdict
+from typing import Optional
+
+from avnet.iotconnect.sdk.sdklib.config import DeviceProperties
+from avnet.iotconnect.sdk.sdklib.dra import DeviceIdentityData
+from avnet.iotconnect.sdk.sdklib.protocol.identity import ProtocolIdentityPJson, ProtocolMetaJson, ProtocolTopicsJson
+from avnet.iotconnect.sdk.sdklib.util import deserialize_dataclass
+
+
+class CachedIdentity:
+    """ Identity data loaded from the cache along with its age """
+
+    def __init__(self, identity: DeviceIdentityData, saved_at: float, is_expired: bool):
+        self.identity = identity
+        self.saved_at = saved_at
+        self.is_expired = is_expired
+
+
+class IdentityCache:
+    """
+    A small persistent JSON file cache for the DRA (Discovery and Identity REST API) data.
+
+    The host, client ID, username and topics returned by the identity REST API rarely change,
+    so the client can use the cached data to connect to MQTT immediately on startup
+    and refresh the data in the background.
+
+    Entries are keyed by platform, CPID, environment and DUID, so that a single cache file
+    can be shared by multiple devices running on the same host.
+
+    :param path: Path to the JSON cache file. The file and its directory will be created if needed.
+    :param ttl_secs: Entries older than this will be reported as expired.
+        Expired entries are still returned so that they can be used as a fallback if the REST API is unavailable.
+    """
+
+    def __init__(self, path: str, ttl_secs: int = 7 * 24 * 3600):
+        self.path = path
+        self.ttl_secs = ttl_secs
+        self._lock = threading.Lock()
+
+    @classmethod
+    def key_for(cls, properties: DeviceProperties) -> str:
+        return "/".join((properties.platform, properties.cpid, properties.env, properties.duid))
+
+    def get(self, properties: DeviceProperties) -> Optional[CachedIdentity]:
+        """ Returns the cached identity for the device or None if there is no (valid) entry """
+        with self._lock:
+            entry = self._read_all().get(IdentityCache.key_for(properties))
+        if entry is None:
+            return None
+        try:
+            identity = IdentityCache._decode_identity(entry["identity"])
+            saved_at = float(entry["saved_at"])
+        except (KeyError, TypeError, ValueError):
+            return None  # treat a malformed entry as a cache miss
+        return CachedIdentity(identity, saved_at, time.time() - saved_at > self.ttl_secs)
+
+    def put(self, properties: DeviceProperties, identity: DeviceIdentityData) -> None:
+        with self._lock:
+            entries = self._read_all()
+            entries[IdentityCache.key_for(properties)] = {
+                "saved_at": time.time(),
+                "identity": IdentityCache._encode_identity(identity)
+            }
+            self._write_all(entries)
+
+    def invalidate(self, properties: DeviceProperties) -> None:
+        with self._lock:
+            entries = self._read_all()
+            if entries.pop(IdentityCache.key_for(properties), None) is not None:
+                self._write_all(entries)
+
+    @classmethod
+    def is_same_identity(cls, a: DeviceIdentityData, b: DeviceIdentityData) -> bool:
+        return cls._encode_identity(a) == cls._encode_identity(b)
+
+    def _read_all(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+            return entries if isinstance(entries, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _write_all(self, entries: dict) -> None:
+        # Write to a temporary file and rename it so that a crash cannot leave a truncated cache file behind
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def _encode_identity(cls, identity: DeviceIdentityData) -> dict:
+        return {
+            "host": identity.host,
+            "client_id": identity.client_id,
+            "username": identity.username,
+            "topics": asdict(identity.topics),
+            "pf": identity.pf,
+            "is_edge_device": identity.is_edge_device,
+            "is_gateway_device": identity.is_gateway_device,
+            "protocol_version": identity.protocol_version
+        }
+
+    @classmethod
+    def _decode_identity(cls, data: dict) -> DeviceIdentityData:
+        identity = DeviceIdentityData(
+            ProtocolIdentityPJson(
+                h=data["host"],
+                id=data["client_id"],
+                un=data["username"],
+                topics=deserialize_dataclass(ProtocolTopicsJson, data["topics"])
+            ),
+            ProtocolMetaJson(
+                pf=data.get("pf"),
+                edge=data.get("is_edge_device"),
+                gtw=data.get("is_gateway_device")
+            )
+        )
+        identity.protocol_version = data.get("protocol_version")
+        return identity
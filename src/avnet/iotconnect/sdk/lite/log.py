@@ -0,0 +1,106 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+# The SDK logs through the standard logging module with loggers under the "avnet.iotconnect.sdk.lite" logger.
+# Connection events are logged at INFO, problems at WARNING or ERROR,
+# and the contents of the sent and received messages at DEBUG.
+
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Optional, TextIO
+
+LOGGER_NAME = "avnet.iotconnect.sdk.lite"
+
+RATE_LIMIT_INTERVAL_SECS = 10.0
+""" Minimum time between two occurrences of the same rate limited message """
+
+_logger = logging.getLogger(LOGGER_NAME)
+
+# standard LogRecord attributes, so that JsonFormatter can tell which ones were passed with "extra"
+_RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__.keys()) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats each log record as a single line JSON object with the time, level, logger name and message,
+    along with any fields passed with the "extra" argument (for example the topic and the size of a sent message).
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: int = logging.INFO, json_format: bool = False, stream: Optional[TextIO] = None) -> None:
+    """
+    Sends the SDK log output to a stream. Use this if your application does not configure logging itself.
+    The SDK messages are then no longer passed to the handlers of the root logger,
+    so they are not output twice if the root logger is configured later.
+
+    :param level: The minimum level of messages to output. Use logging.DEBUG to see the content of the messages.
+    :param json_format: Output each record as a JSON object. See JsonFormatter.
+    :param stream: Defaults to sys.stdout.
+    """
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter("%(message)s"))
+    for h in list(_logger.handlers):
+        _logger.removeHandler(h)
+    _logger.addHandler(handler)
+    _logger.setLevel(level)
+    _logger.propagate = False
+
+
+def enable_verbose_output() -> None:
+    """ Called for ClientSettings(verbose=True). Outputs INFO messages, unless the application has configured logging. """
+    if _logger.handlers or logging.getLogger().handlers:
+        return
+    configure_logging(logging.INFO)
+
+
+class _RateLimiter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: dict[tuple[str, str], list] = {}  # [last logged time, number of suppressed messages]
+
+    def log(self, logger: logging.Logger, level: int, interval_secs: float, msg: str, *args):
+        if not logger.isEnabledFor(level):
+            return
+        key = (logger.name, msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is not None and now - state[0] < interval_secs:
+                state[1] += 1
+                return
+            suppressed = state[1] if state is not None else 0
+            self._state[key] = [now, 0]
+        if suppressed > 0:
+            logger.log(level, msg + " (%d similar messages suppressed)", *args, suppressed)
+        else:
+            logger.log(level, msg, *args)
+
+
+_rate_limiter = _RateLimiter()
+
+
+def log_rate_limited(logger: logging.Logger, level: int, msg: str, *args, interval_secs: float = RATE_LIMIT_INTERVAL_SECS) -> None:
+    """
+    Logs the message at most once per interval. Messages are identified by their format string,
+    so the same message with different arguments is rate limited as well.
+    The number of suppressed messages is appended to the next logged message.
+    """
+    _rate_limiter.log(logger, level, interval_secs, msg, *args)
@@ -0,0 +1,283 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import bisect
+import logging
+import socket
+import threading
+from typing import Callable, Optional, Union
+
+from .log import log_rate_limited
+
+logger = logging.getLogger(__name__)
+
+MetricValue = Union[int, float]
+
+
+class Counter:
+    """ A monotonically increasing value, optionally broken down by the value of a single label """
+
+    TYPE = "counter"
+
+    def __init__(self, name: str, description: str, label_name: Optional[str] = None):
+        self.name = name
+        self.description = description
+        self.label_name = label_name
+        self._lock = threading.Lock()
+        self._values: dict[Optional[str], MetricValue] = {} if label_name is not None else {None: 0}
+
+    def inc(self, amount: MetricValue = 1, label: Optional[str] = None) -> None:
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def values(self) -> dict[Optional[str], MetricValue]:
+        """ Current values by label value. The key is None if the counter has no label. """
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge:
+    """ A value that can go up and down. If a function is provided, the value is obtained from it when read. """
+
+    TYPE = "gauge"
+
+    def __init__(self, name: str, description: str, func: Optional[Callable[[], MetricValue]] = None):
+        self.name = name
+        self.description = description
+        self.label_name = None
+        self._func = func
+        self._value: MetricValue = 0
+
+    def set(self, value: MetricValue) -> None:
+        self._value = value
+
+    def values(self) -> dict[Optional[str], MetricValue]:
+        return {None: self._func() if self._func is not None else self._value}
+
+
+class Histogram:
+    """ Distribution of observed values, such as durations in seconds, counted into cumulative buckets """
+
+    TYPE = "histogram"
+
+    DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, name: str, description: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_name = None
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)  # the last one is the +Inf bucket
+        self._count = 0
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        """ Returns the count, sum and cumulative bucket counts by upper bound """
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self._count, self._sum
+        cumulative = {}
+        running = 0
+        for bound, c in zip(self.buckets + (float('inf'),), counts):
+            running += c
+            cumulative[bound] = running
+        return {"count": count, "sum": total, "buckets": cumulative}
+
+
+class MetricsRegistry:
+    """
+    A collection of metrics that can be read with snapshot() or exported
+    in the Prometheus text exposition format with to_prometheus_text().
+
+    :param const_labels: (Optional) Labels added to every exported metric, like the device unique ID.
+    """
+
+    def __init__(self, const_labels: Optional[dict[str, str]] = None):
+        self.const_labels = const_labels or {}
+        self._lock = threading.Lock()
+        self._metrics: dict[str, Union[Counter, Gauge, Histogram]] = {}
+
+    def counter(self, name: str, description: str, label_name: Optional[str] = None) -> Counter:
+        return self._register(Counter(name, description, label_name))
+
+    def gauge(self, name: str, description: str, func: Optional[Callable[[], MetricValue]] = None) -> Gauge:
+        return self._register(Gauge(name, description, func))
+
+    def histogram(self, name: str, description: str, buckets: tuple = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, buckets))
+
+    def get(self, name: str) -> Optional[Union[Counter, Gauge, Histogram]]:
+        return self._metrics.get(name)
+
+    def snapshot(self) -> dict[str, Union[MetricValue, dict]]:
+        """
+        Returns the current value of every metric by name:
+            - Counters and gauges without a label map to a number.
+            - Counters with a label map to a dictionary of numbers by label value.
+            - Histograms map to a dictionary with "count", "sum" and "buckets" (cumulative counts by upper bound).
+        """
+        ret = {}
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for m in metrics:
+            if isinstance(m, Histogram):
+                ret[m.name] = m.snapshot()
+            elif m.label_name is not None:
+                ret[m.name] = m.values()
+            else:
+                ret[m.name] = m.values()[None]
+        return ret
+
+    def to_prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for m in metrics:
+            lines.append("# HELP %s %s" % (m.name, m.description))
+            lines.append("# TYPE %s %s" % (m.name, m.TYPE))
+            if isinstance(m, Histogram):
+                s = m.snapshot()
+                for bound, count in s["buckets"].items():
+                    le = "+Inf" if bound == float('inf') else repr(float(bound))
+                    lines.append("%s_bucket%s %d" % (m.name, self._format_labels({"le": le}), count))
+                lines.append("%s_sum%s %s" % (m.name, self._format_labels(), repr(float(s["sum"]))))
+                lines.append("%s_count%s %d" % (m.name, self._format_labels(), s["count"]))
+            else:
+                for label, value in sorted(m.values().items(), key=lambda kv: str(kv[0])):
+                    labels = {m.label_name: label} if m.label_name is not None else {}
+                    lines.append("%s%s %s" % (m.name, self._format_labels(labels), repr(value)))
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError("Metric %s is already registered" % metric.name)
+            self._metrics[metric.name] = metric
+        return metric
+
+    def _format_labels(self, labels: Optional[dict[str, str]] = None) -> str:
+        all_labels = dict(self.const_labels)
+        if labels:
+            all_labels.update(labels)
+        if len(all_labels) == 0:
+            return ""
+        escaped = ['%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in all_labels.items()]
+        return "{" + ",".join(escaped) + "}"
+
+
+class StatsdExporter:
+    """
+    Periodically sends the metrics of one or more registries to a StatsD server over UDP.
+
+    Counters are sent as StatsD counters (the increase since the last export), gauges as gauges,
+    and histograms as the increase of their <name>.count and <name>.sum counters.
+    A counter with a label is sent as <name>.<label value>.
+
+    :param registries: The registries to export, for example [client.metrics].
+    :param host: StatsD server host.
+    :param port: StatsD server port.
+    :param prefix: Prefix for all metric names.
+    :param interval_secs: How often to send the metrics.
+    """
+
+    MAX_DATAGRAM_SIZE = 1400
+
+    def __init__(self, registries: list[MetricsRegistry], host: str = "localhost", port: int = 8125, prefix: str = "iotc", interval_secs: float = 10):
+        if interval_secs <= 0:
+            raise ValueError("interval_secs must be greater than 0")
+        self.registries = registries
+        self.address = (host, port)
+        self.prefix = prefix
+        self.interval_secs = interval_secs
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._last_values: dict[str, MetricValue] = {}
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="iotc-statsd-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self) -> None:
+        """ Sends the metrics immediately """
+        lines = []
+        for registry in self.registries:
+            # metrics of different devices would otherwise collide
+            device_prefix = ".".join([self.prefix] + [self._sanitize(v) for v in registry.const_labels.values()])
+            for name, value in registry.snapshot().items():
+                metric = registry.get(name)
+                key = device_prefix + "." + name
+                if isinstance(metric, Histogram):
+                    lines.append(self._counter_line(key + ".count", value["count"]))
+                    lines.append(self._counter_line(key + ".sum", value["sum"]))
+                elif isinstance(metric, Gauge):
+                    lines.append("%s:%s|g" % (key, repr(value)))
+                elif metric.label_name is not None:
+                    for label, label_value in value.items():
+                        lines.append(self._counter_line(key + "." + self._sanitize(label), label_value))
+                else:
+                    lines.append(self._counter_line(key, value))
+        self._send([line for line in lines if line is not None])
+
+    def close(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+        self._socket.close()
+
+    def _counter_line(self, key: str, value: MetricValue) -> Optional[str]:
+        delta = value - self._last_values.get(key, 0)
+        self._last_values[key] = value
+        if delta == 0:
+            return None
+        return "%s:%s|c" % (key, repr(delta))
+
+    def _send(self, lines: list[str]):
+        datagram = ""
+        for line in lines:
+            if len(datagram) > 0 and len(datagram) + len(line) + 1 > StatsdExporter.MAX_DATAGRAM_SIZE:
+                self._socket.sendto(datagram.encode(), self.address)
+                datagram = ""
+            datagram = line if len(datagram) == 0 else datagram + "\n" + line
+        if len(datagram) > 0:
+            self._socket.sendto(datagram.encode(), self.address)
+
+    @classmethod
+    def _sanitize(cls, name) -> str:
+        return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(name))
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_secs):
+            try:
+                self.export()
+            except OSError as ex:
+                log_rate_limited(logger, logging.WARNING, "Failed to send metrics to StatsD: %s", str(ex))
+
+
+class ClientMetrics(MetricsRegistry):
+    """ The metrics collected by each Client, available as Client.metrics """
+
+    def __init__(self, inflight_func: Callable[[], MetricValue], const_labels: Optional[dict[str, str]] = None):
+        super().__init__(const_labels)
+        self.publish_count = self.counter("iotc_publish_total", "Messages published, by message type", "type")
+        self.publish_bytes = self.counter("iotc_publish_bytes_total", "Payload bytes published, by message type", "type")
+        self.publish_dropped = self.counter("iotc_publish_dropped_total", "Telemetry messages dropped by flow control")
+        self.encode_time = self.histogram("iotc_encode_seconds", "Time spent encoding telemetry packets")
+        self.puback_latency = self.histogram("iotc_puback_latency_seconds", "Time between publishing a telemetry message and its PUBACK")
+        self.inflight = self.gauge("iotc_inflight_messages", "Telemetry messages awaiting a PUBACK", inflight_func)
+        self.connect_attempts = self.counter("iotc_connect_attempts_total", "MQTT connection attempts")
+        self.connect_failures = self.counter("iotc_connect_failures_total", "Failed MQTT connection attempts, by ConnectFailure classification", "reason")
+        self.connect_time = self.histogram("iotc_connect_seconds", "Duration of successful MQTT connection attempts")
+        self.tls_handshake_time = self.histogram("iotc_tls_handshake_seconds", "Duration of TLS handshakes")
+        self.tls_session_resumptions = self.counter("iotc_tls_session_resumptions_total", "TLS handshakes that resumed the previous session")
+        self.reconnects = self.counter("iotc_reconnects_total", "Successful MQTT connections after the first one")
+        self.disconnects = self.counter("iotc_disconnects_total", "MQTT disconnections, by reason", "reason")
+        self.c2d_messages = self.counter("iotc_c2d_messages_total", "Received C2D messages, by message type", "type")
+        self.c2d_decode_failures = self.counter("iotc_c2d_decode_failures_total", "Received C2D messages that could not be decoded")
+        self.c2d_duplicates = self.counter("iotc_c2d_duplicates_total", "Redelivered C2D messages that were not processed again, by message type", "type")
+        self.c2d_callback_time = self.histogram("iotc_c2d_callback_seconds", "Execution time of the C2D message callbacks")
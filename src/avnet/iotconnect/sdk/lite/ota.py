@@ -0,0 +1,392 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import hashlib
+import http.client
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from avnet.iotconnect.sdk.sdklib.mqtt import C2dAck, C2dOta
+
+from .client import Client
+
+logger = logging.getLogger(__name__)
+
+PART_FILE_SUFFIX = ".part"
+VALIDATOR_FILE_SUFFIX = ".validator"  # appended to the part file name
+
+
+class OtaDownloadError(RuntimeError):
+    def __init__(self, message: str, file_name: Optional[str] = None):
+        self.msg = message
+        self.file_name = file_name
+        super().__init__(message)
+
+
+class OtaFile:
+    """ A downloaded and verified OTA file """
+
+    def __init__(self, file_name: str, path: str, size: int, digest: str):
+        self.file_name = file_name
+        self.path = path
+        self.size = size
+        self.digest = digest  # hex digest with the downloader's hash_algorithm
+
+
+class _BandwidthLimiter:
+    """ Paces the reads of all downloads so that their combined rate stays under the limit, allowing a one-second burst """
+
+    def __init__(self, bytes_per_sec: int):
+        self.bytes_per_sec = bytes_per_sec
+        self._lock = threading.Lock()
+        self._virtual_time = time.monotonic()
+
+    def consume(self, n: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._virtual_time = max(self._virtual_time, now - 1.0) + n / self.bytes_per_sec
+            delay = self._virtual_time - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _Progress:
+    def __init__(self, client: Optional[Client], msg: C2dOta, interval_secs: float, progress_cb: Optional[Callable[[int, Optional[int]], None]]):
+        self.client = client
+        self.msg = msg
+        self.interval_secs = interval_secs
+        self.progress_cb = progress_cb
+        self._lock = threading.Lock()
+        self._downloaded: dict[int, int] = {}
+        self._totals: dict[int, Optional[int]] = {i: None for i in range(len(msg.urls))}
+        self._last_report = 0.0
+        self._last_message = None
+
+    def set(self, index: int, downloaded: int, total: Optional[int] = None) -> None:
+        with self._lock:
+            self._downloaded[index] = downloaded
+            if total is not None:
+                self._totals[index] = total
+        self.report()
+
+    def add(self, index: int, n: int) -> None:
+        with self._lock:
+            self._downloaded[index] = self._downloaded.get(index, 0) + n
+        self.report()
+
+    def report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_report < self.interval_secs:
+                return
+            self._last_report = now
+            downloaded = sum(self._downloaded.values())
+            total = None if None in self._totals.values() else sum(self._totals.values())
+            if total:
+                message = "Downloading: %d%% (%.1f of %.1f MB)" % (100 * downloaded // total, downloaded / 1e6, total / 1e6)
+            else:
+                message = "Downloading: %.1f MB" % (downloaded / 1e6)
+            if message == self._last_message:
+                return
+            self._last_message = message
+        logger.info("OTA %s", message)
+        if self.progress_cb is not None:
+            self.progress_cb(downloaded, total)
+        if self.client is not None:
+            self.client.send_ota_ack(self.msg, C2dAck.OTA_DOWNLOADING, message)
+
+
+class _FileState:
+    def __init__(self, hash_algorithm: str):
+        self.hash_algorithm = hash_algorithm
+        self.hasher = hashlib.new(hash_algorithm)
+        self.offset = 0
+        self.total: Optional[int] = None
+        self.validator: Optional[str] = None  # the ETag or Last-Modified value used for If-Range
+
+    def reset(self) -> None:
+        self.hasher = hashlib.new(self.hash_algorithm)
+        self.offset = 0
+        self.total = None
+        self.validator = None
+
+
+class OtaDownloader:
+    """
+    Downloads the files of an OTA update, for example:
+
+        downloader = OtaDownloader(client, download_dir="/var/lib/myapp/ota")
+        try:
+            for f in downloader.download(msg):
+                install(f.path)
+        except OtaDownloadError as ex:
+            print("OTA download failed:", ex)
+
+    The files are streamed to disk in chunks, while their hash is computed, so memory use does not depend on the file size.
+    Each file is first written as <file name>.part and renamed once it is complete and verified.
+    A dropped connection is resumed from where it left off with an HTTP Range request, both when retrying
+    and when the same update is downloaded again after the application restarts.
+    To make sure that the file on the server has not changed in the meantime, the ETag or Last-Modified value
+    of the download is stored in <file name>.part.validator. A part file without it is downloaded again from the start.
+    Multiple files are downloaded in parallel, optionally within a combined bandwidth limit.
+
+    The progress is reported to /IOTCONNECT with OTA_DOWNLOADING ACKs. A failed download is reported with OTA_DOWNLOAD_FAILED.
+    OTA_DOWNLOAD_DONE is not sent, because it should be sent by the application once the new firmware is running.
+    See the C2dAck class for best practices.
+
+    :param client: (Optional) The Client used to send the progress ACKs. No ACKs are sent if None.
+    :param download_dir: Directory where the files are stored. It is created if it does not exist.
+    :param max_parallel_downloads: Maximum number of files downloaded at the same time.
+    :param max_bytes_per_sec: Combined bandwidth limit of all downloads, or 0 for no limit.
+    :param chunk_size: Size of the chunks that are read from the network and written to disk.
+    :param max_retries: How many times to resume a file after an error before giving up.
+    :param retry_backoff_secs: Delay before the first retry. It doubles with each retry, up to 30 seconds.
+    :param timeout_secs: Timeout for connecting and for each read.
+    :param hash_algorithm: Any hashlib algorithm. The digest of each file is available in OtaFile.digest.
+    :param progress_interval_secs: Minimum time between two progress ACKs.
+    """
+
+    def __init__(
+            self,
+            client: Optional[Client] = None,
+            download_dir: str = ".",
+            max_parallel_downloads: int = 2,
+            max_bytes_per_sec: int = 0,
+            chunk_size: int = 64 * 1024,
+            max_retries: int = 5,
+            retry_backoff_secs: float = 1.0,
+            timeout_secs: float = 30.0,
+            hash_algorithm: str = "sha256",
+            progress_interval_secs: float = 10.0
+    ):
+        if max_parallel_downloads < 1:
+            raise ValueError("max_parallel_downloads must be greater than 0")
+        if max_bytes_per_sec < 0:
+            raise ValueError("max_bytes_per_sec must not be negative")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be greater than 0")
+        if max_retries < 0:
+            raise ValueError("max_retries must not be negative")
+        if hash_algorithm not in hashlib.algorithms_available:
+            raise ValueError("Unknown hash algorithm \"%s\"" % hash_algorithm)
+        self.client = client
+        self.download_dir = download_dir
+        self.max_parallel_downloads = max_parallel_downloads
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.retry_backoff_secs = retry_backoff_secs
+        self.timeout_secs = timeout_secs
+        self.hash_algorithm = hash_algorithm
+        self.progress_interval_secs = progress_interval_secs
+        self._limiter = _BandwidthLimiter(max_bytes_per_sec) if max_bytes_per_sec > 0 else None
+
+    def download(
+            self,
+            msg: C2dOta,
+            expected_digests: Optional[dict[str, str]] = None,
+            progress_cb: Optional[Callable[[int, Optional[int]], None]] = None
+    ) -> list[OtaFile]:
+        """
+        Downloads all files of the OTA message and returns them in the same order as msg.urls.
+        Raises OtaDownloadError if any of the files could not be downloaded or verified.
+        The other downloads are then stopped, and their partial files are kept so that they can be resumed later.
+
+        :param msg: The message received in the OTA callback.
+        :param expected_digests: (Optional) Hex digests of the files by file name, if they are known to the application.
+        :param progress_cb: (Optional) Called with the number of downloaded bytes and the total number of bytes,
+            if it is known, each time the progress is reported.
+        """
+        if not msg.validate():
+            raise OtaDownloadError("Invalid OTA message")
+        os.makedirs(self.download_dir, exist_ok=True)
+        progress = _Progress(self.client, msg, self.progress_interval_secs, progress_cb)
+        cancel_event = threading.Event()
+        if self.client is not None:
+            self.client.send_ota_ack(msg, C2dAck.OTA_DOWNLOADING, "Download started")
+        workers = min(self.max_parallel_downloads, len(msg.urls))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="iotc-ota-download") as executor:
+            futures = [
+                executor.submit(self._download_file, i, url, (expected_digests or {}).get(url.file_name), progress, cancel_event)
+                for i, url in enumerate(msg.urls)
+            ]
+            wait(futures, return_when=FIRST_EXCEPTION)
+            failed = next((f for f in futures if f.done() and f.exception() is not None), None)
+            if failed is not None:
+                cancel_event.set()
+                ex = failed.exception()
+                if self.client is not None:
+                    self.client.send_ota_ack(msg, C2dAck.OTA_DOWNLOAD_FAILED, getattr(ex, "msg", str(ex)))
+                raise ex
+            files = [f.result() for f in futures]
+        progress.report(force=True)
+        return files
+
+    def _download_file(self, index: int, url: C2dOta.Url, expected_digest: Optional[str], progress: _Progress, cancel_event: threading.Event) -> OtaFile:
+        # never let the file name from the message point outside the download directory
+        file_name = os.path.basename(url.file_name)
+        if file_name in ("", ".", ".."):
+            raise OtaDownloadError("Invalid file name \"%s\"" % url.file_name, url.file_name)
+        if urllib.parse.urlparse(url.url).scheme not in ("http", "https"):
+            raise OtaDownloadError("Unsupported URL for %s" % file_name, file_name)
+        path = os.path.join(self.download_dir, file_name)
+        part_path = path + PART_FILE_SUFFIX
+        state = _FileState(self.hash_algorithm)
+
+        if os.path.exists(part_path):
+            state.validator = self._load_validator(part_path)
+            if state.validator is None:
+                # without a validator, the server cannot tell us whether the file has changed since
+                logger.info("Partial download of %s cannot be verified. Restarting.", file_name)
+                self._remove_part_file(part_path)
+        if os.path.exists(part_path):
+            # resume the download of a previous run
+            with open(part_path, "rb") as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                    state.hasher.update(chunk)
+                    state.offset += len(chunk)
+            logger.info("Resuming the download of %s at %d bytes", file_name, state.offset)
+            progress.set(index, state.offset)
+
+        retries = 0
+        while True:
+            try:
+                self._fetch(index, url.url, part_path, state, progress, cancel_event)
+                break
+            except (OSError, http.client.HTTPException) as ex:
+                if cancel_event.is_set():
+                    raise OtaDownloadError("Download of %s was cancelled" % file_name, file_name)
+                retryable = not isinstance(ex, urllib.error.HTTPError) or ex.code >= 500 or ex.code in (408, 429)
+                if not retryable or retries >= self.max_retries:
+                    raise OtaDownloadError("Download error for %s: %s" % (file_name, str(ex)), file_name)
+                delay = min(self.retry_backoff_secs * (2 ** retries), 30.0)
+                retries += 1
+                logger.warning("Download of %s failed at %d bytes: %s. Retrying in %.1f s...", file_name, state.offset, str(ex), delay)
+                time.sleep(delay)
+
+        digest = state.hasher.hexdigest()
+        if expected_digest is not None and digest.lower() != expected_digest.lower():
+            self._remove_part_file(part_path)  # cannot be resumed
+            raise OtaDownloadError("Integrity check failed for %s" % file_name, file_name)
+        os.replace(part_path, path)
+        self._remove_part_file(part_path)  # only the validator is left
+        logger.info("Downloaded %s (%d bytes, %s %s)", file_name, state.offset, self.hash_algorithm, digest)
+        return OtaFile(file_name=file_name, path=path, size=state.offset, digest=digest)
+
+    def _fetch(self, index: int, url: str, part_path: str, state: _FileState, progress: _Progress, cancel_event: threading.Event) -> None:
+        headers = {}
+        if state.offset > 0:
+            headers["Range"] = "bytes=%d-" % state.offset
+            if state.validator is not None:
+                # if the file has changed since, the server sends all of it
+                headers["If-Range"] = state.validator
+        try:
+            response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout_secs)
+        except urllib.error.HTTPError as ex:
+            if ex.code != 416 or state.offset == 0:
+                raise
+            # The requested range starts at or past the end of the file.
+            # Either the part file is complete or the file on the server is not the one that we have been downloading.
+            total = self._parse_content_range_total(ex.headers.get("Content-Range"))
+            if total == state.offset:
+                state.total = total
+                return
+            logger.warning("Partial download of %s does not match the file on the server. Restarting.", url)
+            state.reset()
+            progress.set(index, 0)
+            raise ConnectionError("Range not satisfiable")
+
+        with response:
+            if state.offset > 0 and response.status == 206:
+                start = self._parse_content_range_start(response.headers.get("Content-Range"))
+                if start != state.offset:
+                    state.reset()
+                    progress.set(index, 0)
+                    raise ConnectionError("Unexpected Content-Range")
+                state.total = self._parse_content_range_total(response.headers.get("Content-Range"))
+                mode = "ab"
+            else:
+                # a new download, or the server does not support ranges or the file has changed
+                state.reset()
+                length = response.headers.get("Content-Length")
+                state.total = int(length) if length is not None else None
+                mode = "wb"
+            validator = self._get_validator(response.headers)
+            if mode == "wb" or validator != state.validator:
+                # stored before the data, so that a part file is never resumed against a different validator
+                self._save_validator(part_path, validator)
+            state.validator = validator
+            progress.set(index, state.offset, state.total)
+
+            with open(part_path, mode) as f:
+                while not cancel_event.is_set():
+                    chunk = response.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    state.hasher.update(chunk)
+                    state.offset += len(chunk)
+                    progress.add(index, len(chunk))
+                    if self._limiter is not None:
+                        self._limiter.consume(len(chunk))
+        if cancel_event.is_set():
+            raise ConnectionError("Cancelled")
+        if state.total is not None and state.offset != state.total:
+            raise ConnectionError("Connection closed after %d of %d bytes" % (state.offset, state.total))
+
+    @classmethod
+    def _load_validator(cls, part_path: str) -> Optional[str]:
+        try:
+            with open(part_path + VALIDATOR_FILE_SUFFIX, "r") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    @classmethod
+    def _save_validator(cls, part_path: str, validator: Optional[str]) -> None:
+        validator_path = part_path + VALIDATOR_FILE_SUFFIX
+        if validator is None:
+            # the server does not provide one, so this download can be resumed only within this run
+            if os.path.exists(validator_path):
+                os.remove(validator_path)
+            return
+        with open(validator_path, "w") as f:
+            f.write(validator)
+
+    @classmethod
+    def _remove_part_file(cls, part_path: str) -> None:
+        for p in (part_path, part_path + VALIDATOR_FILE_SUFFIX):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    @classmethod
+    def _get_validator(cls, headers) -> Optional[str]:
+        etag = headers.get("ETag")
+        if etag is not None and not etag.startswith("W/"):  # weak ETags cannot be used with If-Range
+            return etag
+        return headers.get("Last-Modified")
+
+    @classmethod
+    def _parse_content_range_start(cls, value: Optional[str]) -> Optional[int]:
+        # for example "bytes 100-199/200"
+        try:
+            return int(value.split(" ", 1)[1].split("-", 1)[0])
+        except (AttributeError, IndexError, ValueError):
+            return None
+
+    @classmethod
+    def _parse_content_range_total(cls, value: Optional[str]) -> Optional[int]:
+        # for example "bytes 100-199/200", "bytes */200" or "bytes 100-199/*"
+        try:
+            return int(value.rsplit("/", 1)[1])
+        except (AttributeError, IndexError, ValueError):
+            return None
@@ -0,0 +1,115 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from avnet.iotconnect.sdk.sdklib.mqtt import TelemetryRecord
+
+from .telemetry import stamp_and_encode_entries
+
+
+class OutboxEntry:
+    def __init__(self, row_id: int, timestamp_ms: int, entry: str):
+        self.row_id = row_id
+        self.timestamp_ms = timestamp_ms
+        self.entry = entry
+        """ The record encoded with encode_telemetry_entry() """
+
+
+class TelemetryOutbox:
+    """
+    A durable store-and-forward queue for telemetry records that could not be sent while disconnected.
+
+    Records are stored in an SQLite database in WAL mode, so that they survive application crashes and restarts.
+    Records without a timestamp are stamped when they are stored, so that the back end records
+    the time when the data was captured rather than the time when it was eventually sent.
+
+    :param path: Path to the SQLite database file. The directory will be created if needed.
+    :param max_bytes: Approximate limit for the size of stored records.
+        The oldest records will be evicted when new records would exceed this limit.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024):
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be greater than 0")
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is safe against corruption in WAL mode and avoids an fsync per stored record
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS telemetry ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "ts INTEGER NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "entry TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS telemetry_ts ON telemetry (ts, id)")
+        self._size_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM telemetry").fetchone()[0]
+
+    def put(self, records: list[TelemetryRecord]) -> None:
+        """ Stores the records, evicting the oldest records if the size limit would be exceeded """
+        self.put_entries(stamp_and_encode_entries(records, datetime.now(timezone.utc)))
+
+    def put_entries(self, entries: list[tuple[int, str]]) -> None:
+        """ Stores records already encoded with stamp_and_encode_entries() """
+        rows = [(ts, len(entry), entry) for ts, entry in entries]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT INTO telemetry (ts, size, entry) VALUES (?, ?, ?)", rows)
+                self._size_bytes += sum(row[1] for row in rows)
+                self._evict()
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                self._db.execute("ROLLBACK")
+                self._size_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM telemetry").fetchone()[0]
+                raise
+
+    def peek(self, limit: int) -> list[OutboxEntry]:
+        """ Returns up to limit oldest records (by timestamp) without removing them """
+        with self._lock:
+            rows = self._db.execute("SELECT id, ts, entry FROM telemetry ORDER BY ts, id LIMIT ?", (limit,)).fetchall()
+        return [OutboxEntry(row[0], row[1], row[2]) for row in rows]
+
+    def remove(self, entries: list[OutboxEntry]) -> None:
+        """ Removes records that were previously returned by peek() once they have been sent """
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("DELETE FROM telemetry WHERE id = ?", [(e.row_id,) for e in entries])
+            self._db.execute("COMMIT")
+            self._size_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM telemetry").fetchone()[0]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _evict(self):
+        """ Deletes the oldest records until we are within the size limit. Must be called with the lock held. """
+        while self._size_bytes > self.max_bytes:
+            rows = self._db.execute("SELECT id, size FROM telemetry ORDER BY ts, id LIMIT 100").fetchall()
+            if len(rows) == 0:
+                self._size_bytes = 0
+                return
+            evicted_ids = []
+            for row_id, size in rows:
+                if self._size_bytes <= self.max_bytes:
+                    break
+                evicted_ids.append((row_id,))
+                self._size_bytes -= size
+            self._db.executemany("DELETE FROM telemetry WHERE id = ?", evicted_ids)
@@ -0,0 +1,192 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import logging
+import selectors
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+from paho.mqtt.client import Client as PahoClient, MQTTErrorCode
+
+from .config import DeviceConfig
+from .tls import get_ssl_context
+
+logger = logging.getLogger(__name__)
+
+
+class _IoLoop:
+    """ A single selector thread that services the MQTT sockets of multiple clients """
+
+    MISC_INTERVAL_SECS = 1.0
+
+    def __init__(self, name: str):
+        self._selector = selectors.DefaultSelector()
+        self._ops: deque[tuple[Callable, tuple]] = deque()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._clients = set()  # clients with an open socket. Accessed only on the I/O thread.
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def call(self, func: Callable, *args) -> None:
+        """ Runs the function on the I/O thread. The selector must not be modified from other threads. """
+        self._ops.append((func, args))
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # the loop has already been woken up, or it has been stopped
+
+    def stop(self) -> None:
+        self.call(self._stop)
+        self._thread.join()
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def register(self, client, sock) -> None:
+        self._clients.add(client)
+        self._selector.register(sock, selectors.EVENT_READ, client)
+
+    def unregister(self, client, sock) -> None:
+        self._clients.discard(client)
+        try:
+            # selectors can look up an already closed socket object
+            self._selector.unregister(sock)
+        except (KeyError, ValueError, OSError):
+            pass
+
+    def set_write_interest(self, client, sock, want_write: bool) -> None:
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if want_write else selectors.EVENT_READ
+        try:
+            self._selector.modify(sock, events, client)
+        except (KeyError, ValueError, OSError):
+            pass  # the socket was closed in the meantime
+
+    def _stop(self):
+        self._stopped = True
+
+    def _run(self):
+        next_misc_time = time.monotonic() + _IoLoop.MISC_INTERVAL_SECS
+        while not self._stopped:
+            timeout = max(0.0, next_misc_time - time.monotonic())
+            for key, events in self._selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self._wakeup_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                client = key.data
+                mqtt: PahoClient = client.mqtt
+                try:
+                    if events & selectors.EVENT_READ:
+                        rc = mqtt.loop_read()
+                        # paho reads one packet at a time, and the rest may already be decrypted in the TLS buffer,
+                        # where the selector does not see it, so keep reading like paho's own loop does
+                        sock = mqtt.socket()
+                        while rc == MQTTErrorCode.MQTT_ERR_SUCCESS and hasattr(sock, 'pending') and sock.pending() > 0:
+                            rc = mqtt.loop_read()
+                            sock = mqtt.socket()
+                    if events & selectors.EVENT_WRITE and mqtt.socket() is not None:
+                        mqtt.loop_write()
+                except Exception as ex:
+                    # Do not let one device's callback exception take down all other devices
+                    logger.exception("Exception while processing MQTT events for %s: %s", client.mqtt_config.client_id, str(ex))
+            while len(self._ops) > 0:
+                func, args = self._ops.popleft()
+                try:
+                    func(*args)
+                except Exception as ex:
+                    # an operation for one device must not stop the loop for all other devices
+                    logger.exception("Exception while running an operation on the client pool I/O thread: %s", str(ex))
+            if time.monotonic() >= next_misc_time:
+                for client in list(self._clients):
+                    try:
+                        client.mqtt.loop_misc()
+                    except Exception as ex:
+                        logger.exception("Exception while processing MQTT keepalive for %s: %s", client.mqtt_config.client_id, str(ex))
+                next_misc_time = time.monotonic() + _IoLoop.MISC_INTERVAL_SECS
+
+
+class ClientPool:
+    """
+    Runs the MQTT network I/O of many Client instances on a small fixed number of threads
+    instead of one paho network thread per Client. This is useful for gateways, edge aggregators
+    or test rigs that need to host hundreds of devices in a single process.
+
+    Each Client keeps its own callbacks, but all callbacks for the devices serviced by the same I/O thread
+    are invoked on that thread, so they should return quickly.
+
+    Usage:
+        pool = ClientPool()
+        clients = [Client(config=c, callbacks=Callbacks(command_cb=on_command), pool=pool) for c in device_configs]
+        for c in clients:
+            c.connect()
+
+    :param num_threads: Number of I/O threads. Clients are assigned to threads in a round-robin fashion.
+    """
+
+    def __init__(self, num_threads: int = 1):
+        if num_threads < 1:
+            raise ValueError("num_threads must be greater than 0")
+        self._loops = [_IoLoop("iotc-client-pool-%d" % i) for i in range(num_threads)]
+        self._lock = threading.Lock()
+        self._next_loop = 0
+        self._clients = []
+
+    def get_ssl_context(self, config: DeviceConfig) -> ssl.SSLContext:
+        """ Returns the shared SSLContext for the credentials of this device configuration """
+        return get_ssl_context(config.device_cert_path, config.device_pkey_path, config.server_ca_cert_path)
+
+    def close(self) -> None:
+        """ Disconnects all clients and stops the I/O threads """
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            if client.is_connected():
+                client.disconnect()
+                self._wait_closed(client, client.settings.connect_timeout_secs)
+        for loop in self._loops:
+            loop.stop()
+
+    def _attach(self, client, config: DeviceConfig) -> None:
+        """ Called by the Client constructor """
+        with self._lock:
+            loop = self._loops[self._next_loop]
+            self._next_loop = (self._next_loop + 1) % len(self._loops)
+            self._clients.append(client)
+        client._socket_closed_event = threading.Event()
+        client._socket_closed_event.set()
+        mqtt: PahoClient = client.mqtt
+
+        # paho invokes these callbacks from whichever thread is calling into it, so forward everything to the I/O thread
+        def on_socket_open(mqttc, userdata, sock):
+            client._socket_closed_event.clear()
+            loop.call(loop.register, client, sock)
+
+        def on_socket_close(mqttc, userdata, sock):
+            loop.call(loop.unregister, client, sock)
+            client._socket_closed_event.set()
+
+        mqtt.on_socket_open = on_socket_open
+        mqtt.on_socket_close = on_socket_close
+        mqtt.on_socket_register_write = lambda mqttc, userdata, sock: loop.call(loop.set_write_interest, client, sock, True)
+        mqtt.on_socket_unregister_write = lambda mqttc, userdata, sock: loop.call(loop.set_write_interest, client, sock, False)
+
+    def _is_io_thread(self) -> bool:
+        current = threading.current_thread()
+        return any(loop._thread is current for loop in self._loops)
+
+    @classmethod
+    def _wait_closed(cls, client, timeout: float) -> bool:
+        """ Waits for the I/O thread to finish processing the client's connection after a disconnect """
+        return client._socket_closed_event.wait(timeout)
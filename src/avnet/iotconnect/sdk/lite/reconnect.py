@@ -0,0 +1,134 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import errno
+import random
+import socket
+import ssl
+from typing import Optional
+
+from paho.mqtt.reasoncodes import ReasonCode
+
+
+class ConnectFailure:
+    """ Classification of failed connection attempts. Passed to ReconnectPolicy.next_delay(). """
+
+    DNS = "dns"
+    """ The host name could not be resolved. The network may be down, or the host may have changed. """
+    REFUSED = "refused"
+    """ The TCP connection was refused, reset, or the network was unreachable. """
+    TIMEOUT = "timeout"
+    """ The TCP connection, the TLS handshake or the CONNACK timed out. """
+    TLS = "tls"
+    """ The TLS handshake failed, for example because of an invalid or expired certificate. """
+    AUTH = "auth"
+    """ The broker rejected the connection because of the client ID or credentials. """
+    SERVER = "server"
+    """ The broker rejected the connection because it is unavailable or busy. """
+    LOST = "lost"
+    """ The connection was closed before CONNACK. Brokers do this when they reject the device certificate or policy. """
+
+    REJECTIONS = (TLS, AUTH, LOST)
+    """ Failures that retrying is unlikely to fix. These trip the circuit breaker. """
+    IDENTITY_RELATED = (DNS, TLS, AUTH, LOST)
+    """
+    Failures that can be caused by stale identity data (host or client ID), so the identity is fetched again.
+    AWS IoT Core closes the connection before CONNACK (LOST) when the client ID does not match the policy.
+    """
+
+    # MQTT 5 reason codes (MQTT 3.1.1 CONNACK codes are converted by paho)
+    _AUTH_REASON_CODES = (133, 134, 135, 138, 140)  # client ID not valid, bad username or password, not authorized, banned, bad auth method
+
+    @classmethod
+    def from_exception(cls, ex: BaseException) -> str:
+        if isinstance(ex, socket.gaierror):
+            return cls.DNS
+        if isinstance(ex, ssl.SSLError):
+            return cls.TLS
+        if isinstance(ex, (TimeoutError, socket.timeout)):
+            return cls.TIMEOUT
+        if isinstance(ex, OSError) and ex.errno == errno.ETIMEDOUT:
+            return cls.TIMEOUT
+        return cls.REFUSED
+
+    @classmethod
+    def from_reason_code(cls, reason_code: Optional[ReasonCode]) -> str:
+        """ Classifies a failed CONNACK, or a connection closed before CONNACK if reason_code is None """
+        if reason_code is None:
+            return cls.LOST
+        if reason_code.value in cls._AUTH_REASON_CODES:
+            return cls.AUTH
+        return cls.SERVER
+
+
+class ReconnectPolicy:
+    """
+    Decides how long the client waits between connection attempts.
+
+    Delays grow exponentially with decorrelated jitter: each delay is random between base_delay_secs
+    and three times the previous delay (or three times base_delay_secs for the first retry), up to max_delay_secs. The randomness spreads out the reconnects
+    of a fleet of devices that lost the connection at the same time, so that they do not hit the back end in lockstep.
+
+    After an established connection is lost, the client first reconnects after a short random delay
+    of up to fast_reconnect_max_delay_secs, reusing the identity data and the TLS session of the lost connection.
+    Increase it for large fleets that share the same endpoint.
+
+    TLS and authentication failures are unlikely to be fixed by retrying, so after circuit_breaker_threshold
+    consecutive such failures the circuit breaker opens and the client waits circuit_breaker_cooldown_secs
+    before trying again, instead of loading the back end with doomed attempts.
+
+    The policy keeps no state, so the same instance can be shared by multiple clients.
+    Subclass it and override next_delay() and first_delay() to implement a different strategy.
+
+    :param base_delay_secs: Minimum delay between attempts.
+    :param max_delay_secs: Maximum delay between attempts, unless the circuit breaker is open.
+    :param fast_reconnect_max_delay_secs: Maximum random delay before reconnecting after the connection was lost.
+    :param circuit_breaker_threshold: Number of consecutive TLS or authentication failures that open the circuit breaker.
+    :param circuit_breaker_cooldown_secs: Delay before the next attempt while the circuit breaker is open.
+    """
+
+    def __init__(
+            self,
+            base_delay_secs: float = 1.0,
+            max_delay_secs: float = 15.0,
+            fast_reconnect_max_delay_secs: float = 1.0,
+            circuit_breaker_threshold: int = 5,
+            circuit_breaker_cooldown_secs: float = 300.0
+    ):
+        if base_delay_secs <= 0:
+            raise ValueError("base_delay_secs must be greater than 0")
+        if max_delay_secs < base_delay_secs:
+            raise ValueError("max_delay_secs must not be less than base_delay_secs")
+        if fast_reconnect_max_delay_secs < 0:
+            raise ValueError("fast_reconnect_max_delay_secs must not be negative")
+        if circuit_breaker_threshold < 1:
+            raise ValueError("circuit_breaker_threshold must be greater than 0")
+        if circuit_breaker_cooldown_secs <= 0:
+            raise ValueError("circuit_breaker_cooldown_secs must be greater than 0")
+        self.base_delay_secs = base_delay_secs
+        self.max_delay_secs = max_delay_secs
+        self.fast_reconnect_max_delay_secs = fast_reconnect_max_delay_secs
+        self.circuit_breaker_threshold = circuit_breaker_threshold
+        self.circuit_breaker_cooldown_secs = circuit_breaker_cooldown_secs
+
+    def first_delay(self) -> float:
+        """ Returns the delay before the first attempt to reconnect after an established connection was lost """
+        return random.uniform(0, self.fast_reconnect_max_delay_secs)
+
+    def is_circuit_open(self, consecutive_rejections: int) -> bool:
+        return consecutive_rejections >= self.circuit_breaker_threshold
+
+    def next_delay(self, failure: str, previous_delay_secs: float, consecutive_rejections: int) -> float:
+        """
+        Returns the delay before the next attempt.
+
+        :param failure: The ConnectFailure classification of the failed attempt.
+        :param previous_delay_secs: The delay before the failed attempt. Zero for the first attempt.
+        :param consecutive_rejections: The number of consecutive failures in ConnectFailure.REJECTIONS, including this one.
+        """
+        if failure in ConnectFailure.REJECTIONS and self.is_circuit_open(consecutive_rejections):
+            return random.uniform(self.circuit_breaker_cooldown_secs / 2, self.circuit_breaker_cooldown_secs)
+        # the first retry is jittered as well, otherwise the whole fleet would retry exactly base_delay_secs later
+        upper = max(self.base_delay_secs, previous_delay_secs) * 3
+        return min(self.max_delay_secs, random.uniform(self.base_delay_secs, upper))
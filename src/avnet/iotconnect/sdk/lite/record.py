@@ -0,0 +1,114 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from avnet.iotconnect.sdk.sdklib.mqtt import TelemetryValues
+
+logger = logging.getLogger(__name__)
+
+
+class AnchoredClock:
+    """
+    Wall-clock time in epoch milliseconds, derived from the monotonic clock anchored to the wall clock.
+
+    Timestamps taken from this clock keep their spacing and order when the wall clock is adjusted
+    by a small amount (by NTP slewing or a leap second, for example).
+    A step of the wall clock larger than step_threshold_secs is treated as a correction of the time,
+    like the initial NTP synchronization of a device without a real-time clock, and the clock is re-anchored.
+    The timestamps then follow the corrected wall clock, so they jump backwards if the wall clock was stepped back.
+    resync() re-anchors the clock in the same way.
+
+    :param step_threshold_secs: Wall-clock steps larger than this re-anchor the clock.
+    """
+
+    def __init__(self, step_threshold_secs: float = 1.0):
+        self.step_threshold_ns = int(step_threshold_secs * 1e9)
+        self._anchor = (time.time_ns(), time.monotonic_ns())  # replaced as a whole, so it can be read without a lock
+
+    def time_ms(self) -> int:
+        wall_ns, monotonic_ns = self._anchor
+        now_monotonic_ns = time.monotonic_ns()
+        estimate_ns = wall_ns + now_monotonic_ns - monotonic_ns
+        now_wall_ns = time.time_ns()
+        if abs(now_wall_ns - estimate_ns) > self.step_threshold_ns:
+            logger.info("Wall clock stepped by %.3f s. Re-anchoring the telemetry timestamps.", (now_wall_ns - estimate_ns) / 1e9)
+            self._anchor = (now_wall_ns, now_monotonic_ns)
+            estimate_ns = now_wall_ns
+        return estimate_ns // 1000000
+
+    def resync(self) -> None:
+        """ Re-anchors the clock to the current wall-clock time """
+        self._anchor = (time.time_ns(), time.monotonic_ns())
+
+
+_clock = AnchoredClock()
+
+
+def timestamp_ms_now() -> int:
+    """ Returns the current time in epoch milliseconds from the shared AnchoredClock, for use with CompactRecord """
+    return _clock.time_ms()
+
+
+_MAX_INTERNED_NAMES = 1024
+_interned_names: dict[tuple, tuple] = {}
+
+
+def _intern_names(names: tuple) -> tuple:
+    # records of the same shape share a single tuple of attribute names
+    ret = _interned_names.get(names)
+    if ret is None:
+        if len(_interned_names) >= _MAX_INTERNED_NAMES:
+            return names
+        ret = _interned_names.setdefault(names, names)
+    return ret
+
+
+class CompactRecord:
+    """
+    A memory-efficient alternative to TelemetryRecord, for applications that buffer many records,
+    for example while the device is offline. It can be passed to Client.send_telemetry_records() in place
+    of a TelemetryRecord, and produces the same telemetry packets.
+
+    Instead of a dictionary and a datetime, it holds a tuple of values, a tuple of attribute names shared by all records
+    with the same attributes, and an integer timestamp, which is formatted only when the record is sent.
+    This takes about half the memory of a TelemetryRecord with a timestamp. For example:
+
+        buffer.append(CompactRecord({'temperature': 22.8, 'humidity': 30.4}, timestamp_ms_now()))
+        ...
+        client.send_telemetry_records(buffer)
+
+    :param values: The name-value telemetry pairs. See Client.send_telemetry().
+    :param timestamp_ms: (Optional) Epoch milliseconds timestamp. Use timestamp_ms_now().
+    :param unique_id: (Optional) Unique ID of the child device, for gateway devices.
+    :param tag: (Optional) Tag of the child device, for gateway devices.
+    """
+
+    __slots__ = ("names", "value_tuple", "timestamp_ms", "unique_id", "tag")
+
+    def __init__(self, values: TelemetryValues, timestamp_ms: Optional[int] = None, unique_id: Optional[str] = None, tag: Optional[str] = None):
+        self.names = _intern_names(tuple(values.keys()))
+        self.value_tuple = tuple(values.values())
+        self.timestamp_ms = timestamp_ms
+        self.unique_id = unique_id
+        self.tag = tag
+
+    @property
+    def values(self) -> TelemetryValues:
+        """ The values as a new dictionary """
+        return dict(zip(self.names, self.value_tuple))
+
+    @property
+    def timestamp(self) -> Optional[datetime]:
+        """ The timestamp as a new datetime, for compatibility with TelemetryRecord """
+        if self.timestamp_ms is None:
+            return None
+        secs, ms = divmod(self.timestamp_ms, 1000)
+        return datetime.fromtimestamp(secs, timezone.utc).replace(microsecond=ms * 1000)
+
+    def __repr__(self):
+        return "CompactRecord(values=%r, timestamp_ms=%r, unique_id=%r, tag=%r)" % (self.values, self.timestamp_ms, self.unique_id, self.tag)
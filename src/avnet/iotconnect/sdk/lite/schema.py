@@ -0,0 +1,185 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+# Compiled telemetry encoders for records that always have the same shape.
+# The output is identical to encode_telemetry_records() from the sdklib,
+# but the JSON key fragments are prepared once and each value is encoded with a type-specific function.
+
+import dataclasses
+import json
+import typing
+from datetime import datetime
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable, Union
+
+from avnet.iotconnect.sdk.sdklib.error import DeviceConfigError
+from avnet.iotconnect.sdk.sdklib.util import to_iotconnect_time_str
+
+_encode_json = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def _encode_any(value) -> str:
+    return _encode_json(value)
+
+
+def _encode_number(value) -> str:
+    t = type(value)
+    if t is float:
+        if value != value or value in (float('inf'), float('-inf')):
+            return _encode_json(value)  # NaN and Infinity
+        return float.__repr__(value)
+    if t is int:
+        return int.__repr__(value)
+    return _encode_json(value)
+
+
+def _encode_string(value) -> str:
+    if type(value) is str:
+        return encode_basestring_ascii(value)
+    return _encode_json(value)
+
+
+def _encode_bool(value) -> str:
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    return _encode_json(value)
+
+
+class _Field:
+    def __init__(self, name: str, encoder: Callable[[Any], str]):
+        self.name = name
+        self.fragment = encode_basestring_ascii(name) + ':'
+        self.encoder = encoder
+
+
+class TelemetrySchema:
+    """
+    A telemetry encoder compiled for a fixed set of attributes. Use it instead of the generic encoding
+    when the same shape of data is sent repeatedly. Create it with TelemetrySchema.from_dataclass()
+    or TelemetrySchema.from_device_template() and send data with Client.send_telemetry_schema(). For example:
+
+        schema = TelemetrySchema.from_dataclass(ExampleSensorData)
+        c.send_telemetry_schema(schema, data)
+
+    Values can be passed either as an instance of the dataclass or as a dictionary.
+    Keys that are missing from a dictionary are not sent, and keys that are not in the schema are ignored.
+    Values of unexpected types are encoded with the generic JSON encoder.
+    """
+
+    def __init__(self, fields: list[_Field]):
+        self._fields = fields
+        self._names = [f.name for f in fields]
+
+    @property
+    def attribute_names(self) -> list[str]:
+        return list(self._names)
+
+    @classmethod
+    def from_dataclass(cls, data_class: type) -> 'TelemetrySchema':
+        """ Compiles the schema from the dataclass fields and their type annotations. Nested dataclasses are sent as objects. """
+        if not dataclasses.is_dataclass(data_class):
+            raise ValueError("%s is not a dataclass" % str(data_class))
+        hints = typing.get_type_hints(data_class)
+        fields = []
+        for f in dataclasses.fields(data_class):
+            fields.append(_Field(f.name, cls._encoder_for_type(hints.get(f.name))))
+        return cls(fields)
+
+    @classmethod
+    def from_device_template(cls, template: Union[str, dict]) -> 'TelemetrySchema':
+        """
+        Compiles the schema from the attributes of an /IOTCONNECT device template.
+
+        :param template: Path to the device template JSON file (like files/plitedemo-template.json)
+            exported from /IOTCONNECT, or its already parsed content.
+        """
+        if isinstance(template, str):
+            try:
+                with open(template, "r") as template_file:
+                    template = json.load(template_file)
+            except (OSError, ValueError) as ex:
+                raise DeviceConfigError("Unable to load the device template %s: %s" % (template, str(ex)))
+        attributes = template.get("attributes")
+        if not isinstance(attributes, list):
+            raise DeviceConfigError("The device template has no attributes")
+        return cls(cls._fields_from_template(attributes))
+
+    def encode_values(self, values: Union[dict, Any]) -> str:
+        """ Encodes the values as the JSON object that goes into the "d" field of a telemetry record """
+        parts = []
+        if isinstance(values, dict):
+            for f in self._fields:
+                value = values.get(f.name, _MISSING)
+                if value is not _MISSING:
+                    parts.append(f.fragment + f.encoder(value))
+        else:
+            for f in self._fields:
+                parts.append(f.fragment + f.encoder(getattr(values, f.name)))
+        return '{' + ','.join(parts) + '}'
+
+    def encode_entry(self, values: Union[dict, Any], timestamp: datetime = None, unique_id: str = None, tag: str = None) -> str:
+        """ Same as encode_telemetry_entry() for a TelemetryRecord with these values """
+        entry = '{"d":' + self.encode_values(values)
+        if timestamp is not None:
+            entry += ',"dt":"' + to_iotconnect_time_str(timestamp) + '"'
+        if unique_id is not None:
+            entry += ',"id":' + encode_basestring_ascii(unique_id)
+        if tag is not None:
+            entry += ',"tg":' + encode_basestring_ascii(tag)
+        return entry + '}'
+
+    def encode_packet(self, values: Union[dict, Any], timestamp: datetime = None) -> bytes:
+        """ Encodes a complete single-record telemetry packet, ready to be published """
+        return ('{"d":[' + self.encode_entry(values, timestamp) + ']}').encode('ascii')
+
+    @classmethod
+    def _encoder_for_type(cls, hint) -> Callable[[Any], str]:
+        if hint is None:
+            return _encode_any
+        origin = typing.get_origin(hint)
+        if origin is Union:
+            args = [a for a in typing.get_args(hint) if a is not type(None)]
+            return cls._encoder_for_type(args[0]) if len(args) == 1 else _encode_any
+        if hint is bool:
+            return _encode_bool
+        if hint in (int, float):
+            return _encode_number
+        if hint is str:
+            return _encode_string
+        if dataclasses.is_dataclass(hint):
+            return TelemetrySchema.from_dataclass(hint).encode_values
+        return _encode_any
+
+    @classmethod
+    def _fields_from_template(cls, attributes: list[dict]) -> list[_Field]:
+        fields = []
+        for attribute in attributes:
+            name = attribute.get("name")
+            if not isinstance(name, str):
+                raise DeviceConfigError("Device template attribute has no name")
+            attribute_type = str(attribute.get("type", "")).upper()
+            children = attribute.get("childs")
+            if attribute_type == "OBJECT" and isinstance(children, list):
+                encoder = cls(cls._fields_from_template(children)).encode_values
+            else:
+                encoder = _TEMPLATE_TYPE_ENCODERS.get(attribute_type, _encode_any)
+            fields.append(_Field(name, encoder))
+        return fields
+
+
+_MISSING = object()
+
+_TEMPLATE_TYPE_ENCODERS = {
+    "STRING": _encode_string,
+    "DATE": _encode_string,
+    "DATETIME": _encode_string,
+    "TIME": _encode_string,
+    "DECIMAL": _encode_number,
+    "INTEGER": _encode_number,
+    "LONG": _encode_number,
+    "BIT": _encode_number,
+    "BOOLEAN": _encode_bool,
+}
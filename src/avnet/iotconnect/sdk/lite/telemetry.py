@@ -0,0 +1,104 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+# Helpers for encoding telemetry packets from pre-encoded record entries.
+# The output matches encode_telemetry_records() from the sdklib, but lets us encode each record only once
+# when records need to be stored, counted or split across multiple packets.
+
+import json
+import time
+from dataclasses import replace
+from datetime import datetime
+from typing import Union
+
+from avnet.iotconnect.sdk.sdklib.mqtt import TelemetryRecord
+from avnet.iotconnect.sdk.sdklib.util import to_iotconnect_time_str
+
+from .record import CompactRecord
+
+_last_formatted_second = (None, None)
+
+
+def to_iotconnect_time_str_ms(epoch_ms: int) -> str:
+    """ Same as to_iotconnect_time_str(), but for an epoch milliseconds timestamp """
+    global _last_formatted_second
+    secs, ms = divmod(epoch_ms, 1000)
+    cached_secs, prefix = _last_formatted_second
+    if cached_secs != secs:
+        # consecutive timestamps are usually within the same second, so format the date and time only once
+        prefix = time.strftime('%Y-%m-%dT%H:%M:%S.', time.gmtime(secs))
+        _last_formatted_second = (secs, prefix)
+    return '%s%03dZ' % (prefix, ms)
+
+
+def encode_telemetry_entry(record: Union[TelemetryRecord, CompactRecord]) -> str:
+    """ Encodes a single telemetry record as an entry of the telemetry packet "d" array """
+    entry = {'d': record.values}
+    if type(record) is CompactRecord:
+        if record.timestamp_ms is not None:
+            entry['dt'] = to_iotconnect_time_str_ms(record.timestamp_ms)
+    elif record.timestamp is not None:
+        entry['dt'] = to_iotconnect_time_str(record.timestamp)
+    if record.unique_id is not None:
+        entry['id'] = record.unique_id
+    if record.tag is not None:
+        entry['tg'] = record.tag
+    return json.dumps(entry, separators=(',', ':'))
+
+
+def stamp_and_encode_entries(records: list[Union[TelemetryRecord, CompactRecord]], now: datetime) -> list[tuple[int, str]]:
+    """
+    Encodes records into (epoch milliseconds timestamp, entry) pairs.
+    Records without a timestamp will be stamped with the "now" timestamp, so that they retain the time
+    when they were recorded when they are sent later.
+    """
+    ret = []
+    for r in records:
+        if type(r) is CompactRecord:
+            if r.timestamp_ms is None:
+                r = CompactRecord(r.values, int(now.timestamp() * 1000), r.unique_id, r.tag)
+            ret.append((r.timestamp_ms, encode_telemetry_entry(r)))
+            continue
+        if r.timestamp is None:
+            r = replace(r, timestamp=now)
+        ret.append((int(r.timestamp.timestamp() * 1000), encode_telemetry_entry(r)))
+    return ret
+
+
+def encode_telemetry_packet(entries: list[str]) -> str:
+    """ Combines entries encoded with encode_telemetry_entry() into a telemetry packet """
+    return '{"d":[' + ','.join(entries) + ']}'
+
+
+MAX_PACKET_SIZE = {
+    "aws": 128 * 1024,
+    "az": 256 * 1024
+}
+""" Maximum MQTT message payload size per platform (AWS IoT Core and Azure IoT Hub limits) """
+
+PACKET_OVERHEAD = len(encode_telemetry_packet([]))
+
+
+def split_telemetry_entries(entries: list[str], max_bytes: int) -> list[list[str]]:
+    """
+    Splits encoded entries into groups so that each packet encoded with encode_telemetry_packet()
+    does not exceed max_bytes. An entry that does not fit into a packet on its own will be placed in its own group.
+    """
+    groups = []
+    group = []
+    group_size = PACKET_OVERHEAD
+    for entry in entries:
+        # entries are ASCII-only JSON, so the string length is the same as the encoded byte length.
+        # Add one for the comma separator.
+        entry_size = len(entry) + (1 if len(group) > 0 else 0)
+        if len(group) > 0 and group_size + entry_size > max_bytes:
+            groups.append(group)
+            group = []
+            group_size = PACKET_OVERHEAD
+            entry_size = len(entry)
+        group.append(entry)
+        group_size += entry_size
+    if len(group) > 0:
+        groups.append(group)
+    return groups
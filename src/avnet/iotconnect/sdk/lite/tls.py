@@ -0,0 +1,92 @@
+# SPDX-License-Identifier: MIT
+# Copyright (C) 2024 Avnet
+# Authors: Nikola Markovic <nikola.markovic@avnet.com> et al.
+
+import os
+import ssl
+import threading
+import time
+from typing import Optional
+
+_contexts_lock = threading.Lock()
+_contexts: dict[tuple, ssl.SSLContext] = {}
+
+
+def get_ssl_context(device_cert_path: str, device_pkey_path: str, server_ca_cert_path: Optional[str] = None) -> ssl.SSLContext:
+    """
+    Returns an SSLContext for the credentials, shared by all clients in the process that are using the same files,
+    so that the certificates and keys are loaded and parsed only once.
+    A new context is created if any of the files is modified, so renewed certificates are picked up on the next connect.
+    """
+    paths = (device_cert_path, device_pkey_path, server_ca_cert_path)
+    key = paths + tuple(os.stat(p).st_mtime_ns if p is not None else None for p in paths)
+    with _contexts_lock:
+        context = _contexts.get(key)
+        if context is None:
+            # Same setup as paho's tls_set()
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.load_cert_chain(device_cert_path, device_pkey_path)
+            if server_ca_cert_path is not None:
+                context.load_verify_locations(server_ca_cert_path)
+            else:
+                context.load_default_certs()
+            # drop the contexts of the previous versions of these files
+            for k in [k for k in _contexts.keys() if k[:3] == paths]:
+                del _contexts[k]
+            _contexts[key] = context
+        return context
+
+
+class TlsSessionCache:
+    """
+    Passed to paho in place of the (shared) SSLContext of a single client.
+
+    It offers the TLS session of the previous connection to the server when reconnecting,
+    so that the server can resume it with an abbreviated handshake, skipping the certificate exchange
+    and the public key operations, which dominate the reconnect time on constrained CPUs.
+    The server decides whether the session is resumed. If it is not, a full handshake is done as usual.
+
+    The SSLContext is looked up with get_ssl_context() on every connect, so renewed credentials are used
+    on the next connect without having to recreate the client.
+
+    It also performs and times the TLS handshake. See last_handshake_secs and last_session_reused.
+    """
+
+    def __init__(self, device_cert_path: str, device_pkey_path: str, server_ca_cert_path: Optional[str] = None):
+        self._paths = (device_cert_path, device_pkey_path, server_ca_cert_path)
+        self.context = get_ssl_context(*self._paths)
+        self.check_hostname = self.context.check_hostname  # read by paho
+        self.last_handshake_secs: Optional[float] = None
+        self.last_session_reused = False
+        self._host: Optional[str] = None
+        self._session: Optional[ssl.SSLSession] = None
+
+    def wrap_socket(self, sock, server_hostname: Optional[str] = None, do_handshake_on_connect: bool = True, **kwargs) -> ssl.SSLSocket:
+        context = get_ssl_context(*self._paths)
+        if context is not self.context:
+            # the files were modified. A session can only be resumed with the context that created it.
+            self.context = context
+            self._session = None
+        session = self._session if server_hostname == self._host and self._is_valid(self._session) else None
+        ssl_sock = self.context.wrap_socket(sock, server_hostname=server_hostname, do_handshake_on_connect=False, session=session, **kwargs)
+        # paho calls do_handshake() once this returns, which is then a no-op, so do it here to measure it
+        start = time.perf_counter()
+        ssl_sock.do_handshake()
+        self.last_handshake_secs = time.perf_counter() - start
+        self.last_session_reused = ssl_sock.session_reused
+        self._host = server_hostname
+        return ssl_sock
+
+    def save_session(self, ssl_sock) -> None:
+        """
+        Stores the session of the connected socket for the next connection.
+        With TLS 1.3, the session tickets are sent by the server after the handshake,
+        so this should be called once some data has been received, for example on CONNACK.
+        """
+        session = getattr(ssl_sock, "session", None)
+        if session is not None:
+            self._session = session
+
+    @classmethod
+    def _is_valid(cls, session: Optional[ssl.SSLSession]) -> bool:
+        return session is not None and session.time + session.timeout > time.time()